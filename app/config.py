@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import hashlib
 from typing import Dict
 
 from pydantic_settings import BaseSettings
-from pydantic import field_validator
+from pydantic import BaseModel, field_validator
 
 
 
@@ -15,6 +16,16 @@ TARIFFS: Dict[str, dict] = {
 }
 
 
+class PanelSettings(BaseModel):
+    id: str
+    base_url: str
+    api_key: str
+    public_base_url: str | None = None
+    region: str | None = None
+    weight: int = 1
+    accepts_new_users: bool = True
+
+
 class Settings(BaseSettings):
     telegram_token: str
     telegram_admin_ids: list[int] = []
@@ -28,14 +39,69 @@ class Settings(BaseSettings):
     payment_public_key: str
     payment_webhook_secret: str
     payment_shop_id: str | None = None
+    robokassa_password2: str | None = None
     payment_currency: str = "RUB"
     database_path: str = "./bot.db"
     webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
     webhook_path: str = "/payment/webhook"
+    telegram_mode: str = "polling"
+    telegram_webhook_url: str | None = None
+    telegram_webhook_path: str = "/telegram/webhook"
+    telegram_webhook_secret: str | None = None
     base_subscription_days: int = 30
     referral_bonus_days: int = 7
     traffic_limit_gb: float = 300
     traffic_reset_period: str = "month"
+    marzban_timeout_seconds: float = 15
+    marzban_max_attempts: int = 3
+    marzban_backoff_base_seconds: float = 0.5
+    marzban_backoff_max_seconds: float = 8
+    update_deadline_seconds: float = 12
+    marzban_panels: list[PanelSettings] = []
+    marzban_pool_size: int = 20
+    marzban_node_inbounds: dict[str, list[str]] = {}
+    node_capacity_mbps: float = 1000
+    node_user_estimate_mbps: float = 2
+    node_load_alert_threshold: float = 0.7
+    node_monitor_interval_seconds: int = 60
+    usage_collect_interval_seconds: int = 600
+    usage_hourly_retention_days: int = 7
+    traffic_warning_thresholds: list[int] = [80, 100]
+    job_workers: int = 4
+    job_visibility_timeout_seconds: int = 300
+    payment_max_attempts: int = 5
+    payment_event_sweep_interval_seconds: int = 60
+    referral_bonus_apply_interval_seconds: int = 300
+    tariff_reload_interval_seconds: int = 30
+    reminder_concurrency: int = 8
+    reminder_reload_interval_seconds: int = 300
+    bulk_concurrency: int = 16
+    bulk_panel_rate_per_second: float = 25
+    bulk_progress_interval_seconds: float = 3
+    broadcast_rate_per_second: float = 28
+    outbox_workers: int = 4
+    outbox_rate_per_second: float = 25
+    outbox_per_chat_interval_seconds: float = 1
+    outbox_max_attempts: int = 10
+    alert_dedup_window_seconds: int = 900
+    alert_digest_interval_seconds: int = 300
+    fsm_flush_interval_seconds: float = 1
+    fsm_cache_seconds: float = 5
+    fsm_state_ttl_seconds: int = 86400
+    throttle_rate_per_second: float = 1
+    throttle_burst: float = 3
+    throttle_handler_rates: dict[str, float] = {"show_status": 0.2, "send_guide": 0.5}
+    throttle_reply_ttl_seconds: float = 60
+    callback_answer_budget_seconds: float = 0.3
+    update_workers: int = 32
+    update_queue_limit: int = 1000
+    update_metrics_interval_seconds: float = 60
+    shutdown_timeout_seconds: float = 25
+    leader_lease_seconds: float = 30
+    leader_heartbeat_seconds: float = 10
+    broadcast_concurrency: int = 8
+    broadcast_progress_interval_seconds: float = 5
 
     @field_validator("telegram_admin_ids", mode="before")
     def parse_admin_ids(cls, value: object) -> list[int]:
@@ -57,6 +123,23 @@ class Settings(BaseSettings):
             return [item.strip() for item in value.split(",") if item.strip()]
         return [str(value)]
 
+    @field_validator("traffic_warning_thresholds", mode="before")
+    def parse_traffic_warning_thresholds(cls, value: object) -> list[int]:
+        if value is None or value == "":
+            return []
+        if isinstance(value, list):
+            return sorted(int(item) for item in value)
+        if isinstance(value, str):
+            return sorted(int(item.strip()) for item in value.split(",") if item.strip())
+        return [int(value)]
+
+    @field_validator("telegram_mode", mode="before")
+    def parse_telegram_mode(cls, value: object) -> str:
+        mode = str(value or "polling").strip().lower()
+        if mode not in {"polling", "webhook"}:
+            raise ValueError("telegram_mode must be 'polling' or 'webhook'")
+        return mode
+
     @field_validator("public_base_url", mode="before")
     def parse_public_base_url(cls, value: object) -> str | None:
         if value is None:
@@ -65,6 +148,23 @@ class Settings(BaseSettings):
             return value.strip() or None
         return str(value)
 
+    def telegram_webhook_secret_token(self) -> str:
+        if self.telegram_webhook_secret:
+            return self.telegram_webhook_secret
+        return hashlib.sha256(self.telegram_token.encode()).hexdigest()
+
+    def panel_settings(self) -> list[PanelSettings]:
+        if self.marzban_panels:
+            return list(self.marzban_panels)
+        return [
+            PanelSettings(
+                id="default",
+                base_url=self.marzban_base_url,
+                api_key=self.marzban_api_key,
+                public_base_url=self.public_base_url,
+            )
+        ]
+
     class Config:
         env_file = ".env"
         env_prefix = ""
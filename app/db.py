@@ -33,6 +33,7 @@ class Database:
                 referral_bonus_applied INTEGER DEFAULT 0,
                 reminder_3d_sent INTEGER DEFAULT 0,
                 reminder_1d_sent INTEGER DEFAULT 0,
+                panel_id TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP
             );
 
@@ -67,8 +68,165 @@ class Database:
                 FOREIGN KEY(referrer_id) REFERENCES users(telegram_id)
             );
 
+            CREATE TABLE IF NOT EXISTS traffic_counters (
+                telegram_id INTEGER PRIMARY KEY,
+                used_bytes INTEGER NOT NULL DEFAULT 0,
+                data_limit_bytes INTEGER,
+                panel_status TEXT,
+                warned_percent INTEGER DEFAULT 0,
+                updated_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS traffic_usage (
+                telegram_id INTEGER NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (telegram_id, resolution, bucket)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedup_key TEXT UNIQUE,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TEXT NOT NULL,
+                leased_until TEXT,
+                lease_owner TEXT,
+                last_error TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS referral_bonus_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                referrer_id INTEGER NOT NULL,
+                invitee_id INTEGER NOT NULL UNIQUE,
+                bonus_days INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                applied_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS tariffs (
+                code TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                days INTEGER NOT NULL,
+                price REAL NOT NULL,
+                sort_order INTEGER DEFAULT 0,
+                is_active INTEGER DEFAULT 1,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS bulk_operations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                total INTEGER DEFAULT 0,
+                chat_id INTEGER,
+                message_id INTEGER,
+                created_by INTEGER,
+                owner TEXT,
+                heartbeat_at TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS bulk_operation_items (
+                operation_id INTEGER NOT NULL,
+                telegram_id INTEGER NOT NULL,
+                marzban_username TEXT NOT NULL,
+                panel_id TEXT,
+                base_expires_at TEXT,
+                target_expires_at TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                PRIMARY KEY (operation_id, telegram_id)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                target TEXT NOT NULL,
+                from_chat_id INTEGER NOT NULL,
+                source_message_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                total INTEGER DEFAULT 0,
+                cursor INTEGER DEFAULT 0,
+                delivered INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                progress_chat_id INTEGER,
+                progress_message_id INTEGER,
+                owner TEXT,
+                heartbeat_at TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS payment_events (
+                invoice_id TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                amount_minor INTEGER,
+                status TEXT NOT NULL DEFAULT 'received',
+                received_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                processed_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                storage_key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                updated_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS app_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+                acquired_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS telegram_updates (
+                update_id INTEGER PRIMARY KEY,
+                received_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 1,
+                text TEXT NOT NULL,
+                reply_markup TEXT,
+                idempotency_key TEXT UNIQUE,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TEXT NOT NULL,
+                last_error TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                sent_at TEXT
+            );
+
             CREATE INDEX IF NOT EXISTS idx_payments_user ON payments(telegram_id);
+            CREATE INDEX IF NOT EXISTS idx_referral_ledger_status ON referral_bonus_ledger(status, referrer_id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(status, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS idx_traffic_usage_bucket ON traffic_usage(resolution, bucket);
             CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id);
+            CREATE INDEX IF NOT EXISTS idx_bulk_items_status ON bulk_operation_items(operation_id, status, telegram_id);
+            CREATE INDEX IF NOT EXISTS idx_bulk_operations_status ON bulk_operations(status);
+            CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status);
+            CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS idx_payment_events_status ON payment_events(status);
+            CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at);
             """
         )
         await self._conn.execute(
@@ -79,6 +237,12 @@ class Database:
         )
         await self._ensure_user_columns()
         await self._ensure_payment_columns()
+        await self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_panel ON users(panel_id)"
+        )
+        await self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_expires ON users(subscription_expires_at)"
+        )
         await self._conn.commit()
 
     async def _ensure_user_columns(self) -> None:
@@ -91,6 +255,8 @@ class Database:
                 "referral_bonus_applied": "INTEGER DEFAULT 0",
                 "reminder_3d_sent": "INTEGER DEFAULT 0",
                 "reminder_1d_sent": "INTEGER DEFAULT 0",
+                "expired_notice_sent": "INTEGER DEFAULT 0",
+                "panel_id": "TEXT",
             },
         )
         await self._ensure_columns(
@@ -99,6 +265,8 @@ class Database:
                 "trial_used": "INTEGER DEFAULT 0",
                 "referrer_telegram_id": "INTEGER",
                 "referral_bonus_applied": "INTEGER DEFAULT 0",
+                "unreachable_since": "TEXT",
+                "unreachable_reason": "TEXT",
             },
         )
 
@@ -140,6 +308,34 @@ class Database:
             await cursor.close()
             return rowcount
 
+    async def executemany(self, query: str, rows: list[tuple[Any, ...]]) -> None:
+        assert self._conn is not None
+        if not rows:
+            return
+        async with self._lock:
+            await self._conn.executemany(query, rows)
+            await self._conn.commit()
+
+    async def execute_batch(self, statements: list[tuple[str, tuple[Any, ...]]]) -> None:
+        assert self._conn is not None
+        async with self._lock:
+            try:
+                for query, args in statements:
+                    await self._conn.execute(query, args)
+            except Exception:
+                await self._conn.rollback()
+                raise
+            await self._conn.commit()
+
+    async def execute_returning(self, query: str, *args: Any) -> list[Any]:
+        assert self._conn is not None
+        async with self._lock:
+            cursor = await self._conn.execute(query, args)
+            rows = await cursor.fetchall()
+            await cursor.close()
+            await self._conn.commit()
+            return rows
+
     async def fetchone(self, query: str, *args: Any) -> Any:
         assert self._conn is not None
         async with self._lock:
@@ -10,13 +10,23 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message
 from aiogram.types.input_file import FSInputFile
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import TelegramBadRequest
 
 from app.config import Settings
 from app.keyboards.admin import admin_broadcast_keyboard, admin_panel_keyboard
 from app.repositories.payment_repository import PaymentRepository
 from app.repositories.user_repository import UserRepository
-from app.services.subscription import SubscriptionService
+from app.services.broadcast import BroadcastEngine
+from app.services.bulk import (
+    EXTEND_ACTIVE,
+    OPERATION_TITLES,
+    PURGE_EXPIRED,
+    STATUS_LABELS,
+    TRAFFIC_POLICY,
+    BulkOperationEngine,
+)
+from app.services.payment_jobs import PaymentJobs
+from app.services.tariffs import TariffCatalog
 
 router = Router()
 
@@ -34,10 +44,12 @@ async def _render_stats(user_repo: UserRepository, payment_repo: PaymentReposito
     active_users = await user_repo.count_active_subscriptions(datetime.utcnow().isoformat())
     paid_count = await payment_repo.count_paid_invoices()
     paid_total = await payment_repo.sum_paid_amount()
+    unreachable = await user_repo.count_unreachable()
     return (
         "Админ-панель\n\n"
         f"Пользователей всего: {total_users}\n"
         f"Активных подписок: {active_users}\n"
+        f"Заблокировали бота: {unreachable}\n"
         f"Оплат успешно: {paid_count}\n"
         f"Выручка (в валюте): {paid_total:.2f}"
     )
@@ -82,40 +94,219 @@ async def retry_pending(
     message: Message,
     settings: Settings,
     payment_repo: PaymentRepository,
-    subscription_service: SubscriptionService,
+    payment_jobs: PaymentJobs,
 ) -> None:
     if not _is_admin(message.from_user.id, settings):
         await message.answer("Доступ запрещён.")
         return
-    if hasattr(payment_repo, "list_recoverable"):
-        pending = await payment_repo.list_recoverable()
-    else:
-        pending = []
-        for invoice_id in await payment_repo.list_pending_invoices():
-            invoice = await payment_repo.get_invoice(invoice_id)
-            if invoice:
-                pending.append(invoice)
+    pending = await payment_repo.list_recoverable()
     if not pending:
         await message.answer("Нет платежей для повторной выдачи.")
         return
-    success = 0
-    failed = 0
+    queued = 0
     for invoice in pending:
-        try:
-            user = await subscription_service.process_payment_success(invoice.invoice_id)
-            if user:
-                success += 1
-            else:
-                failed += 1
-        except Exception:
-            failed += 1
+        if await payment_jobs.requeue(invoice.invoice_id):
+            queued += 1
     await message.answer(
-        "Повторная выдача завершена.\n"
-        f"Успешно: {success}\n"
-        f"Ошибок: {failed}"
+        "Платежи поставлены в очередь на выдачу.\n"
+        f"Найдено: {len(pending)}\n"
+        f"Перезапущено: {queued}"
     )
 
 
+@router.message(Command("tariffs"))
+async def list_tariffs(
+    message: Message,
+    settings: Settings,
+    tariff_catalog: TariffCatalog,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    lines = ["Тарифы:"]
+    for code, offer in tariff_catalog.index.offers.items():
+        state = "" if offer.is_active else " (выключен)"
+        lines.append(
+            f"{code}: {offer.tariff.title} — {offer.tariff.price:g} {settings.payment_currency}, "
+            f"{offer.tariff.duration.days} дн.{state}"
+        )
+    lines.append("\nИзменить цену: /set_price <код> <цена>")
+    lines.append("Включить/выключить: /tariff_on <код>, /tariff_off <код>")
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("set_price"))
+async def set_tariff_price(
+    message: Message,
+    settings: Settings,
+    tariff_catalog: TariffCatalog,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    parts = (message.text or "").split()
+    try:
+        code, price = parts[1], float(parts[2].replace(",", "."))
+    except (IndexError, ValueError):
+        await message.answer("Использование: /set_price <код> <цена>")
+        return
+    if price <= 0:
+        await message.answer("Цена должна быть больше 0.")
+        return
+    if not await tariff_catalog.set_price(code, price):
+        await message.answer(f"Тариф {code} не найден.")
+        return
+    await message.answer(f"Цена тарифа {code} обновлена: {price:g} {settings.payment_currency}")
+
+
+@router.message(Command("tariff_on", "tariff_off"))
+async def toggle_tariff(
+    message: Message,
+    settings: Settings,
+    tariff_catalog: TariffCatalog,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    parts = (message.text or "").split()
+    if len(parts) < 2:
+        await message.answer("Использование: /tariff_on <код> или /tariff_off <код>")
+        return
+    code = parts[1]
+    is_active = parts[0].lstrip("/").split("@")[0] == "tariff_on"
+    if not await tariff_catalog.set_active(code, is_active):
+        await message.answer(f"Тариф {code} не найден.")
+        return
+    await message.answer(f"Тариф {code} {'включён' if is_active else 'выключен'}.")
+
+
+def _command_args(message: Message) -> list[str]:
+    return (message.text or "").split()[1:]
+
+
+@router.message(Command("bulk_extend"))
+async def bulk_extend(
+    message: Message,
+    settings: Settings,
+    bulk_engine: BulkOperationEngine,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    args = _command_args(message)
+    try:
+        days = int(args[0])
+    except (IndexError, ValueError):
+        await message.answer("Использование: /bulk_extend <дней> [панель]")
+        return
+    if days <= 0:
+        await message.answer("Количество дней должно быть больше 0.")
+        return
+    params = {"days": days, "panel_id": args[1] if len(args) > 1 else None}
+    await bulk_engine.start(EXTEND_ACTIVE, params, message.chat.id, message.from_user.id)
+
+
+@router.message(Command("bulk_traffic"))
+async def bulk_traffic(
+    message: Message,
+    settings: Settings,
+    bulk_engine: BulkOperationEngine,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    args = _command_args(message)
+    try:
+        traffic_gb = float(args[0].replace(",", "."))
+    except (IndexError, ValueError):
+        await message.answer(
+            "Использование: /bulk_traffic <ГБ> [day|week|month|year|no_reset] [active|all] [панель]"
+        )
+        return
+    params = {
+        "traffic_gb": traffic_gb,
+        "reset_period": args[1] if len(args) > 1 else settings.traffic_reset_period,
+        "segment": args[2] if len(args) > 2 else "active",
+        "panel_id": args[3] if len(args) > 3 else None,
+    }
+    await bulk_engine.start(TRAFFIC_POLICY, params, message.chat.id, message.from_user.id)
+
+
+@router.message(Command("bulk_purge"))
+async def bulk_purge(
+    message: Message,
+    settings: Settings,
+    bulk_engine: BulkOperationEngine,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    args = _command_args(message)
+    try:
+        expired_days = int(args[0])
+    except (IndexError, ValueError):
+        await message.answer("Использование: /bulk_purge <дней после истечения> [панель]")
+        return
+    if expired_days < 7:
+        await message.answer("Удалять можно только пользователей, истёкших не меньше 7 дней назад.")
+        return
+    params = {"expired_days": expired_days, "panel_id": args[1] if len(args) > 1 else None}
+    await bulk_engine.start(PURGE_EXPIRED, params, message.chat.id, message.from_user.id)
+
+
+@router.message(Command("bulk_status"))
+async def bulk_status(
+    message: Message,
+    settings: Settings,
+    bulk_engine: BulkOperationEngine,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    operations = await bulk_engine.repo.list_recent()
+    if not operations:
+        await message.answer("Массовых операций ещё не было.")
+        return
+    lines = ["Массовые операции:"]
+    for operation in operations:
+        lines.append(
+            f"#{operation.id} {OPERATION_TITLES.get(operation.kind, operation.kind)} — "
+            f"{STATUS_LABELS.get(operation.status, operation.status)}, пользователей: {operation.total}"
+        )
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("bulk_pause", "bulk_cancel", "bulk_resume"))
+async def bulk_control(
+    message: Message,
+    settings: Settings,
+    bulk_engine: BulkOperationEngine,
+) -> None:
+    if not _is_admin(message.from_user.id, settings):
+        await message.answer("Доступ запрещён.")
+        return
+    command = (message.text or "").split()[0].lstrip("/").split("@")[0]
+    args = _command_args(message)
+    try:
+        operation_id = int(args[0])
+    except (IndexError, ValueError):
+        await message.answer(f"Использование: /{command} <номер операции>")
+        return
+    if command == "bulk_resume":
+        operation = await bulk_engine.continue_operation(operation_id, retry_failed=True)
+        await message.answer(
+            f"Операция #{operation_id} продолжена." if operation else f"Операцию #{operation_id} нельзя продолжить."
+        )
+        return
+    stopped = (
+        await bulk_engine.pause(operation_id)
+        if command == "bulk_pause"
+        else await bulk_engine.cancel(operation_id)
+    )
+    if not stopped:
+        await message.answer(f"Операция #{operation_id} не выполняется.")
+
+
 @router.callback_query(F.data.in_(["admin:stats", "admin:refresh"]))
 async def admin_refresh(
     callback: CallbackQuery,
@@ -198,36 +389,35 @@ async def admin_broadcast_send(
     message: Message,
     settings: Settings,
     state: FSMContext,
-    user_repo: UserRepository,
+    broadcast_engine: BroadcastEngine,
 ) -> None:
     if not _is_admin(message.from_user.id, settings):
         await message.answer("Доступ запрещён.")
         return
     data = await state.get_data()
     target = data.get("broadcast_target", "all")
-    now_iso = datetime.utcnow().isoformat()
-    if target == "active":
-        user_ids = await user_repo.list_active_subscription_ids(now_iso)
-    elif target == "inactive":
-        user_ids = await user_repo.list_inactive_subscription_ids(now_iso)
-    else:
-        user_ids = await user_repo.list_telegram_ids()
-    success = 0
-    failed = 0
-    for user_id in user_ids:
-        try:
-            await message.copy_to(user_id)
-            success += 1
-        except (TelegramForbiddenError, TelegramBadRequest):
-            failed += 1
     await state.clear()
-    await message.answer(
-        "Рассылка завершена.\n"
-        f"Получателей: {len(user_ids)}\n"
-        f"Доставлено: {success}\n"
-        f"Ошибок: {failed}",
-        reply_markup=admin_panel_keyboard(),
-    )
+    await broadcast_engine.start(target, message.chat.id, message.message_id, message.chat.id)
+
+
+@router.callback_query(F.data.startswith("admin:bc:"))
+async def admin_broadcast_control(
+    callback: CallbackQuery,
+    settings: Settings,
+    broadcast_engine: BroadcastEngine,
+) -> None:
+    if not _is_admin(callback.from_user.id, settings):
+        await callback.answer("Нет доступа.", show_alert=True)
+        return
+    _, _, action, raw_id = callback.data.split(":", maxsplit=3)
+    broadcast_id = int(raw_id)
+    if action == "pause":
+        changed = await broadcast_engine.pause(broadcast_id)
+    elif action == "resume":
+        changed = await broadcast_engine.unpause(broadcast_id)
+    else:
+        changed = await broadcast_engine.cancel(broadcast_id)
+    await callback.answer(None if changed else "Рассылка уже завершена.")
 
 
 @router.callback_query(F.data == "admin:export:paid")
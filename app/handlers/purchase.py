@@ -1,27 +1,27 @@
 from __future__ import annotations
 
 import logging
-from decimal import Decimal, ROUND_HALF_UP
 
 from aiogram import F, Router
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.types import CallbackQuery, LabeledPrice, Message, PreCheckoutQuery
+from aiogram.types import CallbackQuery, Message, PreCheckoutQuery
 
 from app.config import Settings
-from app.keyboards.common import connection_keyboard, tariffs_keyboard
 from app.repositories.payment_repository import PaymentRepository
+from app.services.outbox import PRIORITY_ACCESS, Outbox
+from app.services.payment_jobs import PaymentJobs
 from app.services.payments import PaymentService
-from app.services.subscription import SubscriptionService
+from app.services.tariffs import TariffCatalog
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
 @router.message(F.text == "💳 Купить VPN")
-async def choose_plan(message: Message) -> None:
+async def choose_plan(message: Message, tariff_catalog: TariffCatalog) -> None:
     await message.answer(
         "Выбери срок подписки. Оплата занимает 1–2 минуты.",
-        reply_markup=tariffs_keyboard(),
+        reply_markup=tariff_catalog.keyboard,
     )
 
 
@@ -29,28 +29,31 @@ async def choose_plan(message: Message) -> None:
 async def start_payment(
     callback: CallbackQuery,
     payment_service: PaymentService,
-    subscription_service: SubscriptionService,
+    tariff_catalog: TariffCatalog,
     settings: Settings,
 ) -> None:
     tariff_code = callback.data.split(":", maxsplit=1)[1]
-    tariff = subscription_service.get_tariff(tariff_code)
-    amount_minor_units = _to_minor_units(tariff.price, settings.payment_currency)
-    if amount_minor_units <= 0:
+    offer = tariff_catalog.offer(tariff_code)
+    if not offer or not offer.is_active:
+        await callback.message.answer("Этот тариф больше недоступен. Выбери другой срок.")
+        await callback.answer()
+        return
+    if offer.amount_minor <= 0:
         await callback.message.answer(
             "Не удалось открыть оплату: сумма должна быть больше 0. "
             "Проверь цены в тарифах."
         )
         await callback.answer()
         return
-    invoice = await payment_service.create_invoice(callback.from_user.id, tariff_code, amount_minor_units)
+    invoice = await payment_service.create_invoice(callback.from_user.id, tariff_code, offer.amount_minor)
     try:
         await callback.message.answer_invoice(
             title="VPN подписка",
-            description=f"Тариф: {tariff.title}",
+            description=f"Тариф: {offer.tariff.title}",
             payload=invoice.invoice_id,
             provider_token=settings.payment_provider_key,
             currency=settings.payment_currency,
-            prices=[LabeledPrice(label=tariff.title, amount=invoice.amount_minor)],
+            prices=offer.prices,
         )
     except TelegramBadRequest as exc:
         logger.exception("Failed to create invoice: %s", exc)
@@ -62,13 +65,6 @@ async def start_payment(
     await callback.answer()
 
 
-def _to_minor_units(amount: float, currency: str) -> int:
-    minor_units = {"RUB": 2}
-    exponent = minor_units.get(currency.upper(), 2)
-    value = Decimal(str(amount)).quantize(Decimal(f"1e-{exponent}"), rounding=ROUND_HALF_UP)
-    return int(value * (10**exponent))
-
-
 @router.pre_checkout_query()
 async def handle_pre_checkout(pre_checkout_query: PreCheckoutQuery) -> None:
     await pre_checkout_query.answer(ok=True)
@@ -78,65 +74,28 @@ async def handle_pre_checkout(pre_checkout_query: PreCheckoutQuery) -> None:
 async def handle_successful_payment(
     message: Message,
     payment_repo: PaymentRepository,
-    subscription_service: SubscriptionService,
-    settings: Settings,
+    payment_jobs: PaymentJobs,
+    outbox: Outbox,
 ) -> None:
     payment = message.successful_payment
     invoice_id = payment.invoice_payload
     invoice = await payment_repo.get_invoice(invoice_id)
     if not invoice:
         logger.error("Payment received for unknown invoice: invoice_id=%s", invoice_id)
-        for admin_id in settings.telegram_admin_ids:
-            await message.bot.send_message(
-                admin_id,
-                "⚠️ Оплата получена, но инвойс не найден.\n"
-                f"Invoice: {invoice_id}",
-            )
+        await outbox.notify_admins(
+            "⚠️ Оплата получена, но инвойс не найден.\n"
+            f"Invoice: {invoice_id}",
+            key=f"unknown_invoice:{invoice_id}",
+        )
         await message.answer("Платеж получен, но тариф не найден. Напиши в поддержку.")
         return
-    if invoice.status in {"paid", "completed", "paid_pending", "failed"}:
+    if not await payment_repo.mark_paid(invoice_id):
         logger.info("Duplicate payment notification ignored: invoice_id=%s status=%s", invoice_id, invoice.status)
         return
-    await payment_repo.mark_paid(invoice_id)
-    try:
-        user = await subscription_service.process_payment_success(invoice_id)
-    except Exception as exc:
-        logger.exception("Failed to provision after payment: invoice_id=%s", invoice_id)
-        await payment_repo.mark_paid_pending(invoice_id, str(exc))
-        for admin_id in settings.telegram_admin_ids:
-            await message.bot.send_message(
-                admin_id,
-                "⚠️ Оплата принята, но выдача доступа отложена.\n"
-                f"Invoice: {invoice_id}\n"
-                f"Ошибка: {exc}",
-            )
-        await message.answer(
-            "Оплата подтверждена, но выдача доступа задержана. Мы уже работаем над этим."
-        )
-        return
-    if user and user.subscription_link:
-        await _send_access(message, user.subscription_link)
-        return
-    if user:
-        status = await subscription_service.get_status(user.telegram_id)
-        if status and status.subscription_link:
-            await _send_access(message, status.subscription_link)
-            return
-            
-    await message.answer(
-        "Оплата подтверждена, но ссылка на подписку пока не готова. Напиши в поддержку."
-    )
-
-async def _send_access(message: Message, link: str) -> None:
-    keyboard = connection_keyboard(link)
-    if not keyboard:
-        logger.warning("Access link invalid for connection button: %s", link)
-        await message.answer("ℹ️ Access link is not ready yet.")
-        return
-    await message.answer(
-        "🛡 DagDev VPN\n"
-        "━━━━━━━━━━━━\n"
-        "Ваш VPN готов.\n"
-        "Нажмите кнопку ниже, чтобы подключиться.",
-        reply_markup=keyboard,
+    await outbox.send(
+        message.chat.id,
+        "✅ Оплата получена. Готовим доступ, это займёт несколько секунд.",
+        PRIORITY_ACCESS,
+        key=f"paid:{invoice_id}",
     )
+    await payment_jobs.enqueue(invoice_id)
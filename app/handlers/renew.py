@@ -3,12 +3,12 @@ from __future__ import annotations
 from aiogram import F, Router
 from aiogram.types import CallbackQuery
 
-from app.keyboards.common import tariffs_keyboard
+from app.services.tariffs import TariffCatalog
 
 router = Router()
 
 
 @router.callback_query(F.data == "renew:start")
-async def renew(callback: CallbackQuery) -> None:
-    await callback.message.answer("Выбери срок продления:", reply_markup=tariffs_keyboard())
+async def renew(callback: CallbackQuery, tariff_catalog: TariffCatalog) -> None:
+    await callback.message.answer("Выбери срок продления:", reply_markup=tariff_catalog.keyboard)
     await callback.answer()
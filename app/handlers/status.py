@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+from dataclasses import replace
+from datetime import datetime, timedelta
+import logging
+
 from aiogram import F, Router
-from aiogram.types import CallbackQuery, Message
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
+from app.config import Settings
 from app.keyboards.common import connection_keyboard, main_menu, renew_keyboard
 from app.models.user import User
 from app.repositories.user_repository import UserRepository
 from app.services.subscription import SubscriptionService
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+_refresh_tasks: set[asyncio.Task[None]] = set()
 
 
 @router.message(F.text == "📊 Статус")
@@ -16,23 +26,65 @@ async def show_status(
     message: Message,
     subscription_service: SubscriptionService,
     user_repo: UserRepository,
+    settings: Settings,
     bot_username: str,
-) -> None:
-    user, marzban_user = await subscription_service.get_status_details(message.from_user.id)
+) -> Message | None:
+    user, marzban_user = await subscription_service.get_local_status(message.from_user.id)
     trial_used, _, _ = await user_repo.get_user_meta(message.from_user.id)
     if not user or not user.subscription_expires_at:
         text = "Подписка не активна. Оформи доступ за пару минут."
         if not trial_used:
             text = f"{text}\n\nМожно активировать пробный период."
-        await message.answer(text, reply_markup=renew_keyboard())
-        return
-    text = _format_status_text(user, marzban_user)
+        return await message.answer(text, reply_markup=renew_keyboard())
+    text = _format_status_text(
+        user,
+        marzban_user,
+        subscription_service.recommended_server(user),
+        refreshing=marzban_user is None,
+    )
     keyboard = connection_keyboard(user.subscription_link or "")
     if not keyboard:
         await message.answer("ℹ️ Access link is not ready yet.")
-        await message.answer(text, reply_markup=renew_keyboard())
+        keyboard = renew_keyboard()
+    reply = await message.answer(text, reply_markup=keyboard)
+    if not _needs_refresh(marzban_user, settings):
+        return reply
+    task = asyncio.create_task(_refresh_status(reply, subscription_service, user, text, keyboard))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+    return None
+
+
+def _needs_refresh(marzban_user: dict[str, object] | None, settings: Settings) -> bool:
+    updated_at = marzban_user.get("updated_at") if marzban_user else None
+    if not isinstance(updated_at, datetime):
+        return True
+    return datetime.utcnow() - updated_at > timedelta(seconds=settings.usage_collect_interval_seconds)
+
+
+async def _refresh_status(
+    reply: Message,
+    subscription_service: SubscriptionService,
+    local_user: User,
+    text: str,
+    keyboard: InlineKeyboardMarkup,
+) -> None:
+    try:
+        user, marzban_user = await subscription_service.get_status_details(local_user.telegram_id)
+    except Exception as exc:
+        logger.warning("Status refresh failed: telegram_id=%s error=%s", local_user.telegram_id, exc)
+        user, marzban_user = replace(local_user, is_stale=True), None
+    if not user or not user.subscription_expires_at:
+        return
+    fresh_text = _format_status_text(user, marzban_user, subscription_service.recommended_server(user))
+    fresh_keyboard = connection_keyboard(user.subscription_link or "") or renew_keyboard()
+    if fresh_text == text and fresh_keyboard == keyboard:
         return
-    await message.answer(text, reply_markup=keyboard)
+    try:
+        await reply.edit_text(fresh_text, reply_markup=fresh_keyboard)
+    except TelegramBadRequest as exc:
+        if "message is not modified" not in str(exc):
+            logger.warning("Status refresh edit failed: telegram_id=%s error=%s", local_user.telegram_id, exc)
 
 
 @router.callback_query(F.data == "nav:back")
@@ -41,7 +93,12 @@ async def nav_back(callback: CallbackQuery) -> None:
     await callback.answer()
 
 
-def _format_status_text(user: User, marzban_user: dict[str, object] | None) -> str:
+def _format_status_text(
+    user: User,
+    marzban_user: dict[str, object] | None,
+    recommended_server: str | None = None,
+    refreshing: bool = False,
+) -> str:
     expires_at = user.subscription_expires_at
     traffic_limit_gb = user.traffic_limit_gb
     is_stale = user.is_stale
@@ -72,7 +129,11 @@ def _format_status_text(user: User, marzban_user: dict[str, object] | None) -> s
         traffic_left_label = "—"
 
     extras: list[str] = []
-    if is_stale:
+    if recommended_server:
+        extras.append(f"Рекомендуемый сервер: {recommended_server}")
+    if refreshing:
+        extras.append("🔄 Обновляю данные с сервера…")
+    elif is_stale:
         extras.append("Данные обновятся при следующей синхронизации.")
 
     extras_text = ""
@@ -24,3 +24,18 @@ def admin_broadcast_keyboard() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="✖️ Отмена рассылки", callback_data="admin:cancel_broadcast")],
         ]
     )
+
+
+def broadcast_controls_keyboard(broadcast_id: int, status: str) -> InlineKeyboardMarkup | None:
+    if status == "running":
+        toggle = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"admin:bc:pause:{broadcast_id}")
+    elif status == "paused":
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"admin:bc:resume:{broadcast_id}")
+    else:
+        return None
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [toggle],
+            [InlineKeyboardButton(text="✖️ Остановить рассылку", callback_data=f"admin:bc:cancel:{broadcast_id}")],
+        ]
+    )
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 
-from app.config import TARIFFS
+from app.models.tariff import Tariff
 from app.utils.deeplink import build_happ_deeplink
 
 
@@ -17,10 +17,10 @@ def main_menu() -> ReplyKeyboardMarkup:
     )
 
 
-def tariffs_keyboard() -> InlineKeyboardMarkup:
+def tariffs_keyboard(tariffs: list[Tariff], currency: str = "RUB") -> InlineKeyboardMarkup:
     buttons = [
-        [InlineKeyboardButton(text=f"{plan['title']} — {plan['price']} RUB", callback_data=f"buy:{code}")]
-        for code, plan in TARIFFS.items()
+        [InlineKeyboardButton(text=f"{tariff.title} — {tariff.price:g} {currency}", callback_data=f"buy:{tariff.code}")]
+        for tariff in tariffs
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
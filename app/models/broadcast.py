@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass
+class Broadcast:
+    id: int
+    target: str
+    from_chat_id: int
+    source_message_id: int
+    status: str
+    total: int
+    cursor: int
+    delivered: int
+    failed: int
+    progress_chat_id: int | None
+    progress_message_id: int | None
+
+    @property
+    def processed(self) -> int:
+        return self.delivered + self.failed
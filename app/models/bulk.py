@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+
+@dataclass
+class BulkOperation:
+    id: int
+    kind: str
+    params: dict[str, Any]
+    status: str
+    total: int
+    chat_id: int | None
+    message_id: int | None
+    created_at: datetime | None = None
+
+
+@dataclass
+class BulkItem:
+    telegram_id: int
+    marzban_username: str
+    panel_id: str | None
+    base_expires_at: datetime | None
+    target_expires_at: datetime | None = None
+
+
+@dataclass
+class BulkProgress:
+    total: int
+    succeeded: int = 0
+    failed: int = 0
+    pending: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: dict[str, Any]
+    dedup_key: str | None
+    status: str
+    attempts: int
+    next_attempt_at: datetime
+    last_error: str | None
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass
+class OutboxMessage:
+    id: int
+    chat_id: int
+    priority: int
+    text: str
+    reply_markup: str | None
+    idempotency_key: str | None
+    attempts: int
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass
+class TrafficCounter:
+    telegram_id: int
+    used_bytes: int
+    data_limit_bytes: int | None
+    panel_status: str | None
+    warned_percent: int
+    updated_at: datetime | None
+
+
+@dataclass
+class TrafficAccount:
+    telegram_id: int
+    marzban_username: str
+    panel_id: str | None
+    traffic_limit_gb: float | None
+    subscription_expires_at: datetime | None
@@ -18,3 +18,4 @@ class User:
     referral_bonus_applied: bool = False
     reminder_3d_sent: bool = False
     reminder_1d_sent: bool = False
+    panel_id: str | None = None
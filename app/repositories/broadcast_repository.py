@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from app.db import Database
+from app.models.broadcast import Broadcast
+
+BROADCAST_COLUMNS = (
+    "id, target, from_chat_id, source_message_id, status, total, cursor, delivered, failed, "
+    "progress_chat_id, progress_message_id"
+)
+
+
+class BroadcastRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def create(
+        self,
+        target: str,
+        from_chat_id: int,
+        source_message_id: int,
+        total: int,
+        progress_chat_id: int | None,
+    ) -> Broadcast:
+        rows = await self._db.execute_returning(
+            f"""
+            INSERT INTO broadcasts (target, from_chat_id, source_message_id, total, progress_chat_id)
+            VALUES (?, ?, ?, ?, ?)
+            RETURNING {BROADCAST_COLUMNS}
+            """,
+            target,
+            from_chat_id,
+            source_message_id,
+            total,
+            progress_chat_id,
+        )
+        return self._to_broadcast(rows[0])
+
+    async def get(self, broadcast_id: int) -> Broadcast | None:
+        row = await self._db.fetchone(
+            f"SELECT {BROADCAST_COLUMNS} FROM broadcasts WHERE id = ?",
+            broadcast_id,
+        )
+        return self._to_broadcast(row) if row else None
+
+    async def list_by_status(self, status: str) -> list[Broadcast]:
+        rows = await self._db.fetchall(
+            f"SELECT {BROADCAST_COLUMNS} FROM broadcasts WHERE status = ? ORDER BY id ASC",
+            status,
+        )
+        return [self._to_broadcast(row) for row in rows]
+
+    async def set_progress_message(self, broadcast_id: int, message_id: int) -> None:
+        await self._db.execute(
+            "UPDATE broadcasts SET progress_message_id = ? WHERE id = ?",
+            message_id,
+            broadcast_id,
+        )
+
+    async def checkpoint(self, broadcast_id: int, cursor: int, delivered: int, failed: int) -> None:
+        await self._db.execute(
+            """
+            UPDATE broadcasts
+            SET cursor = ?, delivered = delivered + ?, failed = failed + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            cursor,
+            delivered,
+            failed,
+            broadcast_id,
+        )
+
+    async def set_status(self, broadcast_id: int, status: str, expected: set[str] | None = None) -> bool:
+        finished = status in {"completed", "cancelled"}
+        query = f"""
+            UPDATE broadcasts
+            SET status = ?,
+                updated_at = CURRENT_TIMESTAMP,
+                finished_at = {"CURRENT_TIMESTAMP" if finished else "NULL"}
+            WHERE id = ?
+        """
+        args: list[object] = [status, broadcast_id]
+        if expected:
+            query += f" AND status IN ({', '.join('?' for _ in expected)})"
+            args.extend(sorted(expected))
+        rowcount = await self._db.execute_with_rowcount(query, *args)
+        return rowcount == 1
+
+    async def claim(self, broadcast_id: int, owner: str, stale_before: datetime) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE broadcasts
+            SET owner = ?, heartbeat_at = ?
+            WHERE id = ?
+              AND status = 'running'
+              AND (owner IS NULL OR owner = ? OR heartbeat_at IS NULL OR heartbeat_at < ?)
+            """,
+            owner,
+            datetime.utcnow().isoformat(),
+            broadcast_id,
+            owner,
+            stale_before.isoformat(),
+        )
+        return rowcount == 1
+
+    async def heartbeat(self, broadcast_id: int, owner: str) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE broadcasts
+            SET heartbeat_at = ?
+            WHERE id = ? AND owner = ? AND status = 'running'
+            """,
+            datetime.utcnow().isoformat(),
+            broadcast_id,
+            owner,
+        )
+        return rowcount == 1
+
+    async def release(self, broadcast_id: int, owner: str) -> None:
+        await self._db.execute(
+            "UPDATE broadcasts SET owner = NULL, heartbeat_at = NULL WHERE id = ? AND owner = ?",
+            broadcast_id,
+            owner,
+        )
+
+    def _to_broadcast(self, row: tuple) -> Broadcast:
+        return Broadcast(
+            id=row[0],
+            target=row[1],
+            from_chat_id=row[2],
+            source_message_id=row[3],
+            status=row[4],
+            total=row[5] or 0,
+            cursor=row[6] or 0,
+            delivered=row[7] or 0,
+            failed=row[8] or 0,
+            progress_chat_id=row[9],
+            progress_message_id=row[10],
+        )
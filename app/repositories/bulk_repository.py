@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+from datetime import datetime
+import json
+from typing import Any
+
+from app.db import Database
+from app.models.bulk import BulkItem, BulkOperation, BulkProgress
+
+OPERATION_COLUMNS = "id, kind, params, status, total, chat_id, message_id, created_at"
+
+
+class BulkRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def create_operation(
+        self,
+        kind: str,
+        params: dict[str, Any],
+        chat_id: int | None,
+        created_by: int | None,
+    ) -> BulkOperation:
+        rows = await self._db.execute_returning(
+            f"""
+            INSERT INTO bulk_operations (kind, params, chat_id, created_by)
+            VALUES (?, ?, ?, ?)
+            RETURNING {OPERATION_COLUMNS}
+            """,
+            kind,
+            json.dumps(params),
+            chat_id,
+            created_by,
+        )
+        return self._to_operation(rows[0])
+
+    async def snapshot_users(
+        self,
+        operation_id: int,
+        expires_after: datetime | None = None,
+        expires_before: datetime | None = None,
+        panel_id: str | None = None,
+    ) -> int:
+        conditions = ["subscription_link IS NOT NULL"]
+        args: list[Any] = [operation_id]
+        if expires_after is not None:
+            conditions.append("subscription_expires_at > ?")
+            args.append(expires_after.isoformat())
+        if expires_before is not None:
+            conditions.append("subscription_expires_at < ?")
+            args.append(expires_before.isoformat())
+        if panel_id is not None:
+            conditions.append("panel_id = ?")
+            args.append(panel_id)
+        await self._db.execute(
+            f"""
+            INSERT OR IGNORE INTO bulk_operation_items (
+                operation_id, telegram_id, marzban_username, panel_id, base_expires_at
+            )
+            SELECT ?, telegram_id, marzban_username, panel_id, subscription_expires_at
+            FROM users
+            WHERE {" AND ".join(conditions)}
+            """,
+            *args,
+        )
+        row = await self._db.fetchone(
+            "SELECT COUNT(*) FROM bulk_operation_items WHERE operation_id = ?",
+            operation_id,
+        )
+        total = int(row[0]) if row else 0
+        await self._db.execute(
+            "UPDATE bulk_operations SET total = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            total,
+            operation_id,
+        )
+        return total
+
+    async def get(self, operation_id: int) -> BulkOperation | None:
+        row = await self._db.fetchone(
+            f"SELECT {OPERATION_COLUMNS} FROM bulk_operations WHERE id = ?",
+            operation_id,
+        )
+        return self._to_operation(row) if row else None
+
+    async def list_by_status(self, status: str) -> list[BulkOperation]:
+        rows = await self._db.fetchall(
+            f"SELECT {OPERATION_COLUMNS} FROM bulk_operations WHERE status = ? ORDER BY id ASC",
+            status,
+        )
+        return [self._to_operation(row) for row in rows]
+
+    async def list_recent(self, limit: int = 10) -> list[BulkOperation]:
+        rows = await self._db.fetchall(
+            f"SELECT {OPERATION_COLUMNS} FROM bulk_operations ORDER BY id DESC LIMIT ?",
+            limit,
+        )
+        return [self._to_operation(row) for row in rows]
+
+    async def set_message(self, operation_id: int, message_id: int) -> None:
+        await self._db.execute(
+            "UPDATE bulk_operations SET message_id = ? WHERE id = ?",
+            message_id,
+            operation_id,
+        )
+
+    async def set_status(self, operation_id: int, status: str) -> bool:
+        finished = status in {"completed", "cancelled"}
+        rowcount = await self._db.execute_with_rowcount(
+            f"""
+            UPDATE bulk_operations
+            SET status = ?,
+                updated_at = CURRENT_TIMESTAMP,
+                finished_at = {"CURRENT_TIMESTAMP" if finished else "NULL"}
+            WHERE id = ?
+            """,
+            status,
+            operation_id,
+        )
+        return rowcount == 1
+
+    async def claim(self, operation_id: int, owner: str, stale_before: datetime) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE bulk_operations
+            SET owner = ?, heartbeat_at = ?
+            WHERE id = ?
+              AND status = 'running'
+              AND (owner IS NULL OR owner = ? OR heartbeat_at IS NULL OR heartbeat_at < ?)
+            """,
+            owner,
+            datetime.utcnow().isoformat(),
+            operation_id,
+            owner,
+            stale_before.isoformat(),
+        )
+        return rowcount == 1
+
+    async def heartbeat(self, operation_id: int, owner: str) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE bulk_operations
+            SET heartbeat_at = ?
+            WHERE id = ? AND owner = ? AND status = 'running'
+            """,
+            datetime.utcnow().isoformat(),
+            operation_id,
+            owner,
+        )
+        return rowcount == 1
+
+    async def release(self, operation_id: int, owner: str) -> None:
+        await self._db.execute(
+            "UPDATE bulk_operations SET owner = NULL, heartbeat_at = NULL WHERE id = ? AND owner = ?",
+            operation_id,
+            owner,
+        )
+
+    async def list_pending_items(self, operation_id: int, after: int, limit: int) -> list[BulkItem]:
+        rows = await self._db.fetchall(
+            """
+            SELECT telegram_id, marzban_username, panel_id, base_expires_at, target_expires_at
+            FROM bulk_operation_items
+            WHERE operation_id = ? AND status = 'pending' AND telegram_id > ?
+            ORDER BY telegram_id ASC
+            LIMIT ?
+            """,
+            operation_id,
+            after,
+            limit,
+        )
+        return [
+            BulkItem(
+                telegram_id=row[0],
+                marzban_username=row[1],
+                panel_id=row[2],
+                base_expires_at=datetime.fromisoformat(row[3]) if row[3] else None,
+                target_expires_at=datetime.fromisoformat(row[4]) if row[4] else None,
+            )
+            for row in rows
+        ]
+
+    async def set_item_target(self, operation_id: int, telegram_id: int, target: datetime) -> None:
+        await self._db.execute(
+            """
+            UPDATE bulk_operation_items
+            SET target_expires_at = ?
+            WHERE operation_id = ? AND telegram_id = ?
+            """,
+            target.isoformat(),
+            operation_id,
+            telegram_id,
+        )
+
+    async def finish_item(
+        self,
+        operation_id: int,
+        telegram_id: int,
+        succeeded: bool,
+        error: str | None = None,
+    ) -> None:
+        await self._db.execute(
+            """
+            UPDATE bulk_operation_items
+            SET status = ?, error = ?
+            WHERE operation_id = ? AND telegram_id = ?
+            """,
+            "done" if succeeded else "failed",
+            error,
+            operation_id,
+            telegram_id,
+        )
+
+    async def reset_failed_items(self, operation_id: int) -> int:
+        return await self._db.execute_with_rowcount(
+            """
+            UPDATE bulk_operation_items
+            SET status = 'pending', error = NULL
+            WHERE operation_id = ? AND status = 'failed'
+            """,
+            operation_id,
+        )
+
+    async def progress(self, operation_id: int, total: int) -> BulkProgress:
+        rows = await self._db.fetchall(
+            """
+            SELECT status, COUNT(*)
+            FROM bulk_operation_items
+            WHERE operation_id = ?
+            GROUP BY status
+            """,
+            operation_id,
+        )
+        counts = {row[0]: int(row[1]) for row in rows}
+        errors = await self._db.fetchall(
+            """
+            SELECT error, COUNT(*) AS hits
+            FROM bulk_operation_items
+            WHERE operation_id = ? AND status = 'failed'
+            GROUP BY error
+            ORDER BY hits DESC
+            LIMIT 3
+            """,
+            operation_id,
+        ) if counts.get("failed") else []
+        return BulkProgress(
+            total=total,
+            succeeded=counts.get("done", 0),
+            failed=counts.get("failed", 0),
+            pending=counts.get("pending", 0),
+            errors=[f"{row[1]}× {row[0]}" for row in errors],
+        )
+
+    def _to_operation(self, row: tuple) -> BulkOperation:
+        return BulkOperation(
+            id=row[0],
+            kind=row[1],
+            params=json.loads(row[2]) if row[2] else {},
+            status=row[3],
+            total=row[4] or 0,
+            chat_id=row[5],
+            message_id=row[6],
+            created_at=datetime.fromisoformat(row[7]) if row[7] else None,
+        )
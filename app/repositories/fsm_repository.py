@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from datetime import datetime
+import json
+from typing import Any
+
+from app.db import Database
+
+
+class FSMRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def get(self, key: str) -> tuple[str | None, dict[str, Any], datetime] | None:
+        row = await self._db.fetchone(
+            "SELECT state, data, updated_at FROM fsm_states WHERE storage_key = ?",
+            key,
+        )
+        if not row:
+            return None
+        return row[0], json.loads(row[1]) if row[1] else {}, datetime.fromisoformat(row[2])
+
+    async def save_many(self, rows: list[tuple[str, str | None, dict[str, Any], datetime]]) -> None:
+        await self._db.executemany(
+            """
+            INSERT INTO fsm_states (storage_key, state, data, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(storage_key) DO UPDATE SET
+                state = excluded.state,
+                data = excluded.data,
+                updated_at = excluded.updated_at
+            """,
+            [
+                (key, state, json.dumps(data, ensure_ascii=False), updated_at.isoformat())
+                for key, state, data, updated_at in rows
+            ],
+        )
+
+    async def delete_many(self, keys: list[str]) -> None:
+        await self._db.executemany(
+            "DELETE FROM fsm_states WHERE storage_key = ?",
+            [(key,) for key in keys],
+        )
+
+    async def purge(self, before: datetime) -> int:
+        return await self._db.execute_with_rowcount(
+            "DELETE FROM fsm_states WHERE updated_at < ?",
+            before.isoformat(),
+        )
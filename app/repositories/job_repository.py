@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import json
+from typing import Any
+
+from app.db import Database
+from app.models.job import Job
+
+JOB_COLUMNS = "id, kind, payload, dedup_key, status, attempts, next_attempt_at, last_error"
+
+
+class JobRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: dict[str, Any],
+        dedup_key: str | None = None,
+        run_at: datetime | None = None,
+    ) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            INSERT OR IGNORE INTO jobs (kind, payload, dedup_key, status, next_attempt_at)
+            VALUES (?, ?, ?, 'queued', ?)
+            """,
+            kind,
+            json.dumps(payload),
+            dedup_key,
+            (run_at or datetime.utcnow()).isoformat(),
+        )
+        return rowcount == 1
+
+    async def lease(self, owner: str, limit: int, visibility_timeout: timedelta) -> list[Job]:
+        now = datetime.utcnow()
+        leased_until = (now + visibility_timeout).isoformat()
+        rows = await self._db.execute_returning(
+            f"""
+            UPDATE jobs
+            SET status = 'leased',
+                lease_owner = ?,
+                leased_until = ?,
+                next_attempt_at = ?,
+                attempts = attempts + 1,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM jobs
+                WHERE status IN ('queued', 'leased') AND next_attempt_at <= ?
+                ORDER BY next_attempt_at ASC
+                LIMIT ?
+            )
+            RETURNING {JOB_COLUMNS}
+            """,
+            owner,
+            leased_until,
+            leased_until,
+            now.isoformat(),
+            limit,
+        )
+        return [self._to_job(row) for row in rows]
+
+    async def next_due_at(self) -> datetime | None:
+        row = await self._db.fetchone(
+            "SELECT MIN(next_attempt_at) FROM jobs WHERE status IN ('queued', 'leased')"
+        )
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    async def renew(self, job_id: int, owner: str, attempts: int, visibility_timeout: timedelta) -> bool:
+        leased_until = (datetime.utcnow() + visibility_timeout).isoformat()
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE jobs
+            SET leased_until = ?, next_attempt_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'leased' AND lease_owner = ? AND attempts = ?
+            """,
+            leased_until,
+            leased_until,
+            job_id,
+            owner,
+            attempts,
+        )
+        return rowcount == 1
+
+    async def complete(self, job_id: int, owner: str, attempts: int) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE jobs
+            SET status = 'done', leased_until = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND attempts = ?
+            """,
+            job_id,
+            owner,
+            attempts,
+        )
+        return rowcount == 1
+
+    async def reschedule(
+        self,
+        job_id: int,
+        owner: str,
+        attempts: int,
+        run_at: datetime,
+        last_error: str | None,
+    ) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE jobs
+            SET status = 'queued',
+                next_attempt_at = ?,
+                leased_until = NULL,
+                lease_owner = NULL,
+                last_error = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND attempts = ?
+            """,
+            run_at.isoformat(),
+            last_error,
+            job_id,
+            owner,
+            attempts,
+        )
+        return rowcount == 1
+
+    async def mark_dead(self, job_id: int, owner: str, attempts: int, last_error: str | None) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE jobs
+            SET status = 'dead', leased_until = NULL, last_error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND attempts = ?
+            """,
+            last_error,
+            job_id,
+            owner,
+            attempts,
+        )
+        return rowcount == 1
+
+    async def requeue(self, dedup_key: str) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE jobs
+            SET status = 'queued', attempts = 0, next_attempt_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE dedup_key = ? AND status IN ('dead', 'done')
+            """,
+            datetime.utcnow().isoformat(),
+            dedup_key,
+        )
+        return rowcount == 1
+
+    def _to_job(self, row: tuple) -> Job:
+        return Job(
+            id=row[0],
+            kind=row[1],
+            payload=json.loads(row[2]) if row[2] else {},
+            dedup_key=row[3],
+            status=row[4],
+            attempts=row[5] or 0,
+            next_attempt_at=datetime.fromisoformat(row[6]),
+            last_error=row[7],
+        )
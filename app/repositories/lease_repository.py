@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from app.db import Database
+
+
+class LeaseRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def acquire(self, name: str, owner: str, ttl: timedelta) -> bool:
+        now = datetime.utcnow()
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            INSERT INTO leases (name, owner, expires_at, acquired_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                owner = excluded.owner,
+                expires_at = excluded.expires_at,
+                acquired_at = CASE
+                    WHEN leases.owner = excluded.owner THEN leases.acquired_at
+                    ELSE excluded.acquired_at
+                END
+            WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            """,
+            name,
+            owner,
+            (now + ttl).isoformat(),
+            now.isoformat(),
+            now.isoformat(),
+        )
+        return rowcount == 1
+
+    async def release(self, name: str, owner: str) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            "DELETE FROM leases WHERE name = ? AND owner = ?",
+            name,
+            owner,
+        )
+        return rowcount == 1
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from app.db import Database
+
+
+class MetaRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def get(self, key: str) -> str | None:
+        row = await self._db.fetchone("SELECT value FROM app_meta WHERE key = ?", key)
+        return row[0] if row else None
+
+    async def set(self, key: str, value: str) -> None:
+        await self._db.execute(
+            """
+            INSERT INTO app_meta (key, value, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            """,
+            key,
+            value,
+        )
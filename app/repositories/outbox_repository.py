@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from app.db import Database
+from app.models.outbox import OutboxMessage
+
+OUTBOX_COLUMNS = "id, chat_id, priority, text, reply_markup, idempotency_key, attempts"
+
+
+class OutboxRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def enqueue(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int,
+        reply_markup: str | None = None,
+        idempotency_key: str | None = None,
+    ) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            INSERT OR IGNORE INTO outbox (chat_id, priority, text, reply_markup, idempotency_key, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            chat_id,
+            priority,
+            text,
+            reply_markup,
+            idempotency_key,
+            datetime.utcnow().isoformat(),
+        )
+        return rowcount == 1
+
+    async def lease(self, limit: int, visibility_timeout: timedelta) -> list[OutboxMessage]:
+        now = datetime.utcnow()
+        rows = await self._db.execute_returning(
+            f"""
+            UPDATE outbox
+            SET status = 'leased', next_attempt_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status IN ('queued', 'leased') AND next_attempt_at <= ?
+                ORDER BY priority ASC, next_attempt_at ASC
+                LIMIT ?
+            )
+            RETURNING {OUTBOX_COLUMNS}
+            """,
+            (now + visibility_timeout).isoformat(),
+            now.isoformat(),
+            limit,
+        )
+        messages = [self._to_message(row) for row in rows]
+        messages.sort(key=lambda message: (message.priority, message.id))
+        return messages
+
+    async def renew(self, message_id: int, attempts: int, visibility_timeout: timedelta) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE outbox
+            SET next_attempt_at = ?
+            WHERE id = ? AND status = 'leased' AND attempts = ?
+            """,
+            (datetime.utcnow() + visibility_timeout).isoformat(),
+            message_id,
+            attempts,
+        )
+        return rowcount == 1
+
+    async def next_due_at(self) -> datetime | None:
+        row = await self._db.fetchone(
+            "SELECT MIN(next_attempt_at) FROM outbox WHERE status IN ('queued', 'leased')"
+        )
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    async def mark_sent(self, message_id: int) -> None:
+        await self._db.execute(
+            "UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = ?",
+            message_id,
+        )
+
+    async def reschedule(
+        self,
+        message_id: int,
+        run_at: datetime,
+        error: str | None,
+        count_attempt: bool = True,
+    ) -> None:
+        await self._db.execute(
+            """
+            UPDATE outbox
+            SET status = 'queued', next_attempt_at = ?, last_error = ?, attempts = attempts - ?
+            WHERE id = ?
+            """,
+            run_at.isoformat(),
+            error,
+            0 if count_attempt else 1,
+            message_id,
+        )
+
+    async def mark_dead(self, message_id: int, error: str) -> None:
+        await self._db.execute(
+            "UPDATE outbox SET status = 'dead', last_error = ? WHERE id = ?",
+            error,
+            message_id,
+        )
+
+    async def purge_sent(self, before: datetime) -> int:
+        return await self._db.execute_with_rowcount(
+            "DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+            before.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+
+    def _to_message(self, row: tuple) -> OutboxMessage:
+        return OutboxMessage(
+            id=row[0],
+            chat_id=row[1],
+            priority=row[2],
+            text=row[3],
+            reply_markup=row[4],
+            idempotency_key=row[5],
+            attempts=row[6] or 0,
+        )
@@ -41,16 +41,52 @@ class PaymentRepository:
             currency,
         )
 
-    async def mark_paid(self, invoice_id: str) -> None:
-        await self._db.execute(
+    async def mark_paid(self, invoice_id: str, amount_minor: int | None = None) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
             """
             UPDATE payments
             SET status = 'paid', updated_at = CURRENT_TIMESTAMP
-            WHERE invoice_id = ? AND status = 'pending'
+            WHERE invoice_id = ?1
+              AND status = 'pending'
+              AND (?2 IS NULL OR amount_minor IS NULL OR amount_minor = ?2)
+            """,
+            invoice_id,
+            amount_minor,
+        )
+        return rowcount == 1
+
+    async def record_event(self, invoice_id: str, provider: str, amount_minor: int | None) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            "INSERT OR IGNORE INTO payment_events (invoice_id, provider, amount_minor) VALUES (?, ?, ?)",
+            invoice_id,
+            provider,
+            amount_minor,
+        )
+        return rowcount == 1
+
+    async def finish_event(self, invoice_id: str, status: str) -> None:
+        await self._db.execute(
+            """
+            UPDATE payment_events
+            SET status = ?, processed_at = CURRENT_TIMESTAMP
+            WHERE invoice_id = ?
             """,
+            status,
             invoice_id,
         )
 
+    async def list_received_events(self, min_age_seconds: int = 0) -> list[tuple[str, int | None]]:
+        rows = await self._db.fetchall(
+            """
+            SELECT invoice_id, amount_minor
+            FROM payment_events
+            WHERE status = 'received' AND received_at <= datetime('now', ?)
+            ORDER BY received_at
+            """,
+            f"-{min_age_seconds} seconds",
+        )
+        return [(row[0], row[1]) for row in rows]
+
     async def mark_paid_pending(self, invoice_id: str, last_error: str | None = None) -> None:
         await self._db.execute(
             """
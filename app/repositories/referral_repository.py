@@ -31,3 +31,54 @@ class ReferralRepository:
             referred_id,
         )
         return row is not None
+
+    async def accrue_bonus(self, referrer_id: int, invitee_id: int, bonus_days: int) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            INSERT OR IGNORE INTO referral_bonus_ledger (referrer_id, invitee_id, bonus_days, status)
+            VALUES (?, ?, ?, 'pending')
+            """,
+            referrer_id,
+            invitee_id,
+            bonus_days,
+        )
+        return rowcount == 1
+
+    async def claim_pending_bonuses(self) -> list[tuple[int, int]]:
+        rows = await self._db.execute_returning(
+            """
+            UPDATE referral_bonus_ledger
+            SET status = 'applying'
+            WHERE status = 'pending'
+            RETURNING referrer_id, bonus_days
+            """
+        )
+        totals: dict[int, int] = {}
+        for referrer_id, bonus_days in rows:
+            totals[referrer_id] = totals.get(referrer_id, 0) + bonus_days
+        return list(totals.items())
+
+    async def finish_bonuses(self, referrer_id: int, applied: bool) -> None:
+        if applied:
+            await self._db.execute(
+                """
+                UPDATE referral_bonus_ledger
+                SET status = 'applied', applied_at = CURRENT_TIMESTAMP
+                WHERE referrer_id = ? AND status = 'applying'
+                """,
+                referrer_id,
+            )
+            return
+        await self._db.execute(
+            """
+            UPDATE referral_bonus_ledger
+            SET status = 'pending'
+            WHERE referrer_id = ? AND status = 'applying'
+            """,
+            referrer_id,
+        )
+
+    async def release_stale_claims(self) -> int:
+        return await self._db.execute_with_rowcount(
+            "UPDATE referral_bonus_ledger SET status = 'pending' WHERE status = 'applying'"
+        )
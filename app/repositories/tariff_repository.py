@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from app.db import Database
+
+
+class TariffRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def seed(self, tariffs: dict[str, dict]) -> None:
+        await self._db.executemany(
+            """
+            INSERT OR IGNORE INTO tariffs (code, title, days, price, sort_order, is_active)
+            VALUES (?, ?, ?, ?, ?, 1)
+            """,
+            [
+                (code, plan["title"], plan["days"], plan["price"], index)
+                for index, (code, plan) in enumerate(tariffs.items())
+            ],
+        )
+
+    async def list_all(self) -> list[tuple[str, str, int, float, bool]]:
+        rows = await self._db.fetchall(
+            """
+            SELECT code, title, days, price, is_active
+            FROM tariffs
+            ORDER BY sort_order ASC, days ASC
+            """
+        )
+        return [(row[0], row[1], row[2], row[3], bool(row[4])) for row in rows]
+
+    async def fingerprint(self) -> str:
+        row = await self._db.fetchone("SELECT COUNT(*), MAX(updated_at) FROM tariffs")
+        return f"{row[0]}:{row[1]}" if row else ""
+
+    async def set_price(self, code: str, price: float) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE tariffs
+            SET price = ?, updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE code = ?
+            """,
+            price,
+            code,
+        )
+        return rowcount == 1
+
+    async def set_active(self, code: str, is_active: bool) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            """
+            UPDATE tariffs
+            SET is_active = ?, updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE code = ?
+            """,
+            int(is_active),
+            code,
+        )
+        return rowcount == 1
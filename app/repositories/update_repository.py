@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from app.db import Database
+
+
+class UpdateRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def claim(self, update_id: int) -> bool:
+        rowcount = await self._db.execute_with_rowcount(
+            "INSERT OR IGNORE INTO telegram_updates (update_id, received_at) VALUES (?, ?)",
+            update_id,
+            datetime.utcnow().isoformat(),
+        )
+        return rowcount == 1
+
+    async def purge(self, before: datetime) -> int:
+        return await self._db.execute_with_rowcount(
+            "DELETE FROM telegram_updates WHERE received_at < ?",
+            before.isoformat(),
+        )
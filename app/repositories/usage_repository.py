@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from app.db import Database
+from app.models.usage import TrafficAccount, TrafficCounter
+
+
+class UsageRepository:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def list_tracked_accounts(self, now_iso: str) -> list[TrafficAccount]:
+        rows = await self._db.fetchall(
+            """
+            SELECT telegram_id, marzban_username, panel_id, traffic_limit_gb, subscription_expires_at
+            FROM users
+            WHERE subscription_expires_at IS NOT NULL AND subscription_expires_at > ?
+            """,
+            now_iso,
+        )
+        return [
+            TrafficAccount(
+                telegram_id=row[0],
+                marzban_username=row[1],
+                panel_id=row[2],
+                traffic_limit_gb=row[3],
+                subscription_expires_at=datetime.fromisoformat(row[4]) if row[4] else None,
+            )
+            for row in rows
+        ]
+
+    async def get_counter(self, telegram_id: int) -> TrafficCounter | None:
+        row = await self._db.fetchone(
+            """
+            SELECT telegram_id, used_bytes, data_limit_bytes, panel_status, warned_percent, updated_at
+            FROM traffic_counters
+            WHERE telegram_id = ?
+            """,
+            telegram_id,
+        )
+        return self._to_counter(row) if row else None
+
+    async def list_counters(self) -> dict[int, TrafficCounter]:
+        rows = await self._db.fetchall(
+            """
+            SELECT telegram_id, used_bytes, data_limit_bytes, panel_status, warned_percent, updated_at
+            FROM traffic_counters
+            """
+        )
+        return {row[0]: self._to_counter(row) for row in rows}
+
+    async def save_counters(self, counters: list[TrafficCounter]) -> None:
+        await self._db.executemany(
+            """
+            INSERT INTO traffic_counters (
+                telegram_id,
+                used_bytes,
+                data_limit_bytes,
+                panel_status,
+                warned_percent,
+                updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+                used_bytes=excluded.used_bytes,
+                data_limit_bytes=excluded.data_limit_bytes,
+                panel_status=excluded.panel_status,
+                warned_percent=excluded.warned_percent,
+                updated_at=excluded.updated_at
+            """,
+            [
+                (
+                    counter.telegram_id,
+                    counter.used_bytes,
+                    counter.data_limit_bytes,
+                    counter.panel_status,
+                    counter.warned_percent,
+                    counter.updated_at.isoformat() if counter.updated_at else None,
+                )
+                for counter in counters
+            ],
+        )
+
+    async def add_hourly_usage(self, bucket: str, deltas: list[tuple[int, int]]) -> None:
+        await self._db.executemany(
+            """
+            INSERT INTO traffic_usage (telegram_id, resolution, bucket, bytes)
+            VALUES (?, 'hour', ?, ?)
+            ON CONFLICT(telegram_id, resolution, bucket) DO UPDATE SET
+                bytes = bytes + excluded.bytes
+            """,
+            [(telegram_id, bucket, delta) for telegram_id, delta in deltas if delta > 0],
+        )
+
+    async def downsample_hourly(self, before_bucket: str) -> None:
+        await self._db.execute_batch(
+            [
+                (
+                    """
+                    INSERT INTO traffic_usage (telegram_id, resolution, bucket, bytes)
+                    SELECT telegram_id, 'day', substr(bucket, 1, 10), SUM(bytes)
+                    FROM traffic_usage
+                    WHERE resolution = 'hour' AND bucket < ?
+                    GROUP BY telegram_id, substr(bucket, 1, 10)
+                    ON CONFLICT(telegram_id, resolution, bucket) DO UPDATE SET
+                        bytes = bytes + excluded.bytes
+                    """,
+                    (before_bucket,),
+                ),
+                (
+                    "DELETE FROM traffic_usage WHERE resolution = 'hour' AND bucket < ?",
+                    (before_bucket,),
+                ),
+            ]
+        )
+
+    def _to_counter(self, row: tuple) -> TrafficCounter:
+        return TrafficCounter(
+            telegram_id=row[0],
+            used_bytes=row[1] or 0,
+            data_limit_bytes=row[2],
+            panel_status=row[3],
+            warned_percent=row[4] or 0,
+            updated_at=datetime.fromisoformat(row[5]) if row[5] else None,
+        )
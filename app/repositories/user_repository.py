@@ -1,14 +1,46 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Callable
 
 from app.db import Database
 from app.models.user import User
 
+ExpiryListener = Callable[[int, datetime | None], None]
+
+EXPIRY_MOVED = (
+    "(users.subscription_expires_at IS NULL OR {new} IS NULL "
+    "OR ABS(julianday({new}) - julianday(users.subscription_expires_at)) * 86400 >= 60)"
+)
+
+
+def _reset_reminders_on_move(new: str) -> str:
+    moved = EXPIRY_MOVED.format(new=new)
+    return ",\n".join(
+        f"{column} = CASE WHEN {moved} THEN 0 ELSE users.{column} END"
+        for column in ("reminder_3d_sent", "reminder_1d_sent", "expired_notice_sent")
+    )
+
+
+def _audience_filter(target: str, now_iso: str) -> tuple[str, list[str]]:
+    if target == "active":
+        return "u.subscription_expires_at > ?", [now_iso]
+    if target == "inactive":
+        return "(u.subscription_expires_at IS NULL OR u.subscription_expires_at <= ?)", [now_iso]
+    return "1 = 1", []
+
 
 class UserRepository:
     def __init__(self, db: Database):
         self._db = db
+        self._expiry_listeners: list[ExpiryListener] = []
+
+    def add_expiry_listener(self, listener: ExpiryListener) -> None:
+        self._expiry_listeners.append(listener)
+
+    def _notify_expiry(self, telegram_id: int, expires_at: datetime | None) -> None:
+        for listener in self._expiry_listeners:
+            listener(telegram_id, expires_at)
 
     async def upsert_user(self, user: User) -> None:
         await self._db.execute(
@@ -24,9 +56,10 @@ class UserRepository:
                 referrer_telegram_id,
                 referral_bonus_applied,
                 reminder_3d_sent,
-                reminder_1d_sent
+                reminder_1d_sent,
+                panel_id
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT(telegram_id) DO UPDATE SET
                 marzban_username=excluded.marzban_username,
                 marzban_uuid=excluded.marzban_uuid,
@@ -37,8 +70,13 @@ class UserRepository:
                 referrer_telegram_id=excluded.referrer_telegram_id,
                 referral_bonus_applied=excluded.referral_bonus_applied,
                 reminder_3d_sent=excluded.reminder_3d_sent,
-                reminder_1d_sent=excluded.reminder_1d_sent
-            """,
+                reminder_1d_sent=excluded.reminder_1d_sent,
+                expired_notice_sent=CASE
+                    WHEN {expiry_moved} THEN 0
+                    ELSE users.expired_notice_sent
+                END,
+                panel_id=COALESCE(excluded.panel_id, users.panel_id)
+            """.format(expiry_moved=EXPIRY_MOVED.format(new="excluded.subscription_expires_at")),
             user.telegram_id,
             user.marzban_username,
             user.marzban_uuid,
@@ -50,8 +88,10 @@ class UserRepository:
             int(user.referral_bonus_applied),
             int(user.reminder_3d_sent),
             int(user.reminder_1d_sent),
+            user.panel_id,
         )
         await self.register_telegram_user(user.telegram_id)
+        self._notify_expiry(user.telegram_id, user.subscription_expires_at)
 
     async def get_by_telegram_id(self, telegram_id: int) -> User | None:
         row = await self._db.fetchone(
@@ -67,7 +107,8 @@ class UserRepository:
                 COALESCE(t.referrer_telegram_id, u.referrer_telegram_id),
                 COALESCE(t.referral_bonus_applied, u.referral_bonus_applied, 0),
                 u.reminder_3d_sent,
-                u.reminder_1d_sent
+                u.reminder_1d_sent,
+                u.panel_id
             FROM users u
             LEFT JOIN telegram_users t ON t.telegram_id = u.telegram_id
             WHERE u.telegram_id = ?
@@ -91,15 +132,43 @@ class UserRepository:
             referral_bonus_applied=bool(row[8]),
             reminder_3d_sent=bool(row[9]),
             reminder_1d_sent=bool(row[10]),
+            panel_id=row[11],
         )
 
     async def update_subscription(self, telegram_id: int, expires_at: datetime | None, link: str | None) -> None:
         await self._db.execute(
-            """UPDATE users SET subscription_expires_at = ?, subscription_link = ? WHERE telegram_id = ?""",
+            f"""
+            UPDATE users
+            SET {_reset_reminders_on_move("?1")},
+                subscription_expires_at = ?1,
+                subscription_link = ?2
+            WHERE telegram_id = ?3
+            """,
             expires_at.isoformat() if expires_at else None,
             link,
             telegram_id,
         )
+        self._notify_expiry(telegram_id, expires_at)
+
+    async def update_expiries(self, updates: list[tuple[int, datetime]]) -> None:
+        await self._db.executemany(
+            f"""
+            UPDATE users
+            SET {_reset_reminders_on_move("?1")},
+                subscription_expires_at = ?1
+            WHERE telegram_id = ?2
+            """,
+            [(expires_at.isoformat(), telegram_id) for telegram_id, expires_at in updates],
+        )
+        for telegram_id, expires_at in updates:
+            self._notify_expiry(telegram_id, expires_at)
+
+    async def update_traffic_limit(self, telegram_id: int, traffic_limit_gb: float) -> None:
+        await self._db.execute(
+            "UPDATE users SET traffic_limit_gb = ? WHERE telegram_id = ?",
+            traffic_limit_gb,
+            telegram_id,
+        )
 
     async def get_user_meta(self, telegram_id: int) -> tuple[bool, int | None, bool]:
         row = await self._db.fetchone(
@@ -360,27 +429,133 @@ class UserRepository:
         )
         return [row[0] for row in rows]
 
-    async def list_expiring_users(self, now_iso: str, until_iso: str) -> list[tuple[int, str, bool, bool]]:
+    async def list_audience(
+        self,
+        target: str,
+        now_iso: str,
+        after_id: int = 0,
+        limit: int = 500,
+    ) -> list[int]:
+        condition, args = _audience_filter(target, now_iso)
+        rows = await self._db.fetchall(
+            f"""
+            SELECT t.telegram_id
+            FROM telegram_users t
+            LEFT JOIN users u ON u.telegram_id = t.telegram_id
+            WHERE t.telegram_id > ? AND t.unreachable_since IS NULL AND {condition}
+            ORDER BY t.telegram_id ASC
+            LIMIT ?
+            """,
+            after_id,
+            *args,
+            limit,
+        )
+        return [row[0] for row in rows]
+
+    async def count_audience(self, target: str, now_iso: str) -> int:
+        condition, args = _audience_filter(target, now_iso)
+        row = await self._db.fetchone(
+            f"""
+            SELECT COUNT(*)
+            FROM telegram_users t
+            LEFT JOIN users u ON u.telegram_id = t.telegram_id
+            WHERE t.unreachable_since IS NULL AND {condition}
+            """,
+            *args,
+        )
+        return row[0] if row else 0
+
+    async def list_expiring_users(
+        self,
+        after: datetime,
+        until: datetime,
+    ) -> list[tuple[int, datetime, bool, bool, bool]]:
         rows = await self._db.fetchall(
             """
-            SELECT telegram_id, subscription_expires_at, reminder_3d_sent, reminder_1d_sent
+            SELECT u.telegram_id, u.subscription_expires_at, u.reminder_3d_sent, u.reminder_1d_sent, u.expired_notice_sent
+            FROM users u
+            LEFT JOIN telegram_users t ON t.telegram_id = u.telegram_id
+            WHERE u.subscription_expires_at > ?
+              AND u.subscription_expires_at <= ?
+              AND t.unreachable_since IS NULL
+            ORDER BY u.subscription_expires_at ASC
+            """,
+            after.isoformat(),
+            until.isoformat(),
+        )
+        return [
+            (row[0], datetime.fromisoformat(row[1]), bool(row[2]), bool(row[3]), bool(row[4]))
+            for row in rows
+        ]
+
+    async def get_reminder_states(
+        self,
+        telegram_ids: list[int],
+    ) -> dict[int, tuple[datetime | None, bool, bool, bool]]:
+        if not telegram_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in telegram_ids)
+        rows = await self._db.fetchall(
+            f"""
+            SELECT telegram_id, subscription_expires_at, reminder_3d_sent, reminder_1d_sent, expired_notice_sent
             FROM users
-            WHERE subscription_expires_at IS NOT NULL
-              AND subscription_expires_at > ?
-              AND subscription_expires_at <= ?
+            WHERE telegram_id IN ({placeholders})
             """,
-            now_iso,
-            until_iso,
+            *telegram_ids,
+        )
+        return {
+            row[0]: (
+                datetime.fromisoformat(row[1]) if row[1] else None,
+                bool(row[2]),
+                bool(row[3]),
+                bool(row[4]),
+            )
+            for row in rows
+        }
+
+    async def mark_reminders_sent(self, column: str, telegram_ids: list[int]) -> None:
+        if column not in {"reminder_3d_sent", "reminder_1d_sent", "expired_notice_sent"}:
+            raise ValueError(f"Unknown reminder column: {column}")
+        await self._db.executemany(
+            f"UPDATE users SET {column} = 1 WHERE telegram_id = ?",
+            [(telegram_id,) for telegram_id in telegram_ids],
         )
-        return [(row[0], row[1], bool(row[2]), bool(row[3])) for row in rows]
 
-    async def mark_reminder_sent(self, telegram_id: int, days: int) -> None:
-        column = "reminder_3d_sent" if days == 3 else "reminder_1d_sent"
+    async def mark_unreachable(self, telegram_id: int, reason: str) -> None:
         await self._db.execute(
-            f"UPDATE users SET {column} = 1 WHERE telegram_id = ?",
+            """
+            INSERT INTO telegram_users (telegram_id, unreachable_since, unreachable_reason)
+            VALUES (?, CURRENT_TIMESTAMP, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+                unreachable_since = COALESCE(telegram_users.unreachable_since, excluded.unreachable_since),
+                unreachable_reason = excluded.unreachable_reason
+            """,
             telegram_id,
+            reason,
         )
 
+    async def mark_reachable(self, telegram_id: int) -> None:
+        await self._db.execute(
+            """
+            UPDATE telegram_users
+            SET unreachable_since = NULL, unreachable_reason = NULL
+            WHERE telegram_id = ?
+            """,
+            telegram_id,
+        )
+
+    async def count_unreachable(self) -> int:
+        row = await self._db.fetchone(
+            "SELECT COUNT(*) FROM telegram_users WHERE unreachable_since IS NOT NULL"
+        )
+        return row[0] if row else 0
+
+    async def list_unreachable_ids(self) -> list[int]:
+        rows = await self._db.fetchall(
+            "SELECT telegram_id FROM telegram_users WHERE unreachable_since IS NOT NULL"
+        )
+        return [row[0] for row in rows]
+
     async def register_telegram_user(self, telegram_id: int) -> None:
         await self._db.execute(
             "INSERT INTO telegram_users (telegram_id) VALUES (?) ON CONFLICT(telegram_id) DO NOTHING",
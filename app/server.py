@@ -1,76 +1,98 @@
 from __future__ import annotations
 
-import aiohttp
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
-from aiogram import Bot
 
-from app.keyboards.common import connection_keyboard
-from app.services.payments import PaymentService
-from app.services.subscription import SubscriptionService
+from app.services.payment_jobs import PaymentJobs
+from app.services.payments import PAID_STATUSES, PaymentService
+from app.services.tariffs import to_minor_units
+
+logger = logging.getLogger(__name__)
 
 
 class WebhookApp:
     def __init__(
         self,
-        bot: Bot,
         payment_service: PaymentService,
-        subscription_service: SubscriptionService,
+        payment_jobs: PaymentJobs,
         webhook_path: str,
+        dispatcher: Dispatcher | None = None,
+        bot: Bot | None = None,
+        telegram_path: str | None = None,
+        secret_token: str | None = None,
     ):
-        self.bot = bot
         self.payment_service = payment_service
-        self.subscription_service = subscription_service
+        self.payment_jobs = payment_jobs
         self.webhook_path = webhook_path
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.telegram_path = telegram_path
+        self.secret_token = secret_token
+        self._ingest_tasks: set[asyncio.Task[bool]] = set()
 
     def build(self) -> web.Application:
         app = web.Application()
         app.add_routes([web.post(self.webhook_path, self.handle_payment)])
+        if self.dispatcher and self.bot and self.telegram_path:
+            SimpleRequestHandler(
+                dispatcher=self.dispatcher,
+                bot=self.bot,
+                handle_in_background=False,
+                secret_token=self.secret_token,
+            ).register(app, path=self.telegram_path)
+            setup_application(app, self.dispatcher, bot=self.bot)
         return app
 
+    async def serve(self, host: str, port: int, stop: asyncio.Event | None = None) -> None:
+        runner = web.AppRunner(self.build())
+        await runner.setup()
+        try:
+            site = web.TCPSite(runner, host, port)
+            await site.start()
+            logger.info("Webhook server listening: host=%s port=%s", host, port)
+            await (stop or asyncio.Event()).wait()
+        finally:
+            await runner.cleanup()
+
     async def handle_payment(self, request: web.Request) -> web.Response:
         content_type = request.content_type or ""
-        result = None
-        if content_type.startswith("application/json"):
+        is_json = content_type.startswith("application/json")
+        if is_json:
             payload = await request.text()
             signature = request.headers.get("X-Signature", "")
             result = await self.payment_service.verify_webhook(payload, signature)
+            provider = "webhook"
         else:
             form = await request.post()
-            result = await self.payment_service.verify_robokassa(dict(form))
+            result = await self.payment_service.verify_robokassa({key: str(value) for key, value in form.items()})
+            provider = "robokassa"
         if not result:
             return web.json_response({"status": "ignored"}, status=400)
-        try:
-            user = await self.subscription_service.process_payment_success(result.invoice_id)
-        except aiohttp.ClientResponseError as exc:
-            return web.json_response(
-                {"status": "marzban_error", "code": exc.status, "message": exc.message},
-                status=502,
-            )
-        if not user:
-            return web.json_response({"status": "not_found"}, status=404)
-        await self._send_access_message(user.telegram_id, user.subscription_link or "")
-        if not content_type.startswith("application/json"):
+        if result.status not in PAID_STATUSES:
+            return web.json_response({"status": "ignored"})
+        amount_minor = to_minor_units(result.amount)
+        if await self.payment_service.payment_repo.record_event(result.invoice_id, provider, amount_minor):
+            task = asyncio.create_task(self._ingest(result.invoice_id, amount_minor))
+            self._ingest_tasks.add(task)
+            task.add_done_callback(self._ingest_tasks.discard)
+        else:
+            logger.info("Payment webhook redelivery acknowledged: invoice_id=%s", result.invoice_id)
+        if not is_json:
             return web.Response(text=f"OK{result.invoice_id}")
-        return web.json_response({"status": "ok", "user": user.marzban_username})
+        return web.json_response({"status": "accepted"})
 
-    async def _send_access_message(self, telegram_id: int, subscription_link: str) -> None:
-        if not subscription_link:
-            await self.bot.send_message(
-                telegram_id,
-                "Оплата прошла успешно, но ссылка на подписку пока не готова. Напиши в поддержку.",
-            )
-            return
-        keyboard = connection_keyboard(subscription_link)
-        if not keyboard:
-            await self.bot.send_message(
-                telegram_id,
-                "Оплата прошла успешно, но ссылка на подписку пока не готова. Напиши в поддержку.",
-            )
-            return
-        text = (
-            "🛡 DagDev VPN\n"
-            "━━━━━━━━━━━━\n"
-            "Your VPN is ready.\n"
-            "Tap the button below to connect."
-        )
-        await self.bot.send_message(telegram_id, text, reply_markup=keyboard)
+    async def drain(self, timeout: float) -> int:
+        if self._ingest_tasks:
+            await asyncio.wait(set(self._ingest_tasks), timeout=max(timeout, 0))
+        return sum(1 for task in self._ingest_tasks if not task.done())
+
+    async def _ingest(self, invoice_id: str, amount_minor: int) -> bool:
+        try:
+            return await self.payment_jobs.ingest(invoice_id, amount_minor)
+        except Exception:
+            logger.exception("Payment ingestion failed, will retry from the sweep: invoice_id=%s", invoice_id)
+            return False
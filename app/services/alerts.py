@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+
+from app.services.outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SAMPLE_LIMIT = 20
+DIGEST_TEXT_LIMIT = 500
+MESSAGE_LIMIT = 4096
+
+
+@dataclass
+class _AlertState:
+    text: str
+    first_seen: datetime
+    last_seen: datetime
+    count: int = 1
+    suppressed: int = 0
+
+
+class AlertAggregator:
+    def __init__(
+        self,
+        outbox: Outbox,
+        window: timedelta = timedelta(minutes=15),
+        digest_interval_seconds: int = 300,
+    ):
+        self.outbox = outbox
+        self.window = window
+        self.digest_interval_seconds = digest_interval_seconds
+        self._alerts: dict[str, _AlertState] = {}
+
+    async def notify(self, text: str, key: str | None = None) -> None:
+        fingerprint = key or text
+        now = datetime.utcnow()
+        state = self._alerts.get(fingerprint)
+        if state and now - state.last_seen < self.window:
+            state.text = text
+            state.last_seen = now
+            state.count += 1
+            state.suppressed += 1
+            return
+        self._alerts[fingerprint] = _AlertState(text, now, now)
+        await self.outbox.notify_admins(text)
+
+    async def flush(self) -> int:
+        now = datetime.utcnow()
+        pending = [state for state in self._alerts.values() if state.suppressed]
+        for fingerprint, state in list(self._alerts.items()):
+            if not state.suppressed and now - state.last_seen >= self.window:
+                del self._alerts[fingerprint]
+        if not pending:
+            return 0
+        pending.sort(key=lambda state: state.suppressed, reverse=True)
+        blocks = ["🧾 Сводка повторяющихся уведомлений:"]
+        for state in pending[:DIGEST_SAMPLE_LIMIT]:
+            text = state.text if len(state.text) <= DIGEST_TEXT_LIMIT else state.text[:DIGEST_TEXT_LIMIT] + "…"
+            blocks.append(
+                f"\n×{state.suppressed} (всего {state.count}) "
+                f"{state.first_seen:%H:%M}–{state.last_seen:%H:%M} UTC\n{text}"
+            )
+        if len(pending) > DIGEST_SAMPLE_LIMIT:
+            blocks.append(f"\n…и ещё {len(pending) - DIGEST_SAMPLE_LIMIT} типов уведомлений.")
+        for state in pending:
+            state.suppressed = 0
+        for message in _split_message(blocks):
+            await self.outbox.notify_admins(message)
+        logger.info("Admin alert digest sent: fingerprints=%s", len(pending))
+        return len(pending)
+
+
+def _split_message(blocks: list[str]) -> list[str]:
+    messages: list[str] = []
+    current = ""
+    for block in blocks:
+        if current and len(current) + len(block) + 1 > MESSAGE_LIMIT:
+            messages.append(current)
+            current = block.lstrip("\n")
+        else:
+            current = f"{current}\n{block}" if current else block
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def alert_digest_loop(aggregator: AlertAggregator) -> None:
+    while True:
+        await asyncio.sleep(aggregator.digest_interval_seconds)
+        try:
+            await aggregator.flush()
+        except Exception:
+            logger.exception("Failed to send admin alert digest")
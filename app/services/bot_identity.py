@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram import Bot
+
+from app.repositories.meta_repository import MetaRepository
+
+logger = logging.getLogger(__name__)
+
+
+class BotIdentity:
+    def __init__(self, bot: Bot, repo: MetaRepository):
+        self.bot = bot
+        self.repo = repo
+        self.username: str | None = None
+
+    @property
+    def _key(self) -> str:
+        return f"bot_username:{self.bot.id}"
+
+    async def load(self) -> tuple[str, bool]:
+        cached = await self.repo.get(self._key)
+        if cached:
+            self.username = cached
+            return cached, True
+        return await self.refresh(), False
+
+    async def refresh(self) -> str:
+        me = await self.bot.get_me()
+        username = me.username or ""
+        if username != self.username:
+            await self.repo.set(self._key, username)
+            if self.username:
+                logger.info("Bot username changed: %s -> %s", self.username, username)
+        self.username = username
+        return username
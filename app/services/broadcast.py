@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from datetime import datetime, timedelta
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+)
+
+from app.config import Settings
+from app.keyboards.admin import broadcast_controls_keyboard
+from app.models.broadcast import Broadcast
+from app.repositories.broadcast_repository import BroadcastRepository
+from app.repositories.user_repository import UserRepository
+from app.services.leader import INSTANCE_ID
+from app.services.rate_limit import TokenBucket
+from app.services.reachability import ReachabilityTracker
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_SEND_ATTEMPTS = 3
+
+TARGET_LABELS = {
+    "all": "всем пользователям",
+    "active": "пользователям с активной подпиской",
+    "inactive": "пользователям без активной подписки",
+}
+
+STATUS_LABELS = {
+    "running": "⏳ идёт",
+    "paused": "⏸ на паузе",
+    "completed": "✅ завершена",
+    "cancelled": "🛑 остановлена",
+}
+
+
+class BroadcastEngine:
+    def __init__(
+        self,
+        bot: Bot,
+        settings: Settings,
+        repo: BroadcastRepository,
+        user_repo: UserRepository,
+        reachability: ReachabilityTracker | None = None,
+    ):
+        self.bot = bot
+        self.settings = settings
+        self.repo = repo
+        self.user_repo = user_repo
+        self.reachability = reachability
+        self._bucket = TokenBucket(settings.broadcast_rate_per_second)
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+        self._stops: dict[int, asyncio.Task[None]] = {}
+        self._reported_at: dict[int, float] = {}
+
+    async def start(
+        self,
+        target: str,
+        from_chat_id: int,
+        source_message_id: int,
+        progress_chat_id: int | None = None,
+    ) -> Broadcast:
+        total = await self.user_repo.count_audience(target, datetime.utcnow().isoformat())
+        broadcast = await self.repo.create(target, from_chat_id, source_message_id, total, progress_chat_id)
+        logger.info("Broadcast created: id=%s target=%s total=%s", broadcast.id, target, total)
+        if progress_chat_id is not None:
+            message = await self.bot.send_message(
+                progress_chat_id,
+                self._render(broadcast),
+                reply_markup=broadcast_controls_keyboard(broadcast.id, broadcast.status),
+            )
+            broadcast.progress_message_id = message.message_id
+            await self.repo.set_progress_message(broadcast.id, message.message_id)
+        self._spawn(broadcast)
+        return broadcast
+
+    async def resume(self) -> int:
+        stale_before = datetime.utcnow() - timedelta(seconds=self.settings.leader_lease_seconds)
+        resumed = 0
+        for broadcast in await self.repo.list_by_status("running"):
+            if broadcast.id in self._tasks:
+                continue
+            if not await self.repo.claim(broadcast.id, INSTANCE_ID, stale_before):
+                continue
+            logger.info("Resuming broadcast: id=%s cursor=%s", broadcast.id, broadcast.cursor)
+            self._spawn(broadcast)
+            resumed += 1
+        return resumed
+
+    async def pause(self, broadcast_id: int) -> bool:
+        if not await self.repo.set_status(broadcast_id, "paused", expected={"running"}):
+            return False
+        self._stop_in_background(broadcast_id)
+        return True
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        if not await self.repo.set_status(broadcast_id, "cancelled", expected={"running", "paused"}):
+            return False
+        self._stop_in_background(broadcast_id)
+        return True
+
+    async def unpause(self, broadcast_id: int) -> bool:
+        if not await self.repo.set_status(broadcast_id, "running", expected={"paused"}):
+            return False
+        stop = self._stops.get(broadcast_id)
+        if stop:
+            with suppress(asyncio.CancelledError):
+                await stop
+        broadcast = await self.repo.get(broadcast_id)
+        if broadcast:
+            self._spawn(broadcast)
+        return True
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks.values()) + list(self._stops.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+
+    def _spawn(self, broadcast: Broadcast) -> None:
+        task = asyncio.create_task(self._run_owned(broadcast))
+        self._tasks[broadcast.id] = task
+        task.add_done_callback(lambda done: self._forget(broadcast.id, done))
+
+    def _forget(self, broadcast_id: int, task: asyncio.Task[None]) -> None:
+        if self._tasks.get(broadcast_id) is task:
+            del self._tasks[broadcast_id]
+
+    def _stop_in_background(self, broadcast_id: int) -> None:
+        stop = asyncio.create_task(self._stop_and_report(broadcast_id, self._tasks.get(broadcast_id)))
+        self._stops[broadcast_id] = stop
+        stop.add_done_callback(lambda done: self._forget_stop(broadcast_id, done))
+
+    def _forget_stop(self, broadcast_id: int, task: asyncio.Task[None]) -> None:
+        if self._stops.get(broadcast_id) is task:
+            del self._stops[broadcast_id]
+
+    async def _stop_and_report(self, broadcast_id: int, task: asyncio.Task[None] | None) -> None:
+        if task and not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await self._report_final(broadcast_id)
+
+    async def _run_owned(self, broadcast: Broadcast) -> None:
+        stale_before = datetime.utcnow() - timedelta(seconds=self.settings.leader_lease_seconds)
+        if not await self.repo.claim(broadcast.id, INSTANCE_ID, stale_before):
+            logger.info("Broadcast is owned by another instance: id=%s", broadcast.id)
+            return
+        run = asyncio.create_task(self._run(broadcast))
+        heartbeat = asyncio.create_task(self._heartbeat(broadcast.id, run))
+        try:
+            await run
+        finally:
+            run.cancel()
+            heartbeat.cancel()
+            await asyncio.gather(run, heartbeat, return_exceptions=True)
+            await self.repo.release(broadcast.id, INSTANCE_ID)
+
+    async def _heartbeat(self, broadcast_id: int, run: asyncio.Task[None]) -> None:
+        while True:
+            await asyncio.sleep(self.settings.leader_heartbeat_seconds)
+            try:
+                owned = await self.repo.heartbeat(broadcast_id, INSTANCE_ID)
+            except Exception:
+                logger.exception("Broadcast heartbeat failed: id=%s", broadcast_id)
+                continue
+            if not owned:
+                logger.warning("Broadcast stopped or taken over elsewhere: id=%s", broadcast_id)
+                run.cancel()
+                return
+
+    async def _run(self, broadcast: Broadcast) -> None:
+        started = time.monotonic()
+        processed_at_start = broadcast.processed
+        while True:
+            recipients = await self.user_repo.list_audience(
+                broadcast.target,
+                datetime.utcnow().isoformat(),
+                broadcast.cursor,
+                BATCH_SIZE,
+            )
+            if not recipients:
+                break
+            batch = asyncio.create_task(self._send_batch(broadcast, recipients))
+            try:
+                delivered, failed = await asyncio.shield(batch)
+            except asyncio.CancelledError:
+                with suppress(asyncio.TimeoutError, asyncio.CancelledError):
+                    delivered, failed = await asyncio.wait_for(batch, timeout=10)
+                    await self._checkpoint(broadcast, recipients[-1], delivered, failed)
+                raise
+            await self._checkpoint(broadcast, recipients[-1], delivered, failed)
+            await self._report(broadcast, started, processed_at_start)
+        await self.repo.set_status(broadcast.id, "completed", expected={"running"})
+        broadcast.status = "completed"
+        await self._report(broadcast, started, processed_at_start, force=True)
+        logger.info(
+            "Broadcast completed: id=%s delivered=%s failed=%s elapsed=%.1fs",
+            broadcast.id,
+            broadcast.delivered,
+            broadcast.failed,
+            time.monotonic() - started,
+        )
+
+    async def _checkpoint(self, broadcast: Broadcast, cursor: int, delivered: int, failed: int) -> None:
+        await self.repo.checkpoint(broadcast.id, cursor, delivered, failed)
+        broadcast.cursor = cursor
+        broadcast.delivered += delivered
+        broadcast.failed += failed
+
+    async def _send_batch(self, broadcast: Broadcast, recipients: list[int]) -> tuple[int, int]:
+        semaphore = asyncio.Semaphore(self.settings.broadcast_concurrency)
+
+        async def deliver(telegram_id: int) -> bool:
+            async with semaphore:
+                return await self._deliver(broadcast, telegram_id)
+
+        results = await asyncio.gather(*(deliver(telegram_id) for telegram_id in recipients))
+        delivered = sum(1 for result in results if result)
+        return delivered, len(results) - delivered
+
+    async def _deliver(self, broadcast: Broadcast, telegram_id: int) -> bool:
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            await self._bucket.acquire()
+            try:
+                await self.bot.copy_message(
+                    chat_id=telegram_id,
+                    from_chat_id=broadcast.from_chat_id,
+                    message_id=broadcast.source_message_id,
+                )
+                if self.reachability:
+                    await self.reachability.record_success(telegram_id)
+                return True
+            except TelegramRetryAfter as exc:
+                logger.warning("Broadcast throttled by Telegram: retry_after=%s", exc.retry_after)
+                self._bucket.pause(exc.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as exc:
+                if self.reachability:
+                    await self.reachability.record_failure(telegram_id, exc)
+                return False
+            except TelegramNetworkError as exc:
+                logger.warning(
+                    "Broadcast send failed: id=%s telegram_id=%s attempt=%s error=%s",
+                    broadcast.id,
+                    telegram_id,
+                    attempt,
+                    exc,
+                )
+                await asyncio.sleep(attempt)
+        return False
+
+    async def _report(
+        self,
+        broadcast: Broadcast,
+        started: float,
+        processed_at_start: int,
+        force: bool = False,
+    ) -> None:
+        now = time.monotonic()
+        if not force and now - self._reported_at.get(broadcast.id, 0.0) < self.settings.broadcast_progress_interval_seconds:
+            return
+        self._reported_at[broadcast.id] = now
+        elapsed = now - started
+        rate = (broadcast.processed - processed_at_start) / elapsed if elapsed > 0 else 0.0
+        await self._edit_progress(broadcast, rate)
+
+    async def _report_final(self, broadcast_id: int) -> None:
+        broadcast = await self.repo.get(broadcast_id)
+        if broadcast:
+            await self._edit_progress(broadcast)
+
+    async def _edit_progress(self, broadcast: Broadcast, rate: float = 0.0) -> None:
+        if broadcast.progress_chat_id is None or broadcast.progress_message_id is None:
+            return
+        try:
+            await self.bot.edit_message_text(
+                self._render(broadcast, rate),
+                chat_id=broadcast.progress_chat_id,
+                message_id=broadcast.progress_message_id,
+                reply_markup=broadcast_controls_keyboard(broadcast.id, broadcast.status),
+            )
+        except TelegramRetryAfter as exc:
+            self._reported_at[broadcast.id] = time.monotonic() + exc.retry_after
+        except TelegramBadRequest as exc:
+            if "message is not modified" not in str(exc):
+                logger.warning("Broadcast progress edit failed: id=%s error=%s", broadcast.id, exc)
+        except TelegramForbiddenError:
+            logger.warning("Broadcast progress edit forbidden: id=%s", broadcast.id)
+
+    def _render(self, broadcast: Broadcast, rate: float = 0.0) -> str:
+        lines = [
+            f"📣 Рассылка #{broadcast.id} {TARGET_LABELS.get(broadcast.target, broadcast.target)}",
+            f"Статус: {STATUS_LABELS.get(broadcast.status, broadcast.status)}",
+            f"Обработано: {broadcast.processed}/{broadcast.total}",
+            f"Доставлено: {broadcast.delivered}",
+            f"Ошибок: {broadcast.failed}",
+        ]
+        if broadcast.status == "running" and rate > 0:
+            remaining = max(broadcast.total - broadcast.processed, 0)
+            lines.append(f"Скорость: {rate:.1f} сообщ./с, осталось ~{remaining / rate / 60:.0f} мин")
+        return "\n".join(lines)
+
+
+async def broadcast_resume_loop(engine: BroadcastEngine, interval_seconds: float = 30) -> None:
+    while True:
+        try:
+            await engine.resume()
+        except Exception:
+            logger.exception("Failed to resume broadcasts")
+        await asyncio.sleep(interval_seconds)
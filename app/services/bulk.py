@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+import contextvars
+from datetime import datetime, timedelta
+import logging
+import time
+from typing import Any
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from app.config import Settings
+from app.models.bulk import BulkItem, BulkOperation, BulkProgress
+from app.repositories.bulk_repository import BulkRepository
+from app.repositories.user_repository import UserRepository
+from app.services.leader import INSTANCE_ID
+from app.services.panels import PanelRegistry
+from app.services.rate_limit import TokenBucket
+from app.services.subscription import SubscriptionService
+
+logger = logging.getLogger(__name__)
+
+EXTEND_ACTIVE = "extend_active"
+TRAFFIC_POLICY = "traffic_policy"
+PURGE_EXPIRED = "purge_expired"
+
+OPERATION_TITLES = {
+    EXTEND_ACTIVE: "продление активных подписок",
+    TRAFFIC_POLICY: "применение политики трафика",
+    PURGE_EXPIRED: "удаление давно истёкших пользователей",
+}
+
+STATUS_LABELS = {
+    "running": "⏳ выполняется",
+    "paused": "⏸ приостановлена",
+    "completed": "✅ завершена",
+    "cancelled": "🛑 отменена",
+}
+
+PAGE_SIZE = 500
+
+
+class BulkOperationEngine:
+    def __init__(
+        self,
+        bot: Bot,
+        settings: Settings,
+        repo: BulkRepository,
+        user_repo: UserRepository,
+        subscription_service: SubscriptionService,
+        panels: PanelRegistry,
+    ):
+        self.bot = bot
+        self.settings = settings
+        self.repo = repo
+        self.user_repo = user_repo
+        self.subscription_service = subscription_service
+        self.panels = panels
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+        self._stopping: dict[int, str] = {}
+        self._limiters: dict[str, TokenBucket] = {}
+
+    def is_running(self, operation_id: int) -> bool:
+        task = self._tasks.get(operation_id)
+        return task is not None and not task.done()
+
+    async def start(
+        self,
+        kind: str,
+        params: dict[str, Any],
+        chat_id: int | None = None,
+        created_by: int | None = None,
+    ) -> BulkOperation:
+        if kind not in OPERATION_TITLES:
+            raise ValueError(f"Unknown bulk operation: {kind}")
+        operation = await self.repo.create_operation(kind, params, chat_id, created_by)
+        now = datetime.utcnow()
+        panel_id = params.get("panel_id")
+        if kind == EXTEND_ACTIVE:
+            operation.total = await self.repo.snapshot_users(operation.id, expires_after=now, panel_id=panel_id)
+        elif kind == TRAFFIC_POLICY:
+            operation.total = await self.repo.snapshot_users(
+                operation.id,
+                expires_after=now if params.get("segment", "active") == "active" else None,
+                panel_id=panel_id,
+            )
+        else:
+            cutoff = now - timedelta(days=int(params["expired_days"]))
+            operation.total = await self.repo.snapshot_users(operation.id, expires_before=cutoff, panel_id=panel_id)
+        logger.info(
+            "Bulk operation created: id=%s kind=%s params=%s total=%s",
+            operation.id,
+            kind,
+            params,
+            operation.total,
+        )
+        if chat_id is not None:
+            progress = await self.repo.progress(operation.id, operation.total)
+            try:
+                message = await self.bot.send_message(chat_id, self._render(operation, progress))
+                operation.message_id = message.message_id
+                await self.repo.set_message(operation.id, message.message_id)
+            except (TelegramForbiddenError, TelegramBadRequest):
+                logger.warning("Bulk progress message failed: id=%s chat_id=%s", operation.id, chat_id)
+        self._spawn(operation)
+        return operation
+
+    async def resume(self) -> int:
+        stale_before = datetime.utcnow() - timedelta(seconds=self.settings.leader_lease_seconds)
+        resumed = 0
+        for operation in await self.repo.list_by_status("running"):
+            if self.is_running(operation.id):
+                continue
+            if not await self.repo.claim(operation.id, INSTANCE_ID, stale_before):
+                continue
+            logger.info("Resuming bulk operation: id=%s kind=%s", operation.id, operation.kind)
+            self._spawn(operation)
+            resumed += 1
+        return resumed
+
+    async def pause(self, operation_id: int) -> bool:
+        return await self._stop(operation_id, "paused")
+
+    async def cancel(self, operation_id: int) -> bool:
+        return await self._stop(operation_id, "cancelled")
+
+    async def continue_operation(self, operation_id: int, retry_failed: bool = False) -> BulkOperation | None:
+        operation = await self.repo.get(operation_id)
+        if not operation or self.is_running(operation_id):
+            return None
+        if operation.status == "cancelled":
+            return None
+        if retry_failed:
+            await self.repo.reset_failed_items(operation_id)
+        await self.repo.set_status(operation_id, "running")
+        operation.status = "running"
+        self._spawn(operation)
+        return operation
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+
+    async def _stop(self, operation_id: int, status: str) -> bool:
+        operation = await self.repo.get(operation_id)
+        if not operation or operation.status not in {"running", "paused"}:
+            return False
+        if status == "paused" and operation.status != "running":
+            return False
+        await self.repo.set_status(operation_id, status)
+        task = self._tasks.get(operation_id)
+        if task and not task.done():
+            self._stopping[operation_id] = status
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        else:
+            operation.status = status
+            await self._report(operation)
+        return True
+
+    def _spawn(self, operation: BulkOperation) -> None:
+        # Runs outlive the admin update that started them, so they must not inherit its deadline.
+        task = asyncio.create_task(self._run_owned(operation), context=contextvars.Context())
+        self._tasks[operation.id] = task
+        task.add_done_callback(lambda done: self._forget(operation.id, done))
+
+    def _forget(self, operation_id: int, task: asyncio.Task[None]) -> None:
+        if self._tasks.get(operation_id) is task:
+            del self._tasks[operation_id]
+
+    def _limiter(self, panel_id: str) -> TokenBucket:
+        limiter = self._limiters.get(panel_id)
+        if limiter is None:
+            limiter = TokenBucket(self.settings.bulk_panel_rate_per_second)
+            self._limiters[panel_id] = limiter
+        return limiter
+
+    async def _run_owned(self, operation: BulkOperation) -> None:
+        stale_before = datetime.utcnow() - timedelta(seconds=self.settings.leader_lease_seconds)
+        if not await self.repo.claim(operation.id, INSTANCE_ID, stale_before):
+            logger.info("Bulk operation is owned by another instance: id=%s", operation.id)
+            return
+        run = asyncio.create_task(self._run(operation))
+        heartbeat = asyncio.create_task(self._heartbeat(operation.id, run))
+        try:
+            await run
+        finally:
+            run.cancel()
+            heartbeat.cancel()
+            await asyncio.gather(run, heartbeat, return_exceptions=True)
+            await self.repo.release(operation.id, INSTANCE_ID)
+
+    async def _heartbeat(self, operation_id: int, run: asyncio.Task[None]) -> None:
+        while True:
+            await asyncio.sleep(self.settings.leader_heartbeat_seconds)
+            try:
+                owned = await self.repo.heartbeat(operation_id, INSTANCE_ID)
+            except Exception:
+                logger.exception("Bulk operation heartbeat failed: id=%s", operation_id)
+                continue
+            if not owned:
+                logger.warning("Bulk operation stopped or taken over elsewhere: id=%s", operation_id)
+                run.cancel()
+                return
+
+    async def _run(self, operation: BulkOperation) -> None:
+        queue: asyncio.Queue[BulkItem | None] = asyncio.Queue(maxsize=self.settings.bulk_concurrency * 2)
+        stop = asyncio.Event()
+        workers = [
+            asyncio.create_task(self._worker(operation, queue, stop))
+            for _ in range(max(self.settings.bulk_concurrency, 1))
+        ]
+        reporter = asyncio.create_task(self._report_loop(operation))
+        started = time.monotonic()
+        try:
+            cursor = 0
+            while True:
+                items = await self.repo.list_pending_items(operation.id, cursor, PAGE_SIZE)
+                if not items:
+                    break
+                for item in items:
+                    await queue.put(item)
+                cursor = items[-1].telegram_id
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            await self._drain(queue, stop, workers)
+            status = self._stopping.pop(operation.id, None)
+            if status:
+                operation.status = status
+                await self._report(operation)
+                logger.info("Bulk operation stopped: id=%s status=%s", operation.id, status)
+            raise
+        finally:
+            reporter.cancel()
+            with suppress(asyncio.CancelledError):
+                await reporter
+        operation.status = "completed"
+        await self.repo.set_status(operation.id, "completed")
+        progress = await self._report(operation)
+        logger.info(
+            "Bulk operation completed: id=%s kind=%s succeeded=%s failed=%s elapsed=%.1fs",
+            operation.id,
+            operation.kind,
+            progress.succeeded,
+            progress.failed,
+            time.monotonic() - started,
+        )
+
+    async def _drain(
+        self,
+        queue: asyncio.Queue[BulkItem | None],
+        stop: asyncio.Event,
+        workers: list[asyncio.Task[None]],
+    ) -> None:
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
+        for _ in workers:
+            queue.put_nowait(None)
+        _, pending = await asyncio.wait(workers, timeout=self.settings.marzban_timeout_seconds)
+        for worker in pending:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(
+        self,
+        operation: BulkOperation,
+        queue: asyncio.Queue[BulkItem | None],
+        stop: asyncio.Event,
+    ) -> None:
+        while True:
+            item = await queue.get()
+            if item is None or stop.is_set():
+                return
+            try:
+                await self._apply(operation, item)
+            except Exception as exc:
+                logger.warning(
+                    "Bulk item failed: operation=%s telegram_id=%s error=%s",
+                    operation.id,
+                    item.telegram_id,
+                    exc,
+                )
+                await self.repo.finish_item(operation.id, item.telegram_id, False, _describe_error(exc))
+            else:
+                await self.repo.finish_item(operation.id, item.telegram_id, True)
+
+    async def _apply(self, operation: BulkOperation, item: BulkItem) -> None:
+        panel_id = self.panels.resolve_id(item.panel_id)
+        marzban = self.panels.get(panel_id)
+        params = operation.params
+        if operation.kind == EXTEND_ACTIVE:
+            async with self.subscription_service.user_lock(item.telegram_id):
+                target = item.target_expires_at
+                if target is None:
+                    user = await self.user_repo.get_by_telegram_id(item.telegram_id)
+                    current = user.subscription_expires_at if user else None
+                    base = max(filter(None, [current, item.base_expires_at]), default=datetime.utcnow())
+                    target = base + timedelta(days=int(params["days"]))
+                    await self.repo.set_item_target(operation.id, item.telegram_id, target)
+                await self._limiter(panel_id).acquire()
+                await marzban.modify_user(item.marzban_username, expire_at=target)
+                await self.user_repo.update_expiries([(item.telegram_id, target)])
+        elif operation.kind == TRAFFIC_POLICY:
+            traffic_gb = params.get("traffic_gb")
+            await self._limiter(panel_id).acquire()
+            await marzban.modify_user(
+                item.marzban_username,
+                traffic_gb=traffic_gb,
+                traffic_reset_period=params.get("reset_period"),
+            )
+            if traffic_gb is not None:
+                await self.user_repo.update_traffic_limit(item.telegram_id, traffic_gb)
+        else:
+            async with self.subscription_service.user_lock(item.telegram_id):
+                user = await self.user_repo.get_by_telegram_id(item.telegram_id)
+                if user and user.subscription_expires_at != item.base_expires_at:
+                    return
+                await self._limiter(panel_id).acquire()
+                try:
+                    await marzban.delete_user(item.marzban_username)
+                except aiohttp.ClientResponseError as exc:
+                    if exc.status != 404:
+                        raise
+                await self.user_repo.update_subscription(item.telegram_id, item.base_expires_at, None)
+
+    async def _report_loop(self, operation: BulkOperation) -> None:
+        while True:
+            await asyncio.sleep(self.settings.bulk_progress_interval_seconds)
+            try:
+                await self._report(operation)
+            except Exception:
+                logger.exception("Bulk progress update failed: id=%s", operation.id)
+
+    async def _report(self, operation: BulkOperation) -> BulkProgress:
+        progress = await self.repo.progress(operation.id, operation.total)
+        if operation.chat_id is None or operation.message_id is None:
+            return progress
+        try:
+            await self.bot.edit_message_text(
+                self._render(operation, progress),
+                chat_id=operation.chat_id,
+                message_id=operation.message_id,
+            )
+        except TelegramBadRequest as exc:
+            if "message is not modified" not in str(exc):
+                logger.warning("Bulk progress edit failed: id=%s error=%s", operation.id, exc)
+        except TelegramForbiddenError:
+            logger.warning("Bulk progress edit forbidden: id=%s", operation.id)
+        return progress
+
+    def _render(self, operation: BulkOperation, progress: BulkProgress) -> str:
+        lines = [
+            f"🛠 Операция #{operation.id}: {OPERATION_TITLES.get(operation.kind, operation.kind)}",
+            f"Статус: {STATUS_LABELS.get(operation.status, operation.status)}",
+            f"Обработано: {progress.processed}/{progress.total}",
+            f"Успешно: {progress.succeeded}",
+            f"Ошибок: {progress.failed}",
+        ]
+        if progress.errors:
+            lines.append("Частые ошибки:")
+            lines.extend(progress.errors)
+        if operation.status == "running":
+            lines.append(f"\nПауза: /bulk_pause {operation.id}  Отмена: /bulk_cancel {operation.id}")
+        elif operation.status == "paused" or progress.failed:
+            lines.append(f"\nПродолжить: /bulk_resume {operation.id}")
+        return "\n".join(lines)
+
+
+def _describe_error(exc: Exception) -> str:
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return f"HTTP {exc.status}"
+    return type(exc).__name__
+
+
+async def bulk_resume_loop(engine: BulkOperationEngine, interval_seconds: float = 30) -> None:
+    while True:
+        try:
+            await engine.resume()
+        except Exception:
+            logger.exception("Failed to resume bulk operations")
+        await asyncio.sleep(interval_seconds)
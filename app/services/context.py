@@ -1,9 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+from collections import OrderedDict
+from contextlib import suppress
+from datetime import datetime, timedelta
+import logging
+import time
 from typing import Any, Callable, Dict, Awaitable
 
-from aiogram import BaseMiddleware
-from aiogram.types import CallbackQuery, Message
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import AnswerCallbackQuery, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update, User
+
+from app.config import Settings
+from app.repositories.update_repository import UpdateRepository
+from app.services.log_context import reset_deadline, set_deadline
+from app.services.rate_limit import TokenBucket
+from app.services.reachability import ReachabilityTracker
+
+logger = logging.getLogger(__name__)
+
+UPDATE_RETENTION = timedelta(hours=24)
+UPDATE_PURGE_INTERVAL_SECONDS = 3600
+RECENT_UPDATES_LIMIT = 10000
+THROTTLE_BUCKETS_LIMIT = 10000
+ANSWERED_CALLBACKS_LIMIT = 10000
+CALLBACK_TIMER_KEY = "callback_answer_timer"
 
 
 class DependencyMiddleware(BaseMiddleware):
@@ -19,3 +45,200 @@ class DependencyMiddleware(BaseMiddleware):
     ) -> Any:
         data.update(self.deps)
         return await handler(event, data)
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    def __init__(self, budget_seconds: float):
+        super().__init__()
+        self.budget_seconds = budget_seconds
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        token = set_deadline(self.budget_seconds)
+        try:
+            return await handler(event, data)
+        finally:
+            reset_deadline(token)
+
+
+class ReachabilityMiddleware(BaseMiddleware):
+    def __init__(self, tracker: ReachabilityTracker):
+        super().__init__()
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user and not self.tracker.is_reachable(user.id):
+            await self.tracker.record_success(user.id)
+        return await handler(event, data)
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    def __init__(self, repo: UpdateRepository):
+        super().__init__()
+        self.repo = repo
+        self._recent: OrderedDict[int, None] = OrderedDict()
+        self._purged_at = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        if event.update_id in self._recent or not await self.repo.claim(event.update_id):
+            logger.info("Duplicate update skipped: update_id=%s", event.update_id)
+            return None
+        self._recent[event.update_id] = None
+        if len(self._recent) > RECENT_UPDATES_LIMIT:
+            self._recent.popitem(last=False)
+        await self._purge()
+        return await handler(event, data)
+
+    async def _purge(self) -> None:
+        now = time.monotonic()
+        if now - self._purged_at < UPDATE_PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = now
+        await self.repo.purge(datetime.utcnow() - UPDATE_RETENTION)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, settings: Settings):
+        super().__init__()
+        self.settings = settings
+        self._buckets: OrderedDict[tuple[int, str], TokenBucket] = OrderedDict()
+        self._replies: OrderedDict[tuple[int, str], tuple[float, Message]] = OrderedDict()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: Message | CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        handler_object: HandlerObject | None = data.get("handler")
+        if not user or not handler_object or user.id in self.settings.telegram_admin_ids:
+            return await handler(event, data)
+        if isinstance(event, Message) and (event.successful_payment or event.text is None):
+            return await handler(event, data)
+        name = getattr(handler_object.callback, "__name__", "handler")
+        key = (user.id, name)
+        if not self._bucket(key, name).try_acquire():
+            logger.info("Update throttled: telegram_id=%s handler=%s", user.id, name)
+            await self._short_circuit(key, event)
+            return None
+        result = await handler(event, data)
+        if isinstance(result, Message):
+            self._replies[key] = (time.monotonic(), result)
+            self._replies.move_to_end(key)
+            if len(self._replies) > THROTTLE_BUCKETS_LIMIT:
+                self._replies.popitem(last=False)
+        return result
+
+    def _bucket(self, key: tuple[int, str], name: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate = self.settings.throttle_handler_rates.get(name, self.settings.throttle_rate_per_second)
+            bucket = TokenBucket(rate, self.settings.throttle_burst)
+            self._buckets[key] = bucket
+            if len(self._buckets) > THROTTLE_BUCKETS_LIMIT:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def _short_circuit(self, key: tuple[int, str], event: Message | CallbackQuery) -> None:
+        if isinstance(event, CallbackQuery):
+            await event.answer()
+            return
+        cached = self._replies.get(key)
+        if not cached or time.monotonic() - cached[0] > self.settings.throttle_reply_ttl_seconds:
+            return
+        reply = cached[1]
+        await reply.send_copy(event.chat.id, reply_markup=reply.reply_markup)
+
+
+class CallbackAnswerTracker(BaseRequestMiddleware):
+    def __init__(self) -> None:
+        self._answered: OrderedDict[str, None] = OrderedDict()
+
+    def is_answered(self, callback_query_id: str) -> bool:
+        return callback_query_id in self._answered
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not isinstance(method, AnswerCallbackQuery):
+            return await make_request(bot, method)
+        if method.callback_query_id in self._answered:
+            return Response[bool](ok=True, result=True)
+        self._answered[method.callback_query_id] = None
+        if len(self._answered) > ANSWERED_CALLBACKS_LIMIT:
+            self._answered.popitem(last=False)
+        try:
+            return await make_request(bot, method)
+        except BaseException:
+            self._answered.pop(method.callback_query_id, None)
+            raise
+
+
+class CallbackAnswerMiddleware(BaseMiddleware):
+    def __init__(self, tracker: CallbackAnswerTracker, budget_seconds: float = 0.3):
+        super().__init__()
+        self.tracker = tracker
+        self.budget_seconds = budget_seconds
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        bot: Bot = data["bot"]
+        if isinstance(event, Update):
+            if event.callback_query is None:
+                return await handler(event, data)
+            if self.budget_seconds <= 0:
+                await self._acknowledge(bot, event.callback_query)
+            else:
+                data[CALLBACK_TIMER_KEY] = asyncio.create_task(
+                    self._acknowledge_later(bot, event.callback_query)
+                )
+            return await handler(event, data)
+        try:
+            return await handler(event, data)
+        finally:
+            timer: asyncio.Task[None] | None = data.get(CALLBACK_TIMER_KEY)
+            if timer:
+                timer.cancel()
+                with suppress(asyncio.CancelledError):
+                    await timer
+            if isinstance(event, CallbackQuery):
+                await self._acknowledge(bot, event)
+
+    async def _acknowledge_later(self, bot: Bot, event: CallbackQuery) -> None:
+        await asyncio.sleep(self.budget_seconds)
+        await self._acknowledge(bot, event)
+
+    async def _acknowledge(self, bot: Bot, event: CallbackQuery) -> None:
+        if self.tracker.is_answered(event.id):
+            return
+        try:
+            await bot.answer_callback_query(event.id)
+        except TelegramBadRequest as exc:
+            logger.info("Callback acknowledgement failed: id=%s error=%s", event.id, exc)
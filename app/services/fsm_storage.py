@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+from copy import deepcopy
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.repositories.fsm_repository import FSMRepository
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL_SECONDS = 3600
+
+
+@dataclass
+class _Entry:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        repo: FSMRepository,
+        cache_seconds: float = 5,
+        state_ttl: timedelta = timedelta(days=1),
+        write_through: bool = False,
+    ):
+        self.repo = repo
+        self.cache_seconds = 0 if write_through else cache_seconds
+        self.state_ttl = state_ttl
+        self.write_through = write_through
+        self._entries: dict[str, _Entry] = {}
+        self._dirty: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._purged_at = 0.0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._touch(key, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = deepcopy(data)
+        await self._touch(key, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return deepcopy((await self._entry(key)).data)
+
+    async def close(self) -> None:
+        await self.flush()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            keys = list(self._dirty)
+            self._dirty.clear()
+            saved: list[tuple[str, str | None, dict[str, Any], datetime]] = []
+            deleted: list[str] = []
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry.state is None and not entry.data:
+                    deleted.append(key)
+                else:
+                    saved.append((key, entry.state, entry.data, entry.updated_at))
+            try:
+                await self.repo.save_many(saved)
+                await self.repo.delete_many(deleted)
+            except Exception:
+                self._dirty.update(keys)
+                raise
+            self._evict()
+            return len(keys)
+
+    async def purge_expired(self) -> int:
+        now = time.monotonic()
+        if now - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return 0
+        self._purged_at = now
+        purged = await self.repo.purge(datetime.utcnow() - self.state_ttl)
+        if purged:
+            logger.info("Expired FSM states purged: count=%s", purged)
+        return purged
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.cache_seconds
+        for key in [key for key, entry in self._entries.items() if entry.loaded_at < cutoff]:
+            if key not in self._dirty:
+                del self._entries[key]
+
+    async def _touch(self, key: StorageKey, entry: _Entry) -> None:
+        entry.updated_at = datetime.utcnow()
+        entry.loaded_at = time.monotonic()
+        self._dirty.add(_storage_key(key))
+        if self.write_through:
+            await self.flush()
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        storage_key = _storage_key(key)
+        entry = self._entries.get(storage_key)
+        if entry and (
+            storage_key in self._dirty
+            or time.monotonic() - entry.loaded_at < self.cache_seconds
+        ):
+            return self._expire(entry)
+        row = await self.repo.get(storage_key)
+        cached = self._entries.get(storage_key)
+        if cached and storage_key in self._dirty:
+            return self._expire(cached)
+        entry = _Entry(*row) if row else _Entry()
+        self._entries[storage_key] = entry
+        return self._expire(entry)
+
+    def _expire(self, entry: _Entry) -> _Entry:
+        if (entry.state is not None or entry.data) and datetime.utcnow() - entry.updated_at > self.state_ttl:
+            entry.state = None
+            entry.data = {}
+        return entry
+
+
+def _storage_key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+async def fsm_flush_loop(storage: SQLiteStorage, interval_seconds: float = 1) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await storage.flush()
+            await storage.purge_expired()
+        except Exception:
+            logger.exception("Failed to flush FSM storage")
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+from app.models.job import Job
+from app.repositories.job_repository import JobRepository
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Job], Awaitable[None]]
+FailureHandler = Callable[[Job, Exception, bool], Awaitable[None]]
+
+
+def _backoff_delay_seconds(attempts: int, base_delay: int, max_delay: int) -> int:
+    delay = base_delay * (2**max(attempts - 1, 0))
+    return min(delay, max_delay)
+
+
+@dataclass
+class _Registration:
+    handler: JobHandler
+    on_failure: FailureHandler | None
+    max_attempts: int
+
+
+class JobQueue:
+    def __init__(
+        self,
+        repo: JobRepository,
+        workers: int = 4,
+        visibility_timeout: timedelta = timedelta(minutes=5),
+        max_idle: float = 60.0,
+        base_delay: int = 30,
+        max_delay: int = 900,
+    ):
+        self.repo = repo
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.max_idle = max_idle
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.owner = f"worker-{uuid4().hex[:8]}"
+        self._handlers: dict[str, _Registration] = {}
+        self._wakeup = asyncio.Event()
+        self._in_flight: set[asyncio.Task[None]] = set()
+        self._draining = False
+
+    def register(
+        self,
+        kind: str,
+        handler: JobHandler,
+        on_failure: FailureHandler | None = None,
+        max_attempts: int = 5,
+    ) -> None:
+        self._handlers[kind] = _Registration(handler, on_failure, max_attempts)
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: dict[str, Any],
+        dedup_key: str | None = None,
+        delay: timedelta | None = None,
+    ) -> bool:
+        run_at = datetime.utcnow() + delay if delay else None
+        enqueued = await self.repo.enqueue(kind, payload, dedup_key=dedup_key, run_at=run_at)
+        if enqueued:
+            self._wakeup.set()
+        return enqueued
+
+    async def drain(self, timeout: float) -> int:
+        self._draining = True
+        self._wakeup.set()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._in_flight:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.wait(set(self._in_flight), timeout=remaining)
+        return len(self._in_flight)
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        try:
+            while True:
+                if self._draining:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                if len(self._in_flight) >= self.workers:
+                    await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                self._wakeup.clear()
+                try:
+                    wait = await self._seconds_until_due()
+                    jobs = [] if wait > 0 else await self.repo.lease(
+                        self.owner,
+                        self.workers - len(self._in_flight),
+                        self.visibility_timeout,
+                    )
+                except Exception:
+                    logger.exception("Job scheduler failed to poll the queue")
+                    wait, jobs = self.max_idle, []
+                if not jobs:
+                    if wait <= 0:
+                        wait = min(self.max_idle, 0.5)
+                    with suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                    continue
+                for job in jobs:
+                    task = asyncio.create_task(self._execute(job))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._on_task_done)
+        finally:
+            for task in self._in_flight:
+                task.cancel()
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def _on_task_done(self, task: asyncio.Task[None]) -> None:
+        self._in_flight.discard(task)
+        self._wakeup.set()
+
+    async def _seconds_until_due(self) -> float:
+        next_due = await self.repo.next_due_at()
+        if next_due is None:
+            return self.max_idle
+        return min((next_due - datetime.utcnow()).total_seconds(), self.max_idle)
+
+    async def _execute(self, job: Job) -> None:
+        registration = self._handlers.get(job.kind)
+        if not registration:
+            logger.error("No handler registered for job: id=%s kind=%s", job.id, job.kind)
+            await self.repo.mark_dead(job.id, self.owner, job.attempts, f"Unknown job kind: {job.kind}")
+            return
+        handler = asyncio.create_task(registration.handler(job))
+        renewal = asyncio.create_task(self._renew_lease(job, handler))
+        try:
+            await handler
+        except asyncio.CancelledError:
+            logger.warning("Job interrupted, releasing lease: id=%s kind=%s", job.id, job.kind)
+            await self.repo.reschedule(job.id, self.owner, job.attempts, datetime.utcnow(), "Interrupted by shutdown")
+            raise
+        except Exception as exc:
+            final = job.attempts >= registration.max_attempts
+            logger.exception(
+                "Job failed: id=%s kind=%s attempt=%s final=%s",
+                job.id,
+                job.kind,
+                job.attempts,
+                final,
+            )
+            if final:
+                owned = await self.repo.mark_dead(job.id, self.owner, job.attempts, str(exc))
+            else:
+                delay = _backoff_delay_seconds(job.attempts, self.base_delay, self.max_delay)
+                owned = await self.repo.reschedule(
+                    job.id,
+                    self.owner,
+                    job.attempts,
+                    datetime.utcnow() + timedelta(seconds=delay),
+                    str(exc),
+                )
+            if registration.on_failure and owned:
+                try:
+                    await registration.on_failure(job, exc, final)
+                except Exception:
+                    logger.exception("Job failure hook failed: id=%s kind=%s", job.id, job.kind)
+            return
+        finally:
+            renewal.cancel()
+            with suppress(asyncio.CancelledError):
+                await renewal
+        if not await self.repo.complete(job.id, self.owner, job.attempts):
+            logger.warning("Job finished after its lease was lost: id=%s kind=%s", job.id, job.kind)
+
+    async def _renew_lease(self, job: Job, handler: asyncio.Task[None]) -> None:
+        interval = self.visibility_timeout.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await self.repo.renew(job.id, self.owner, job.attempts, self.visibility_timeout)
+            except Exception:
+                logger.exception("Job lease renewal failed: id=%s kind=%s", job.id, job.kind)
+                continue
+            if not renewed:
+                logger.error("Job lease lost, stopping handler: id=%s kind=%s", job.id, job.kind)
+                handler.cancel()
+                return
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from app.repositories.lease_repository import LeaseRepository
+
+logger = logging.getLogger(__name__)
+
+SingletonFactory = Callable[[], Awaitable[None]]
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+class LeaderElector:
+    def __init__(
+        self,
+        repo: LeaseRepository,
+        name: str = "background",
+        lease_seconds: float = 30,
+        heartbeat_seconds: float = 10,
+    ):
+        self.repo = repo
+        self.name = name
+        self.lease = timedelta(seconds=lease_seconds)
+        self.heartbeat_seconds = min(heartbeat_seconds, lease_seconds / 2)
+        self.owner = INSTANCE_ID
+        self._singletons: list[SingletonFactory] = []
+        self._tasks: list[asyncio.Task[None]] = []
+        self._valid_until = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return bool(self._tasks)
+
+    def singleton(self, factory: SingletonFactory) -> None:
+        self._singletons.append(factory)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    acquired = await self.repo.acquire(self.name, self.owner, self.lease)
+                except Exception:
+                    logger.exception("Leader heartbeat failed: lease=%s", self.name)
+                    acquired = self.is_leader and time.monotonic() < self._valid_until
+                else:
+                    if acquired:
+                        self._valid_until = started + self.lease.total_seconds()
+                if acquired and not self.is_leader:
+                    await self._promote()
+                elif not acquired and self.is_leader:
+                    logger.warning("Leadership lost: lease=%s owner=%s", self.name, self.owner)
+                    await self._demote()
+                await asyncio.sleep(self.heartbeat_seconds)
+        finally:
+            if self.is_leader:
+                logger.info("Leadership released: lease=%s owner=%s", self.name, self.owner)
+                await self._demote()
+                try:
+                    await self.repo.release(self.name, self.owner)
+                except Exception:
+                    logger.exception("Failed to release leader lease: lease=%s", self.name)
+
+    async def _promote(self) -> None:
+        logger.info("Leadership acquired: lease=%s owner=%s", self.name, self.owner)
+        self._tasks = [asyncio.create_task(factory()) for factory in self._singletons]
+
+    async def _demote(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
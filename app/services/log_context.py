@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 from contextvars import ContextVar, Token
+import time
 
 RequestContext = dict[str, str]
 
 _request_context: ContextVar[RequestContext] = ContextVar("request_context", default={})
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
 
 
 def set_request_context(context: RequestContext) -> Token:
@@ -17,3 +19,22 @@ def reset_request_context(token: Token) -> None:
 
 def get_request_context() -> RequestContext:
     return _request_context.get()
+
+
+def set_deadline(budget_seconds: float) -> Token:
+    deadline = time.monotonic() + budget_seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token: Token) -> None:
+    _deadline.reset(token)
+
+
+def get_remaining_time() -> float | None:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
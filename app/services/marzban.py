@@ -3,11 +3,19 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 import logging
 import asyncio
+import re
 from typing import Any, Awaitable, Callable
 
 import aiohttp
 
 from app.services.log_context import get_request_context
+from app.services.retry_policy import RetryPolicy, parse_retry_after
+
+USER_ROUTE = re.compile(r"^/api/user/[^/?]+")
+
+
+def _route_template(path: str) -> str:
+    return USER_ROUTE.sub("/api/user/{username}", path.split("?", 1)[0])
 
 
 class MarzbanService:
@@ -15,7 +23,9 @@ class MarzbanService:
         self,
         base_url: str,
         api_key: str,
-        notify_admin: Callable[[str], Awaitable[None]] | None = None,
+        notify_admin: Callable[..., Awaitable[None]] | None = None,
+        retry_policy: RetryPolicy | None = None,
+        pool_size: int = 20,
     ):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
@@ -23,6 +33,8 @@ class MarzbanService:
         self._logger = logging.getLogger(__name__)
         self._session: aiohttp.ClientSession | None = None
         self._notify_admin = notify_admin
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._pool_size = pool_size
 
     async def close(self) -> None:
         if self._session:
@@ -31,14 +43,27 @@ class MarzbanService:
 
     async def _get_session(self) -> aiohttp.ClientSession:
         if not self._session or self._session.closed:
-            self._session = aiohttp.ClientSession()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size),
+            )
         return self._session
 
-    async def _request(self, method: str, path: str, json: dict[str, Any] | None = None) -> dict[str, Any]:
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        json: dict[str, Any] | None = None,
+        idempotent: bool | None = None,
+    ) -> dict[str, Any]:
         context = get_request_context()
         context_str = f"context={context}" if context else "context=none"
-        retries = 3
+        policy = self._retry_policy
+        if idempotent is None:
+            idempotent = policy.is_idempotent(method)
+        retries = policy.max_attempts
+        token_refreshed = False
         for attempt in range(retries):
+            timeout = policy.attempt_timeout()
             token = await self._get_token()
             headers = {"Authorization": f"Bearer {token}"} if token else {}
             session = await self._get_session()
@@ -47,11 +72,12 @@ class MarzbanService:
                     method,
                     f"{self.base_url}{path}",
                     json=json,
-                    timeout=15,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
                     headers=headers,
                 ) as resp:
                     if resp.status == 401:
-                        if self._can_refresh_token() and attempt == 0:
+                        if self._can_refresh_token() and not token_refreshed:
+                            token_refreshed = True
                             self._token = None
                             continue
                         self._logger.error(
@@ -62,8 +88,10 @@ class MarzbanService:
                             context_str,
                         )
                         if self._notify_admin:
+                            route = _route_template(path)
                             await self._notify_admin(
-                                f"⚠️ Marzban auth error ({resp.status}) on {path}."
+                                f"⚠️ Marzban auth error ({resp.status}) on {route}.",
+                                key=f"marzban:{self.base_url}:auth:{route}",
                             )
                         resp.raise_for_status()
                     if resp.status == 404:
@@ -77,13 +105,33 @@ class MarzbanService:
                             context_str,
                         )
                         if self._notify_admin:
+                            route = _route_template(path)
                             await self._notify_admin(
-                                f"⚠️ Marzban API route not found ({path})."
+                                f"⚠️ Marzban API route not found ({route}).",
+                                key=f"marzban:{self.base_url}:not_found:{route}",
                             )
                         resp.raise_for_status()
-                    if resp.status in {502, 503, 504} and attempt < retries - 1:
-                        await asyncio.sleep(2**attempt)
-                        continue
+                    if (
+                        resp.status in policy.retry_statuses
+                        and idempotent
+                        and attempt < retries - 1
+                    ):
+                        delay = policy.backoff(
+                            attempt,
+                            parse_retry_after(resp.headers.get("Retry-After")),
+                        )
+                        if policy.fits_deadline(delay):
+                            self._logger.warning(
+                                "Marzban API retry %s %s: status=%s attempt=%s delay=%.2f %s",
+                                method,
+                                path,
+                                resp.status,
+                                attempt + 1,
+                                delay,
+                                context_str,
+                            )
+                            await asyncio.sleep(delay)
+                            continue
                     if resp.status >= 400:
                         body = await resp.text()
                         self._logger.error(
@@ -102,9 +150,12 @@ class MarzbanService:
                     except aiohttp.ContentTypeError:
                         return {}
             except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
-                if attempt < retries - 1:
-                    await asyncio.sleep(2**attempt)
-                    continue
+                retryable = idempotent or isinstance(exc, aiohttp.ClientConnectorError)
+                if retryable and attempt < retries - 1:
+                    delay = policy.backoff(attempt)
+                    if policy.fits_deadline(delay):
+                        await asyncio.sleep(delay)
+                        continue
                 self._logger.error(
                     "Marzban API connection error %s %s: error=%s %s",
                     method,
@@ -123,14 +174,14 @@ class MarzbanService:
         if self._token is not None:
             return self._token
         username, password = [part.strip() for part in self.api_key.split(":", maxsplit=1)]
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/api/admin/token",
-                data={"username": username, "password": password},
-                timeout=15,
-            ) as resp:
-                resp.raise_for_status()
-                data = await resp.json()
+        session = await self._get_session()
+        async with session.post(
+            f"{self.base_url}/api/admin/token",
+            data={"username": username, "password": password},
+            timeout=aiohttp.ClientTimeout(total=self._retry_policy.attempt_timeout()),
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
         self._token = data.get("access_token") or data.get("token") or ""
         return self._token
 
@@ -163,11 +214,16 @@ class MarzbanService:
                 payload["proxies"] = {proxy: proxy_settings}
             if inbounds:
                 payload["inbounds"] = {proxy: inbounds}
-        return await self._request("POST", "/api/user", json=payload)
+        return await self._request("POST", "/api/user", json=payload, idempotent=False)
 
     async def renew_user(self, username: str, add_days: timedelta) -> dict[str, Any]:
         payload = {"add_days": add_days.days}
-        return await self._request("POST", f"/api/user/{username}/renew", json=payload)
+        return await self._request(
+            "POST",
+            f"/api/user/{username}/renew",
+            json=payload,
+            idempotent=False,
+        )
 
     async def update_user_expire(self, username: str, expire_at: datetime) -> dict[str, Any]:
         payload = {"expire": int(expire_at.timestamp())}
@@ -188,6 +244,24 @@ class MarzbanService:
             return {}
         return await self._request("PUT", f"/api/user/{username}", json=payload)
 
+    async def modify_user(
+        self,
+        username: str,
+        expire_at: datetime | None = None,
+        traffic_gb: float | None = None,
+        traffic_reset_period: str | None = None,
+    ) -> dict[str, Any]:
+        payload: dict[str, Any] = {}
+        if expire_at is not None:
+            payload["expire"] = int(expire_at.timestamp())
+        if traffic_gb is not None:
+            payload["data_limit"] = int(traffic_gb * 1024**3)
+        if traffic_reset_period:
+            payload["data_limit_reset"] = traffic_reset_period
+        if not payload:
+            return {}
+        return await self._request("PUT", f"/api/user/{username}", json=payload)
+
     async def get_user(self, username: str) -> dict[str, Any]:
         return await self._request("GET", f"/api/user/{username}")
 
@@ -202,3 +276,44 @@ class MarzbanService:
             or data.get("subscription_link")
             or ""
         )
+
+    async def list_users(
+        self,
+        offset: int = 0,
+        limit: int = 500,
+        status: str | None = None,
+    ) -> tuple[list[dict[str, Any]], int]:
+        path = f"/api/users?offset={offset}&limit={limit}"
+        if status:
+            path = f"{path}&status={status}"
+        data = await self._request("GET", path)
+        users = data.get("users") if isinstance(data, dict) else None
+        total = data.get("total") if isinstance(data, dict) else None
+        if not isinstance(users, list):
+            users = []
+        return users, int(total) if isinstance(total, int) else len(users)
+
+    async def iter_users(self, page_size: int = 500, status: str | None = None) -> list[dict[str, Any]]:
+        offset = 0
+        collected: list[dict[str, Any]] = []
+        while True:
+            page, total = await self.list_users(offset, page_size, status)
+            collected.extend(page)
+            offset += len(page)
+            if not page or offset >= total:
+                return collected
+
+    async def get_nodes(self) -> list[dict[str, Any]]:
+        data = await self._request("GET", "/api/nodes")
+        return data if isinstance(data, list) else []
+
+    async def get_nodes_usage(self, start: datetime, end: datetime) -> list[dict[str, Any]]:
+        data = await self._request(
+            "GET",
+            f"/api/nodes/usage?start={start.strftime('%Y-%m-%dT%H:%M:%S')}&end={end.strftime('%Y-%m-%dT%H:%M:%S')}",
+        )
+        usages = data.get("usages") if isinstance(data, dict) else None
+        return usages if isinstance(usages, list) else []
+
+    async def get_system_stats(self) -> dict[str, Any]:
+        return await self._request("GET", "/api/system")
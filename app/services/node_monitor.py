@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+from typing import Any, Awaitable, Callable
+
+from app.config import Settings
+from app.services.panels import PanelRegistry
+
+logger = logging.getLogger(__name__)
+
+USAGE_WINDOW = timedelta(hours=1)
+
+
+@dataclass
+class NodeLoad:
+    panel_id: str
+    node_id: int | None
+    name: str
+    status: str
+    bandwidth_mbps: float
+    load: float
+    inbounds: list[str] = field(default_factory=list)
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def is_connected(self) -> bool:
+        return self.status == "connected"
+
+
+class NodeMonitor:
+    def __init__(
+        self,
+        settings: Settings,
+        panels: PanelRegistry,
+        notify_admin: Callable[..., Awaitable[None]] | None = None,
+    ):
+        self.settings = settings
+        self.panels = panels
+        self._notify_admin = notify_admin
+        self._nodes: dict[str, list[NodeLoad]] = {}
+        self._system: dict[str, dict[str, Any]] = {}
+        self._pending: dict[tuple[str, str], int] = {}
+        self._alerted: set[tuple[str, str]] = set()
+
+    def choose_node(self, panel_id: str) -> NodeLoad | None:
+        node = self.recommended_node(panel_id)
+        if node:
+            key = (panel_id, node.name)
+            self._pending[key] = self._pending.get(key, 0) + 1
+        return node
+
+    def recommended_node(self, panel_id: str) -> NodeLoad | None:
+        candidates = [node for node in self._nodes.get(panel_id, []) if node.is_connected]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda item: self._effective_load(item))
+
+    def _effective_load(self, node: NodeLoad) -> float:
+        pending = self._pending.get((node.panel_id, node.name), 0)
+        capacity = self.settings.node_capacity_mbps or 1
+        return node.load + pending * self.settings.node_user_estimate_mbps / capacity
+
+    async def poll(self) -> None:
+        results = await asyncio.gather(
+            *(self._poll_panel(panel_id) for panel_id in self.panels.ids),
+            return_exceptions=True,
+        )
+        for panel_id, result in zip(self.panels.ids, results):
+            if isinstance(result, Exception):
+                logger.warning("Node stats poll failed: panel=%s error=%s", panel_id, result)
+
+    async def _poll_panel(self, panel_id: str) -> None:
+        marzban = self.panels.get(panel_id)
+        now = datetime.utcnow()
+        nodes, usages, system = await asyncio.gather(
+            marzban.get_nodes(),
+            marzban.get_nodes_usage(now - USAGE_WINDOW, now),
+            marzban.get_system_stats(),
+        )
+        traffic_by_name: dict[str, int] = {}
+        for usage in usages:
+            name = str(usage.get("node_name") or "")
+            traffic_by_name[name] = int(usage.get("uplink") or 0) + int(usage.get("downlink") or 0)
+        capacity = self.settings.node_capacity_mbps or 1
+        loads: list[NodeLoad] = []
+        for node in nodes:
+            name = str(node.get("name") or node.get("id") or "")
+            bandwidth_mbps = traffic_by_name.get(name, 0) * 8 / USAGE_WINDOW.total_seconds() / 10**6
+            loads.append(
+                NodeLoad(
+                    panel_id=panel_id,
+                    node_id=node.get("id"),
+                    name=name,
+                    status=str(node.get("status") or "unknown"),
+                    bandwidth_mbps=bandwidth_mbps,
+                    load=bandwidth_mbps / capacity,
+                    inbounds=list(self.settings.marzban_node_inbounds.get(name, [])),
+                    updated_at=now,
+                )
+            )
+        self._nodes[panel_id] = loads
+        self._system[panel_id] = system
+        for key in [key for key in self._pending if key[0] == panel_id]:
+            del self._pending[key]
+        await self._check_thresholds(panel_id, loads, system)
+
+    async def _check_thresholds(
+        self,
+        panel_id: str,
+        loads: list[NodeLoad],
+        system: dict[str, Any],
+    ) -> None:
+        threshold = self.settings.node_load_alert_threshold
+        alerts: list[str] = []
+        for node in loads:
+            key = (panel_id, f"node:{node.name}")
+            if not node.is_connected:
+                if key not in self._alerted:
+                    self._alerted.add(key)
+                    alerts.append(f"🔴 Нода {node.name} ({panel_id}) недоступна: status={node.status}")
+            elif node.load >= threshold:
+                if key not in self._alerted:
+                    self._alerted.add(key)
+                    alerts.append(
+                        f"⚠️ Нода {node.name} ({panel_id}) загружена на {node.load:.0%} "
+                        f"({node.bandwidth_mbps:.0f} Mbps). Пора добавлять ноду."
+                    )
+            else:
+                self._alerted.discard(key)
+        cpu_usage = system.get("cpu_usage") if isinstance(system, dict) else None
+        key = (panel_id, "panel:cpu")
+        if isinstance(cpu_usage, (int, float)) and cpu_usage / 100 >= threshold:
+            if key not in self._alerted:
+                self._alerted.add(key)
+                alerts.append(f"⚠️ CPU панели {panel_id} загружен на {cpu_usage:.0f}%.")
+        else:
+            self._alerted.discard(key)
+        if alerts and self._notify_admin:
+            await self._notify_admin("\n".join(alerts))
+
+
+async def node_monitor_loop(monitor: NodeMonitor, interval_seconds: int = 60) -> None:
+    while True:
+        try:
+            await monitor.poll()
+        except Exception:
+            logger.exception("Node monitor poll failed")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from datetime import datetime, timedelta
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import InlineKeyboardMarkup
+
+from app.config import Settings
+from app.models.outbox import OutboxMessage
+from app.repositories.outbox_repository import OutboxRepository
+from app.services.rate_limit import TokenBucket
+from app.services.reachability import ReachabilityTracker
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ACCESS = 0
+PRIORITY_NOTICE = 1
+PRIORITY_ADMIN = 2
+
+VISIBILITY_TIMEOUT = timedelta(seconds=60)
+MAX_IDLE = 30.0
+MAX_BACKOFF_SECONDS = 300
+SENT_RETENTION = timedelta(days=7)
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class Outbox:
+    def __init__(
+        self,
+        bot: Bot,
+        settings: Settings,
+        repo: OutboxRepository,
+        reachability: ReachabilityTracker | None = None,
+    ):
+        self.bot = bot
+        self.settings = settings
+        self.repo = repo
+        self.reachability = reachability
+        self.workers = max(settings.outbox_workers, 1)
+        self._bucket = TokenBucket(settings.outbox_rate_per_second)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_sent_at: dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        self._in_flight: set[asyncio.Task[None]] = set()
+        self._draining = False
+        self._purged_at = 0.0
+
+    async def send(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int = PRIORITY_NOTICE,
+        reply_markup: InlineKeyboardMarkup | None = None,
+        key: str | None = None,
+    ) -> bool:
+        markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+        enqueued = await self.repo.enqueue(chat_id, text, priority, markup, key)
+        if enqueued:
+            self._wakeup.set()
+        else:
+            logger.info("Outbox message already queued: key=%s", key)
+        return enqueued
+
+    async def notify_admins(self, text: str, key: str | None = None) -> None:
+        await asyncio.gather(
+            *(
+                self.send(
+                    admin_id,
+                    text,
+                    PRIORITY_ADMIN,
+                    key=f"{key}:{admin_id}" if key else None,
+                )
+                for admin_id in self.settings.telegram_admin_ids
+            )
+        )
+
+    async def drain(self, timeout: float) -> int:
+        self._draining = True
+        self._wakeup.set()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._in_flight:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.wait(set(self._in_flight), timeout=remaining)
+        return len(self._in_flight)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                if self._draining:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                if len(self._in_flight) >= self.workers:
+                    await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                paused = self._bucket.paused_for()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    continue
+                self._wakeup.clear()
+                try:
+                    await self._purge()
+                    wait = await self._seconds_until_due()
+                    messages = [] if wait > 0 else await self.repo.lease(
+                        self.workers - len(self._in_flight),
+                        VISIBILITY_TIMEOUT,
+                    )
+                except Exception:
+                    logger.exception("Outbox failed to poll the queue")
+                    wait, messages = MAX_IDLE, []
+                if not messages:
+                    with suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0.5))
+                    continue
+                for message in messages:
+                    task = asyncio.create_task(self._execute(message))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._on_task_done)
+        finally:
+            for task in self._in_flight:
+                task.cancel()
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def _on_task_done(self, task: asyncio.Task[None]) -> None:
+        self._in_flight.discard(task)
+        self._wakeup.set()
+
+    async def _seconds_until_due(self) -> float:
+        next_due = await self.repo.next_due_at()
+        if next_due is None:
+            return MAX_IDLE
+        return min((next_due - datetime.utcnow()).total_seconds(), MAX_IDLE)
+
+    async def _purge(self) -> None:
+        now = time.monotonic()
+        if now - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = now
+        self._prune_chat_state(now)
+        purged = await self.repo.purge_sent(datetime.utcnow() - SENT_RETENTION)
+        if purged:
+            logger.info("Outbox purged sent messages: count=%s", purged)
+
+    def _prune_chat_state(self, now: float) -> None:
+        cutoff = now - self.settings.outbox_per_chat_interval_seconds
+        for chat_id, sent_at in list(self._chat_sent_at.items()):
+            if sent_at <= cutoff:
+                del self._chat_sent_at[chat_id]
+        for chat_id, lock in list(self._chat_locks.items()):
+            if not lock.locked() and chat_id not in self._chat_sent_at:
+                del self._chat_locks[chat_id]
+
+    def _chat_lock(self, chat_id: int) -> asyncio.Lock:
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._chat_locks[chat_id] = lock
+        return lock
+
+    async def _execute(self, message: OutboxMessage) -> None:
+        try:
+            async with self._chat_lock(message.chat_id):
+                delay = (
+                    self._chat_sent_at.get(message.chat_id, 0.0)
+                    + self.settings.outbox_per_chat_interval_seconds
+                    - time.monotonic()
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._bucket.acquire()
+                if not await self.repo.renew(message.id, message.attempts, VISIBILITY_TIMEOUT):
+                    logger.info("Outbox lease expired before sending, skipping: id=%s", message.id)
+                    return
+                try:
+                    await self._deliver(message)
+                finally:
+                    self._chat_sent_at[message.chat_id] = time.monotonic()
+        except asyncio.CancelledError:
+            await self.repo.reschedule(
+                message.id,
+                datetime.utcnow(),
+                "Interrupted by shutdown",
+                count_attempt=False,
+            )
+            raise
+        except TelegramRetryAfter as exc:
+            logger.warning(
+                "Outbox throttled by Telegram: id=%s retry_after=%s",
+                message.id,
+                exc.retry_after,
+            )
+            self._bucket.pause(exc.retry_after)
+            await self.repo.reschedule(
+                message.id,
+                datetime.utcnow() + timedelta(seconds=exc.retry_after),
+                f"Retry after {exc.retry_after}s",
+                count_attempt=False,
+            )
+        except (TelegramForbiddenError, TelegramBadRequest) as exc:
+            logger.info("Outbox message dropped: id=%s chat_id=%s error=%s", message.id, message.chat_id, exc)
+            await self.repo.mark_dead(message.id, exc.message)
+            if self.reachability:
+                await self.reachability.record_failure(message.chat_id, exc)
+        except (TelegramNetworkError, TelegramServerError) as exc:
+            if message.attempts >= self.settings.outbox_max_attempts:
+                logger.error("Outbox message failed permanently: id=%s chat_id=%s", message.id, message.chat_id)
+                await self.repo.mark_dead(message.id, str(exc))
+                return
+            delay = min(2 ** message.attempts, MAX_BACKOFF_SECONDS)
+            logger.warning(
+                "Outbox send failed: id=%s attempt=%s retry_in=%ss error=%s",
+                message.id,
+                message.attempts,
+                delay,
+                exc,
+            )
+            await self.repo.reschedule(message.id, datetime.utcnow() + timedelta(seconds=delay), str(exc))
+        except Exception:
+            logger.exception("Outbox message failed: id=%s", message.id)
+            await self.repo.mark_dead(message.id, "Unexpected error")
+        else:
+            await self.repo.mark_sent(message.id)
+            if self.reachability:
+                await self.reachability.record_success(message.chat_id)
+
+    async def _deliver(self, message: OutboxMessage) -> None:
+        reply_markup = (
+            InlineKeyboardMarkup.model_validate_json(message.reply_markup)
+            if message.reply_markup
+            else None
+        )
+        await self.bot.send_message(message.chat_id, message.text, reply_markup=reply_markup)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+from bisect import bisect
+import hashlib
+from typing import Awaitable, Callable
+
+from app.config import PanelSettings
+from app.services.marzban import MarzbanService
+from app.services.retry_policy import RetryPolicy
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class PanelRegistry:
+    VIRTUAL_NODES = 64
+
+    def __init__(
+        self,
+        panels: list[PanelSettings],
+        notify_admin: Callable[..., Awaitable[None]] | None = None,
+        retry_policy: RetryPolicy | None = None,
+        pool_size: int = 20,
+    ):
+        if not panels:
+            raise ValueError("At least one Marzban panel must be configured")
+        self._settings = {panel.id: panel for panel in panels}
+        self._services = {
+            panel.id: MarzbanService(
+                panel.base_url,
+                panel.api_key,
+                notify_admin=notify_admin,
+                retry_policy=retry_policy,
+                pool_size=pool_size,
+            )
+            for panel in panels
+        }
+        self.default_id = panels[0].id
+        self._rings: dict[str | None, tuple[list[int], list[str]]] = {}
+        self._build_rings()
+
+    def _build_rings(self) -> None:
+        regions: set[str | None] = {None}
+        regions.update(panel.region for panel in self._settings.values() if panel.region)
+        for region in regions:
+            points: list[tuple[int, str]] = []
+            for panel in self._settings.values():
+                if not panel.accepts_new_users:
+                    continue
+                if region is not None and panel.region != region:
+                    continue
+                for replica in range(self.VIRTUAL_NODES * max(panel.weight, 1)):
+                    points.append((_ring_hash(f"{panel.id}#{replica}"), panel.id))
+            if points:
+                points.sort()
+                self._rings[region] = ([point[0] for point in points], [point[1] for point in points])
+
+    @property
+    def ids(self) -> list[str]:
+        return list(self._services)
+
+    def services(self) -> list[tuple[str, MarzbanService]]:
+        return list(self._services.items())
+
+    def get(self, panel_id: str | None) -> MarzbanService:
+        return self._services.get(panel_id or self.default_id) or self._services[self.default_id]
+
+    def settings_for(self, panel_id: str | None) -> PanelSettings:
+        return self._settings.get(panel_id or self.default_id) or self._settings[self.default_id]
+
+    def resolve_id(self, panel_id: str | None) -> str:
+        if panel_id and panel_id in self._services:
+            return panel_id
+        return self.default_id
+
+    def assign(self, telegram_id: int, region: str | None = None) -> str:
+        ring = self._rings.get(region) or self._rings.get(None)
+        if not ring:
+            return self.default_id
+        hashes, owners = ring
+        index = bisect(hashes, _ring_hash(str(telegram_id))) % len(hashes)
+        return owners[index]
+
+    async def close(self) -> None:
+        await asyncio.gather(*(service.close() for service in self._services.values()))
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from app.config import Settings
+from app.keyboards.common import connection_keyboard
+from app.models.job import Job
+from app.repositories.payment_repository import PaymentRepository
+from app.services.alerts import AlertAggregator
+from app.services.jobs import JobQueue
+from app.services.outbox import PRIORITY_ACCESS, PRIORITY_NOTICE, Outbox
+from app.services.subscription import SubscriptionService
+
+logger = logging.getLogger(__name__)
+
+PROVISION_PAYMENT = "provision_payment"
+
+
+async def send_access_message(
+    outbox: Outbox,
+    telegram_id: int,
+    subscription_link: str,
+    key: str | None = None,
+) -> None:
+    keyboard = connection_keyboard(subscription_link) if subscription_link else None
+    if not keyboard:
+        logger.warning("Access link invalid for connection button: %s", subscription_link)
+        await outbox.send(
+            telegram_id,
+            "Оплата прошла успешно, но ссылка на подписку пока не готова. Напиши в поддержку.",
+            PRIORITY_ACCESS,
+            key=key,
+        )
+        return
+    await outbox.send(
+        telegram_id,
+        "🛡 DagDev VPN\n"
+        "━━━━━━━━━━━━\n"
+        "Ваш VPN готов.\n"
+        "Нажмите кнопку ниже, чтобы подключиться.",
+        PRIORITY_ACCESS,
+        reply_markup=keyboard,
+        key=key,
+    )
+
+
+class PaymentJobs:
+    def __init__(
+        self,
+        outbox: Outbox,
+        settings: Settings,
+        payment_repo: PaymentRepository,
+        subscription_service: SubscriptionService,
+        job_queue: JobQueue,
+        alerts: AlertAggregator | None = None,
+    ):
+        self.outbox = outbox
+        self.alerts = alerts
+        self.settings = settings
+        self.payment_repo = payment_repo
+        self.subscription_service = subscription_service
+        self.job_queue = job_queue
+        job_queue.register(
+            PROVISION_PAYMENT,
+            self.handle_provision,
+            on_failure=self.handle_failure,
+            max_attempts=settings.payment_max_attempts,
+        )
+
+    def _dedup_key(self, invoice_id: str) -> str:
+        return f"payment:{invoice_id}"
+
+    async def enqueue(self, invoice_id: str) -> bool:
+        return await self.job_queue.enqueue(
+            PROVISION_PAYMENT,
+            {"invoice_id": invoice_id},
+            dedup_key=self._dedup_key(invoice_id),
+        )
+
+    async def requeue(self, invoice_id: str) -> bool:
+        if await self.enqueue(invoice_id):
+            return True
+        return await self.job_queue.repo.requeue(self._dedup_key(invoice_id))
+
+    async def ingest(self, invoice_id: str, amount_minor: int | None = None) -> bool:
+        if await self.payment_repo.mark_paid(invoice_id, amount_minor):
+            await self.enqueue(invoice_id)
+            await self.payment_repo.finish_event(invoice_id, "accepted")
+            return True
+        invoice = await self.payment_repo.get_invoice(invoice_id)
+        if not invoice:
+            outcome = "unknown_invoice"
+            await self._notify_admins(
+                "⚠️ Оплата получена, но инвойс не найден.\n"
+                f"Invoice: {invoice_id}",
+                "unknown_invoice",
+                invoice_id,
+            )
+        elif invoice.status == "pending":
+            outcome = "amount_mismatch"
+            await self._notify_admins(
+                "⚠️ Сумма оплаты не совпадает с инвойсом.\n"
+                f"Invoice: {invoice_id}\n"
+                f"Ожидалось: {invoice.amount_minor}, получено: {amount_minor}",
+                "amount_mismatch",
+                invoice_id,
+            )
+        else:
+            outcome = "duplicate"
+        logger.info("Payment event not accepted: invoice_id=%s outcome=%s", invoice_id, outcome)
+        await self.payment_repo.finish_event(invoice_id, outcome)
+        return False
+
+    async def retry_received_events(self, min_age_seconds: int = 0) -> int:
+        retried = 0
+        for invoice_id, amount_minor in await self.payment_repo.list_received_events(min_age_seconds):
+            try:
+                await self.ingest(invoice_id, amount_minor)
+            except Exception:
+                logger.exception("Payment ingestion retry failed: invoice_id=%s", invoice_id)
+                continue
+            retried += 1
+        if retried:
+            logger.info("Stuck payment events ingested: count=%s", retried)
+        return retried
+
+    async def enqueue_recoverable(self) -> int:
+        await self.retry_received_events()
+        enqueued = 0
+        for invoice in await self.payment_repo.list_recoverable():
+            if await self.enqueue(invoice.invoice_id):
+                enqueued += 1
+        if enqueued:
+            logger.info("Recovered payments enqueued: count=%s", enqueued)
+        return enqueued
+
+    async def handle_provision(self, job: Job) -> None:
+        invoice_id = str(job.payload["invoice_id"])
+        user = await self.subscription_service.process_payment_success(invoice_id)
+        if not user:
+            await self.payment_repo.mark_failed(invoice_id, "Invoice not found during provisioning")
+            await self._notify_admins(
+                "⚠️ Выдача не выполнена: инвойс не найден.\n"
+                f"Invoice: {invoice_id}",
+                "provision_missing",
+                invoice_id,
+            )
+            return
+        await send_access_message(
+            self.outbox,
+            user.telegram_id,
+            user.subscription_link or "",
+            key=f"access:{invoice_id}",
+        )
+
+    async def handle_failure(self, job: Job, exc: Exception, final: bool) -> None:
+        invoice_id = str(job.payload["invoice_id"])
+        if final:
+            await self.payment_repo.mark_failed(invoice_id, str(exc) or "Max retry attempts exceeded")
+            await self._notify_admins(
+                "❗️Платеж помечен как failed после максимума попыток.\n"
+                f"Invoice: {invoice_id}",
+                "payment_failed",
+                invoice_id,
+            )
+            return
+        await self.payment_repo.mark_paid_pending(invoice_id, str(exc))
+        if job.attempts > 1:
+            return
+        await self._notify_admins(
+            "⚠️ Оплата принята, но выдача доступа отложена.\n"
+            f"Invoice: {invoice_id}\n"
+            f"Ошибка: {exc}",
+            "provision_delayed",
+            invoice_id,
+        )
+        invoice = await self.payment_repo.get_invoice(invoice_id)
+        if invoice:
+            await self.outbox.send(
+                invoice.telegram_id,
+                "Оплата подтверждена, но выдача доступа задержана. Мы уже работаем над этим.",
+                PRIORITY_NOTICE,
+                key=f"provision_delayed:{invoice_id}",
+            )
+
+    async def _notify_admins(self, text: str, kind: str, invoice_id: str) -> None:
+        if self.alerts:
+            await self.alerts.notify(text, key=f"payments:{kind}:{invoice_id}")
+        else:
+            await self.outbox.notify_admins(text)
+
+
+async def payment_event_sweep_loop(payment_jobs: PaymentJobs, interval_seconds: int = 60) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await payment_jobs.retry_received_events(min_age_seconds=interval_seconds)
+        except Exception:
+            logger.exception("Failed to sweep received payment events")
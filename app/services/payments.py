@@ -1,17 +1,34 @@
 from __future__ import annotations
 
+from datetime import datetime
 import hashlib
+import hmac
+import json
+import logging
 from uuid import uuid4
 
 from app.config import Settings
-from app.models.payment import PaymentInvoice
+from app.models.payment import PaymentInvoice, PaymentResult
 from app.repositories.payment_repository import PaymentRepository
+from app.services.tariffs import TariffCatalog
+
+logger = logging.getLogger(__name__)
+
+PAID_STATUSES = {"paid", "succeeded", "success"}
 
 
 class PaymentService:
-    def __init__(self, settings: Settings, payment_repo: PaymentRepository):
+    def __init__(
+        self,
+        settings: Settings,
+        payment_repo: PaymentRepository,
+        tariff_catalog: TariffCatalog | None = None,
+    ):
         self.settings = settings
         self.payment_repo = payment_repo
+        self.tariff_catalog = tariff_catalog or TariffCatalog(settings)
+        self._webhook_key = settings.payment_webhook_secret.encode() if settings.payment_webhook_secret else None
+        self._robokassa_password = settings.robokassa_password2 or None
 
     async def create_invoice(self, user_id: int, tariff_code: str, amount_minor: int) -> PaymentInvoice:
         invoice_id = self._unique_invoice_id()
@@ -35,37 +52,58 @@ class PaymentService:
             payment_url=payment_url,
         )
 
-    def _unique_invoice_id(self) -> str:
-        return f"inv_{uuid4().hex}"
-
-    def _payload_for_tariff(self, tariff_code: str) -> str:
-        payloads = {
-            "m1": "vpn_1m",
-            "m3": "vpn_3m",
-            "m6": "vpn_6m",
-            "m12": "vpn_12m",
-        }
-        return payloads.get(tariff_code, hashlib.sha1(tariff_code.encode()).hexdigest())
-
-
-def payload_to_days(payload: str) -> int:
-    mapping = {
-        "vpn_1m": 30,
-        "vpn_3m": 90,
-        "vpn_6m": 180,
-        "vpn_12m": 365,
-    }
-    return mapping.get(payload, 0)
-
-
-def simulate_payload_mapping() -> dict[str, int]:
-    return {
-        "vpn_1m": payload_to_days("vpn_1m"),
-        "vpn_3m": payload_to_days("vpn_3m"),
-        "vpn_6m": payload_to_days("vpn_6m"),
-        "vpn_12m": payload_to_days("vpn_12m"),
-    }
+    async def verify_webhook(self, payload: str, signature: str) -> PaymentResult | None:
+        if not self._webhook_key:
+            logger.warning("Payment webhook rejected: PAYMENT_WEBHOOK_SECRET is not configured")
+            return None
+        expected = hmac.new(self._webhook_key, payload.encode(), hashlib.sha256).hexdigest()
+        provided = signature.strip().lower().removeprefix("sha256=")
+        if not hmac.compare_digest(expected, provided):
+            logger.warning("Payment webhook rejected: invalid signature")
+            return None
+        try:
+            data = json.loads(payload)
+            invoice_id = str(data.get("invoice_id") or data.get("order_id") or "")
+            amount = float(data["amount"])
+        except (ValueError, TypeError, KeyError, AttributeError):
+            logger.warning("Payment webhook rejected: malformed payload")
+            return None
+        if not invoice_id:
+            return None
+        return PaymentResult(
+            invoice_id=invoice_id,
+            status=str(data.get("status") or "").lower(),
+            amount=amount,
+            currency=str(data.get("currency") or self.settings.payment_currency),
+            paid_at=datetime.utcnow(),
+        )
 
+    async def verify_robokassa(self, form: dict[str, str]) -> PaymentResult | None:
+        if not self._robokassa_password:
+            logger.warning("Robokassa callback rejected: ROBOKASSA_PASSWORD2 is not configured")
+            return None
+        out_sum = form.get("OutSum", "")
+        inv_id = form.get("InvId", "")
+        shp = sorted((key, value) for key, value in form.items() if key.lower().startswith("shp_"))
+        base = ":".join([out_sum, inv_id, self._robokassa_password, *(f"{key}={value}" for key, value in shp)])
+        expected = hashlib.md5(base.encode()).hexdigest().upper()
+        if not hmac.compare_digest(expected, form.get("SignatureValue", "").upper()):
+            logger.warning("Robokassa callback rejected: invalid signature")
+            return None
+        try:
+            amount = float(out_sum)
+        except ValueError:
+            return None
+        invoice_id = form.get("Shp_invoice_id") or inv_id
+        if not invoice_id:
+            return None
+        return PaymentResult(
+            invoice_id=invoice_id,
+            status="paid",
+            amount=amount,
+            currency=self.settings.payment_currency,
+            paid_at=datetime.utcnow(),
+        )
 
-if __name__ == "__main__":
-    print(simulate_payload_mapping())
+    def _unique_invoice_id(self) -> str:
+        return f"inv_{uuid4().hex}"
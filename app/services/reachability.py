@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from app.repositories.user_repository import UserRepository
+
+logger = logging.getLogger(__name__)
+
+UNREACHABLE_BAD_REQUESTS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+
+def unreachable_reason(exc: Exception) -> str | None:
+    if isinstance(exc, TelegramForbiddenError):
+        return exc.message
+    if isinstance(exc, TelegramBadRequest):
+        message = exc.message.lower()
+        if any(marker in message for marker in UNREACHABLE_BAD_REQUESTS):
+            return exc.message
+    return None
+
+
+class ReachabilityTracker:
+    def __init__(self, user_repo: UserRepository):
+        self.user_repo = user_repo
+        self._unreachable: set[int] = set()
+
+    @property
+    def unreachable_count(self) -> int:
+        return len(self._unreachable)
+
+    async def load(self) -> int:
+        self._unreachable = set(await self.user_repo.list_unreachable_ids())
+        return len(self._unreachable)
+
+    def is_reachable(self, telegram_id: int) -> bool:
+        return telegram_id not in self._unreachable
+
+    async def record_success(self, telegram_id: int) -> None:
+        if telegram_id in self._unreachable:
+            self._unreachable.discard(telegram_id)
+            await self.user_repo.mark_reachable(telegram_id)
+            logger.info("Chat reachable again: telegram_id=%s", telegram_id)
+
+    async def record_failure(self, telegram_id: int, exc: Exception) -> bool:
+        reason = unreachable_reason(exc)
+        if reason is None:
+            return False
+        if telegram_id not in self._unreachable:
+            self._unreachable.add(telegram_id)
+            await self.user_repo.mark_unreachable(telegram_id, reason)
+            logger.info("Chat marked unreachable: telegram_id=%s reason=%s", telegram_id, reason)
+        return True
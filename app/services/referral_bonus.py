@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from app.repositories.referral_repository import ReferralRepository
+from app.services.subscription import SubscriptionService
+
+logger = logging.getLogger(__name__)
+
+
+class ReferralBonusApplier:
+    def __init__(
+        self,
+        referral_repo: ReferralRepository,
+        subscription_service: SubscriptionService,
+        concurrency: int = 4,
+    ):
+        self.referral_repo = referral_repo
+        self.subscription_service = subscription_service
+        self.concurrency = concurrency
+
+    async def apply_pending(self) -> int:
+        totals = await self.referral_repo.claim_pending_bonuses()
+        if not totals:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def apply(referrer_id: int, days: int) -> bool:
+            async with semaphore:
+                try:
+                    await self.subscription_service.apply_bonus_days(referrer_id, days)
+                except Exception:
+                    logger.exception(
+                        "Failed to apply referral bonus: referrer=%s days=%s",
+                        referrer_id,
+                        days,
+                    )
+                    await self.referral_repo.finish_bonuses(referrer_id, applied=False)
+                    return False
+                await self.referral_repo.finish_bonuses(referrer_id, applied=True)
+                logger.info("Referral bonus applied: referrer=%s days=%s", referrer_id, days)
+                return True
+
+        results = await asyncio.gather(*(apply(referrer_id, days) for referrer_id, days in totals))
+        return sum(1 for applied in results if applied)
+
+
+async def referral_bonus_loop(applier: ReferralBonusApplier, interval_seconds: int = 300) -> None:
+    released = await applier.referral_repo.release_stale_claims()
+    if released:
+        logger.warning("Released interrupted referral bonus claims: count=%s", released)
+    while True:
+        try:
+            await applier.apply_pending()
+        except Exception:
+            logger.exception("Referral bonus applier failed")
+        await asyncio.sleep(interval_seconds)
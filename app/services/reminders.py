@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import asyncio
+from contextlib import suppress
 from datetime import datetime, timedelta
+import heapq
 import logging
 
 from aiogram import Bot
@@ -9,47 +11,184 @@ from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 
 from app.keyboards.common import renew_keyboard
 from app.repositories.user_repository import UserRepository
+from app.services.reachability import ReachabilityTracker
 
 logger = logging.getLogger(__name__)
 
+REMINDER_OFFSETS = {
+    "reminder_3d_sent": timedelta(days=3),
+    "reminder_1d_sent": timedelta(days=1),
+    "expired_notice_sent": timedelta(),
+}
+LOOKAHEAD = max(REMINDER_OFFSETS.values())
+EXPIRED_GRACE = timedelta(days=1)
+EXPIRY_TOLERANCE = timedelta(seconds=60)
+RETRY_DELAY = timedelta(minutes=5)
 
-async def reminder_loop(
-    bot: Bot,
-    user_repo: UserRepository,
-    interval_seconds: int = 3600,
-) -> None:
-    while True:
-        try:
-            await send_expiry_reminders(bot, user_repo)
-        except Exception:
-            logger.exception("Failed to send expiry reminders")
-        await asyncio.sleep(interval_seconds)
 
+class ReminderScheduler:
+    def __init__(
+        self,
+        bot: Bot,
+        user_repo: UserRepository,
+        concurrency: int = 8,
+        horizon: timedelta = timedelta(hours=6),
+        reachability: ReachabilityTracker | None = None,
+        reload_interval: timedelta = timedelta(minutes=5),
+    ):
+        self.bot = bot
+        self.user_repo = user_repo
+        self.reachability = reachability
+        self.concurrency = concurrency
+        self.horizon = horizon
+        self.reload_interval = reload_interval
+        self._reloaded_at: datetime | None = None
+        self._heap: list[tuple[datetime, int, str, datetime]] = []
+        self._loaded_until: datetime | None = None
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, telegram_id: int, expires_at: datetime | None) -> None:
+        if expires_at is None or self._loaded_until is None or expires_at > self._loaded_until:
+            return
+        self._push(telegram_id, expires_at, datetime.utcnow())
+        self._wakeup.set()
+
+    def _push(
+        self,
+        telegram_id: int,
+        expires_at: datetime,
+        now: datetime,
+        sent: tuple[bool, bool, bool] = (False, False, False),
+    ) -> None:
+        for (column, offset), already_sent in zip(REMINDER_OFFSETS.items(), sent):
+            if already_sent or not _is_relevant(column, expires_at, now):
+                continue
+            heapq.heappush(self._heap, (expires_at - offset, telegram_id, column, expires_at))
 
-async def send_expiry_reminders(bot: Bot, user_repo: UserRepository) -> None:
-    now = datetime.utcnow()
-    until = now + timedelta(days=3)
-    rows = await user_repo.list_expiring_users(now.isoformat(), until.isoformat())
-    for telegram_id, expires_at_raw, reminder_3d_sent, reminder_1d_sent in rows:
+    async def load_until(self, until: datetime) -> int:
+        now = datetime.utcnow()
+        start = self._loaded_until or now - EXPIRED_GRACE
+        if until <= start:
+            return 0
+        rows = await self.user_repo.list_expiring_users(start, until)
+        for telegram_id, expires_at, sent_3d, sent_1d, sent_expired in rows:
+            self._push(telegram_id, expires_at, now, (sent_3d, sent_1d, sent_expired))
+        self._loaded_until = until
+        return len(rows)
+
+    def _reset(self) -> None:
+        self._heap.clear()
+        self._loaded_until = None
+        self._reloaded_at = None
+
+    async def run(self) -> None:
         try:
-            expires_at = datetime.fromisoformat(expires_at_raw)
-        except (TypeError, ValueError):
-            continue
-        days_left = (expires_at.date() - now.date()).days
-        if days_left == 3 and not reminder_3d_sent:
-            await _send_reminder(bot, telegram_id, 3)
-            await user_repo.mark_reminder_sent(telegram_id, 3)
-        elif days_left == 1 and not reminder_1d_sent:
-            await _send_reminder(bot, telegram_id, 1)
-            await user_repo.mark_reminder_sent(telegram_id, 1)
-
-
-async def _send_reminder(bot: Bot, telegram_id: int, days_left: int) -> None:
-    if days_left == 1:
+            await self._run()
+        finally:
+            self._reset()
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.utcnow()
+            try:
+                if self._reloaded_at is None or now - self._reloaded_at >= self.reload_interval:
+                    self._reset()
+                    self._reloaded_at = now
+                if self._loaded_until is None or self._loaded_until < now + LOOKAHEAD:
+                    await self.load_until(now + LOOKAHEAD + self.horizon)
+                due: list[tuple[datetime, int, str, datetime]] = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+                if due:
+                    await self._dispatch(due)
+                    continue
+            except Exception:
+                logger.exception("Reminder scheduler failed")
+            next_refill = min(
+                (self._loaded_until or now) - LOOKAHEAD,
+                (self._reloaded_at or now) + self.reload_interval,
+            )
+            next_due = self._heap[0][0] if self._heap else next_refill
+            wait = max((min(next_due, next_refill) - datetime.utcnow()).total_seconds(), 1.0)
+            self._wakeup.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+
+    async def _dispatch(self, due: list[tuple[datetime, int, str, datetime]]) -> None:
+        now = datetime.utcnow()
+        states = await self.user_repo.get_reminder_states(sorted({entry[1] for entry in due}))
+        columns = list(REMINDER_OFFSETS)
+        targets: dict[tuple[int, str], datetime] = {}
+        for _, telegram_id, column, expires_at in due:
+            state = states.get(telegram_id)
+            if not state or state[0] is None:
+                continue
+            current_expires_at, *sent = state
+            if abs(current_expires_at - expires_at) >= EXPIRY_TOLERANCE:
+                continue
+            if sent[columns.index(column)] or not _is_relevant(column, current_expires_at, now):
+                continue
+            if self.reachability and not self.reachability.is_reachable(telegram_id):
+                continue
+            targets[(telegram_id, column)] = current_expires_at
+        if not targets:
+            return
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def notify(telegram_id: int, column: str) -> bool:
+            async with semaphore:
+                try:
+                    await _send_reminder(
+                        self.bot,
+                        telegram_id,
+                        REMINDER_OFFSETS[column].days,
+                        self.reachability,
+                    )
+                except Exception:
+                    logger.exception("Reminder failed, retrying later: telegram_id=%s", telegram_id)
+                    heapq.heappush(
+                        self._heap,
+                        (now + RETRY_DELAY, telegram_id, column, targets[(telegram_id, column)]),
+                    )
+                    return False
+                return True
+
+        keys = list(targets)
+        results = await asyncio.gather(*(notify(telegram_id, column) for telegram_id, column in keys))
+        sent_keys = [key for key, sent in zip(keys, results) if sent]
+        for column in columns:
+            sent_ids = [telegram_id for telegram_id, sent_column in sent_keys if sent_column == column]
+            if sent_ids:
+                await self.user_repo.mark_reminders_sent(column, sent_ids)
+        logger.info("Expiry reminders sent: count=%s", len(sent_keys))
+
+
+def _is_relevant(column: str, expires_at: datetime, now: datetime) -> bool:
+    if column == "reminder_3d_sent":
+        return now < expires_at - timedelta(days=2)
+    if column == "reminder_1d_sent":
+        return now < expires_at
+    return now < expires_at + EXPIRED_GRACE
+
+
+async def _send_reminder(
+    bot: Bot,
+    telegram_id: int,
+    days_left: int,
+    reachability: ReachabilityTracker | None = None,
+) -> None:
+    if days_left <= 0:
+        text = "⌛️ Подписка закончилась.\nПродли её, чтобы VPN снова заработал."
+    elif days_left == 1:
         text = "⏳ До конца подписки остался 1 день.\nПродлить сейчас?"
     else:
         text = f"⏳ До конца подписки осталось {days_left} дня.\nПродлить сейчас?"
     try:
         await bot.send_message(telegram_id, text, reply_markup=renew_keyboard())
-    except (TelegramForbiddenError, TelegramBadRequest):
+    except (TelegramForbiddenError, TelegramBadRequest) as exc:
         logger.info("Reminder skipped: telegram_id=%s", telegram_id)
+        if reachability:
+            await reachability.record_failure(telegram_id, exc)
+        return
+    if reachability:
+        await reachability.record_success(telegram_id)
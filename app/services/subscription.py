@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime, timedelta
 import asyncio
 import logging
@@ -10,13 +10,18 @@ from typing import Optional
 
 import aiohttp
 
-from app.config import TARIFFS, Settings
+from app.config import Settings
 from app.models.tariff import DEFAULT_TRAFFIC_LIMIT_GB, Tariff
 from app.models.user import User
 from app.repositories.payment_repository import PaymentRepository
+from app.repositories.referral_repository import ReferralRepository
+from app.repositories.usage_repository import UsageRepository
 from app.repositories.user_repository import UserRepository
 from app.services.marzban import MarzbanService
+from app.services.node_monitor import NodeMonitor
+from app.services.panels import PanelRegistry
 from app.services.log_context import set_request_context, reset_request_context
+from app.services.tariffs import TariffCatalog
 
 
 class SubscriptionService:
@@ -28,29 +33,80 @@ class SubscriptionService:
         settings: Settings,
         user_repo: UserRepository,
         payment_repo: PaymentRepository,
-        marzban: MarzbanService,
+        panels: PanelRegistry,
+        node_monitor: NodeMonitor | None = None,
+        usage_repo: UsageRepository | None = None,
+        referral_repo: ReferralRepository | None = None,
+        tariff_catalog: TariffCatalog | None = None,
     ):
         self.settings = settings
         self.user_repo = user_repo
         self.payment_repo = payment_repo
-        self.marzban = marzban
+        self.panels = panels
+        self.node_monitor = node_monitor
+        self.usage_repo = usage_repo
+        self.referral_repo = referral_repo
+        self.tariff_catalog = tariff_catalog or TariffCatalog(settings)
         self._logger = logging.getLogger(__name__)
         self._locks: dict[int, asyncio.Lock] = {}
 
     @asynccontextmanager
-    async def _user_lock(self, telegram_id: int) -> object:
+    async def user_lock(self, telegram_id: int) -> object:
         lock = self._locks.setdefault(telegram_id, asyncio.Lock())
         async with lock:
             yield
 
+    def _panel_id_for(self, telegram_id: int, existing: User | None) -> str:
+        if existing:
+            return self.panels.resolve_id(existing.panel_id)
+        return self.panels.assign(telegram_id)
+
+    def _inbounds_for(self, panel_id: str) -> list[str] | None:
+        if self.node_monitor:
+            node = self.node_monitor.choose_node(panel_id)
+            if node and node.inbounds:
+                self._logger.info(
+                    "Assigning least-loaded node: panel=%s node=%s load=%.2f",
+                    panel_id,
+                    node.name,
+                    node.load,
+                )
+                return node.inbounds
+        return self.settings.marzban_inbounds or None
+
+    def recommended_server(self, user: User) -> str | None:
+        if not self.node_monitor:
+            return None
+        node = self.node_monitor.recommended_node(self.panels.resolve_id(user.panel_id))
+        return node.name if node else None
+
     def get_tariff(self, code: str) -> Tariff:
-        plan = TARIFFS[code]
-        return Tariff(
-            code=code,
-            title=plan["title"],
-            price=plan["price"],
-            duration=timedelta(days=plan["days"]),
+        return self.tariff_catalog.get(code)
+
+    async def _load_panel_user(
+        self,
+        marzban: MarzbanService,
+        telegram_id: int,
+        username: str,
+    ) -> dict[str, object] | None:
+        try:
+            marzban_user = await marzban.get_user(username)
+        except aiohttp.ClientResponseError as exc:
+            if exc.status == 404:
+                return None
+            self._logger.exception(
+                "Marzban get_user failed: telegram_id=%s username=%s status=%s",
+                telegram_id,
+                username,
+                exc.status,
+            )
+            raise
+        self._logger.info(
+            "Marzban user found for provisioning: telegram_id=%s username=%s",
+            telegram_id,
+            username,
         )
+        return marzban_user
 
     async def provision_user(
         self,
@@ -59,59 +115,34 @@ class SubscriptionService:
         referral_bonus: timedelta | None = None,
         traffic_limit_gb: float | None = None,
     ) -> User:
-        existing = await self.user_repo.get_by_telegram_id(telegram_id)
-        trial_used_meta, referrer_meta, bonus_applied_meta = await self.user_repo.get_user_meta(telegram_id)
+        default_username = f"tg_{telegram_id}"
+        speculative_panel_id = self.panels.assign(telegram_id)
+        speculative_lookup = asyncio.create_task(
+            self._load_panel_user(self.panels.get(speculative_panel_id), telegram_id, default_username)
+        )
+        try:
+            existing, (trial_used_meta, referrer_meta, bonus_applied_meta) = await asyncio.gather(
+                self.user_repo.get_by_telegram_id(telegram_id),
+                self.user_repo.get_user_meta(telegram_id),
+            )
+        except BaseException:
+            speculative_lookup.cancel()
+            raise
         bonus = referral_bonus or timedelta()
-        now = datetime.utcnow()
-        username = existing.marzban_username if existing else f"tg_{telegram_id}"
+        username = existing.marzban_username if existing else default_username
+        panel_id = self._panel_id_for(telegram_id, existing)
+        marzban = self.panels.get(panel_id)
         created = False
-        marzban_user: dict[str, object] | None = None
 
-        try:
-            marzban_user = await self.marzban.get_user(username)
-            self._logger.info(
-                "Marzban user found for provisioning: telegram_id=%s username=%s",
-                telegram_id,
-                username,
-            )
-        except aiohttp.ClientResponseError as exc:
-            if exc.status == 404:
-                marzban_user = None
-            elif exc.status == 500:
-                self._logger.warning(
-                    "Marzban get_user returned 500, retrying: telegram_id=%s username=%s",
-                    telegram_id,
-                    username,
-                )
-                try:
-                    marzban_user = await self.marzban.get_user(username)
-                except aiohttp.ClientResponseError as retry_exc:
-                    if retry_exc.status == 404:
-                        marzban_user = None
-                    elif retry_exc.status == 500:
-                        self._logger.error(
-                            "Marzban get_user repeated 500, aborting provisioning: telegram_id=%s username=%s",
-                            telegram_id,
-                            username,
-                        )
-                        raise
-                    else:
-                        self._logger.exception(
-                            "Marzban get_user failed after retry: telegram_id=%s username=%s status=%s",
-                            telegram_id,
-                            username,
-                            retry_exc.status,
-                        )
-                        raise
-            else:
-                self._logger.exception(
-                    "Marzban get_user failed: telegram_id=%s username=%s status=%s",
-                    telegram_id,
-                    username,
-                    exc.status,
-                )
-                raise
+        if panel_id == speculative_panel_id and username == default_username:
+            marzban_user = await speculative_lookup
+        else:
+            speculative_lookup.cancel()
+            with suppress(asyncio.CancelledError, aiohttp.ClientError, asyncio.TimeoutError):
+                await speculative_lookup
+            marzban_user = await self._load_panel_user(marzban, telegram_id, username)
 
+        now = datetime.utcnow()
         current_expires_at = (
             self._extract_expire(marzban_user) if marzban_user else None
         ) or (existing.subscription_expires_at if existing else None)
@@ -125,14 +156,14 @@ class SubscriptionService:
 
         if marzban_user is None:
             try:
-                marzban_user = await self.marzban.create_user(
+                marzban_user = await marzban.create_user(
                     username,
                     target_expires_at,
                     traffic_limit,
                     traffic_reset_period,
                     proxy=self.settings.marzban_proxy or None,
                     flow=self.settings.marzban_flow or None,
-                    inbounds=self.settings.marzban_inbounds or None,
+                    inbounds=self._inbounds_for(panel_id),
                 )
                 created = True
                 self._logger.info(
@@ -147,7 +178,7 @@ class SubscriptionService:
                         telegram_id,
                         username,
                     )
-                    marzban_user = await self.marzban.get_user(username)
+                    marzban_user = await marzban.get_user(username)
                 else:
                     self._logger.exception(
                         "Marzban create_user failed: telegram_id=%s username=%s status=%s",
@@ -159,8 +190,17 @@ class SubscriptionService:
 
         if not created:
             add_days = self._calculate_add_days(current_expires_at, target_expires_at)
-            if add_days > 0:
-                await self.marzban.update_user_expire(username, target_expires_at)
+            new_expire = target_expires_at if add_days > 0 else None
+            policy_changed = self._traffic_policy_differs(marzban_user, traffic_limit, traffic_reset_period)
+            if new_expire or policy_changed:
+                updated_user = await marzban.modify_user(
+                    username,
+                    expire_at=new_expire,
+                    traffic_gb=traffic_limit,
+                    traffic_reset_period=traffic_reset_period,
+                )
+                marzban_user = updated_user or marzban_user
+            if new_expire:
                 self._logger.info(
                     "Marzban user renewed: telegram_id=%s username=%s add_days=%s new_expire=%s",
                     telegram_id,
@@ -174,14 +214,9 @@ class SubscriptionService:
                     telegram_id,
                     username,
                 )
-            await self.marzban.update_user_traffic_policy(
-                username,
-                traffic_limit,
-                traffic_reset_period,
-            )
 
         existing_link = existing.subscription_link if existing else None
-        link = existing_link or await self._fetch_subscription_link(username, marzban_user)
+        link = existing_link or await self._fetch_subscription_link(username, marzban_user, panel_id)
         if existing_link:
             self._logger.info(
                 "Using existing subscription link for user: telegram_id=%s username=%s",
@@ -206,6 +241,7 @@ class SubscriptionService:
             referral_bonus_applied=existing.referral_bonus_applied if existing else bonus_applied_meta,
             reminder_3d_sent=False,
             reminder_1d_sent=False,
+            panel_id=panel_id,
         )
         await self.user_repo.upsert_user(user)
         return user
@@ -225,9 +261,9 @@ class SubscriptionService:
             }
         )
         try:
-            async with self._user_lock(invoice.telegram_id):
+            async with self.user_lock(invoice.telegram_id):
                 user = await self.provision_user(invoice.telegram_id, tariff)
-                await self._apply_referral_bonus(invoice.telegram_id)
+                await self._accrue_referral_bonus(invoice.telegram_id)
                 await self.payment_repo.mark_completed(invoice.invoice_id, user.subscription_link)
                 return user
         finally:
@@ -240,13 +276,27 @@ class SubscriptionService:
             price=0.0,
             duration=self.TRIAL_DURATION,
         )
-        async with self._user_lock(telegram_id):
+        async with self.user_lock(telegram_id):
             return await self.provision_user(
                 telegram_id,
                 tariff,
                 traffic_limit_gb=self.TRIAL_TRAFFIC_LIMIT_GB,
             )
 
+    async def apply_bonus_days(self, telegram_id: int, days: int) -> User:
+        bonus_tariff = Tariff(
+            code="referral_bonus",
+            title="Referral bonus",
+            price=0.0,
+            duration=timedelta(),
+        )
+        async with self.user_lock(telegram_id):
+            return await self.provision_user(
+                telegram_id,
+                bonus_tariff,
+                referral_bonus=timedelta(days=days),
+            )
+
     async def get_status_details(
         self,
         telegram_id: int,
@@ -255,10 +305,16 @@ class SubscriptionService:
         if not user:
             return None, None
         username = user.marzban_username or f"tg_{telegram_id}"
+        panel_id = self.panels.resolve_id(user.panel_id)
+        marzban = self.panels.get(panel_id)
         try:
-            marzban_user = await self.marzban.get_user(username)
+            marzban_user = await marzban.get_user(username)
             expires_at = self._extract_expire(marzban_user) or user.subscription_expires_at
-            link = user.subscription_link or await self._fetch_subscription_link(username, marzban_user)
+            link = user.subscription_link or await self._fetch_subscription_link(
+                username,
+                marzban_user,
+                panel_id,
+            )
             if (expires_at != user.subscription_expires_at) or (
                 not user.subscription_link and link and link != user.subscription_link
             ):
@@ -281,6 +337,7 @@ class SubscriptionService:
                     referral_bonus_applied=user.referral_bonus_applied,
                     reminder_3d_sent=user.reminder_3d_sent,
                     reminder_1d_sent=user.reminder_1d_sent,
+                    panel_id=panel_id,
                 ),
                 marzban_user,
             )
@@ -305,10 +362,27 @@ class SubscriptionService:
                     referral_bonus_applied=user.referral_bonus_applied,
                     reminder_3d_sent=user.reminder_3d_sent,
                     reminder_1d_sent=user.reminder_1d_sent,
+                    panel_id=panel_id,
                 ),
                 None,
             )
 
+    async def get_local_status(
+        self,
+        telegram_id: int,
+    ) -> tuple[User | None, dict[str, object] | None]:
+        user = await self.user_repo.get_by_telegram_id(telegram_id)
+        if not user or not self.usage_repo:
+            return user, None
+        counter = await self.usage_repo.get_counter(telegram_id)
+        if not counter:
+            return user, None
+        return user, {
+            "status": counter.panel_status or "",
+            "used_traffic": counter.used_bytes,
+            "updated_at": counter.updated_at,
+        }
+
     async def get_status(self, telegram_id: int) -> User | None:
         user, _ = await self.get_status_details(telegram_id)
         return user
@@ -326,6 +400,18 @@ class SubscriptionService:
                 return None
         return None
 
+    def _traffic_policy_differs(
+        self,
+        marzban_user: dict[str, object] | None,
+        traffic_gb: float,
+        traffic_reset_period: str,
+    ) -> bool:
+        if not marzban_user:
+            return True
+        data_limit = marzban_user.get("data_limit")
+        reset_strategy = marzban_user.get("data_limit_reset_strategy")
+        return data_limit != int(traffic_gb * 1024**3) or reset_strategy != traffic_reset_period
+
     def _calculate_add_days(self, current_expires_at: datetime, new_expires_at: datetime) -> int:
         delta_seconds = (new_expires_at - current_expires_at).total_seconds()
         if delta_seconds <= 0:
@@ -336,6 +422,7 @@ class SubscriptionService:
         self,
         username: str,
         marzban_user: dict[str, object] | None,
+        panel_id: str | None = None,
     ) -> str:
         link = ""
         if not link and marzban_user:
@@ -351,50 +438,45 @@ class SubscriptionService:
             elif isinstance(links, str):
                 link = links
         if not link:
-            base_url = self.settings.public_base_url or self.settings.marzban_base_url
+            base_url = self._public_base_url(panel_id)
             link = urljoin(base_url.rstrip("/") + "/", f"sub/{username}")
-        normalized = self._ensure_absolute_link(link)
+        normalized = self._ensure_absolute_link(link, panel_id)
         if not normalized:
             self._logger.warning("Subscription link missing/invalid: username=%s", username)
         return normalized
 
-    def _ensure_absolute_link(self, link: str) -> str:
+    def _public_base_url(self, panel_id: str | None) -> str:
+        panel = self.panels.settings_for(panel_id)
+        return panel.public_base_url or panel.base_url
+
+    def _ensure_absolute_link(self, link: str, panel_id: str | None = None) -> str:
         if not link:
             return ""
         parsed = urlparse(link)
         if parsed.scheme and parsed.netloc:
             return link
         if link.startswith("/"):
-            base_url = self.settings.public_base_url or self.settings.marzban_base_url
+            base_url = self._public_base_url(panel_id)
             return urljoin(base_url.rstrip("/") + "/", link.lstrip("/"))
         return ""
 
-    async def _apply_referral_bonus(self, invitee_id: int) -> None:
+    async def _accrue_referral_bonus(self, invitee_id: int) -> None:
+        if not self.referral_repo:
+            return
         referrer_id = await self.user_repo.get_referrer_id(invitee_id)
         if not referrer_id or referrer_id == invitee_id:
             return
         marked = await self.user_repo.try_mark_referral_bonus_applied(invitee_id)
         if not marked:
             return
-        bonus_days = timedelta(days=self.settings.referral_bonus_days)
-        bonus_tariff = Tariff(
-            code="referral_bonus",
-            title="Referral bonus",
-            price=0.0,
-            duration=timedelta(),
+        await self.referral_repo.accrue_bonus(
+            referrer_id,
+            invitee_id,
+            self.settings.referral_bonus_days,
+        )
+        self._logger.info(
+            "Referral bonus accrued: invitee=%s referrer=%s days=%s",
+            invitee_id,
+            referrer_id,
+            self.settings.referral_bonus_days,
         )
-        try:
-            async with self._user_lock(referrer_id):
-                await self.provision_user(referrer_id, bonus_tariff, referral_bonus=bonus_days)
-            self._logger.info(
-                "Referral bonus applied: invitee=%s referrer=%s days=%s",
-                invitee_id,
-                referrer_id,
-                self.settings.referral_bonus_days,
-            )
-        except Exception:
-            self._logger.exception(
-                "Failed to apply referral bonus: invitee=%s referrer=%s",
-                invitee_id,
-                referrer_id,
-            )
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+import logging
+from types import MappingProxyType
+from typing import Mapping
+
+from aiogram.types import InlineKeyboardMarkup, LabeledPrice
+
+from app.config import TARIFFS, Settings
+from app.keyboards.common import tariffs_keyboard
+from app.models.tariff import Tariff
+from app.repositories.tariff_repository import TariffRepository
+
+logger = logging.getLogger(__name__)
+
+
+def to_minor_units(amount: float) -> int:
+    value = Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return int(value * 100)
+
+
+@dataclass(frozen=True)
+class TariffOffer:
+    tariff: Tariff
+    amount_minor: int
+    prices: list[LabeledPrice]
+    is_active: bool
+
+
+@dataclass(frozen=True)
+class TariffIndex:
+    offers: Mapping[str, TariffOffer]
+    keyboard: InlineKeyboardMarkup
+    fingerprint: str
+
+
+def build_index(
+    rows: list[tuple[str, str, int, float, bool]],
+    currency: str,
+    fingerprint: str = "",
+) -> TariffIndex:
+    offers: dict[str, TariffOffer] = {}
+    for code, title, days, price, is_active in rows:
+        tariff = Tariff(code=code, title=title, price=price, duration=timedelta(days=days))
+        amount_minor = to_minor_units(price)
+        offers[code] = TariffOffer(
+            tariff=tariff,
+            amount_minor=amount_minor,
+            prices=[LabeledPrice(label=title, amount=amount_minor)],
+            is_active=is_active,
+        )
+    active = [offer.tariff for offer in offers.values() if offer.is_active]
+    return TariffIndex(
+        offers=MappingProxyType(offers),
+        keyboard=tariffs_keyboard(active, currency),
+        fingerprint=fingerprint,
+    )
+
+
+class TariffCatalog:
+    def __init__(self, settings: Settings, repo: TariffRepository | None = None):
+        self.settings = settings
+        self.repo = repo
+        self._index = build_index(
+            [
+                (code, plan["title"], plan["days"], plan["price"], True)
+                for code, plan in TARIFFS.items()
+            ],
+            settings.payment_currency,
+        )
+
+    @property
+    def index(self) -> TariffIndex:
+        return self._index
+
+    @property
+    def keyboard(self) -> InlineKeyboardMarkup:
+        return self._index.keyboard
+
+    def offer(self, code: str) -> TariffOffer | None:
+        return self._index.offers.get(code)
+
+    def get(self, code: str) -> Tariff:
+        return self._index.offers[code].tariff
+
+    async def load(self) -> None:
+        if not self.repo:
+            return
+        await self.repo.seed(TARIFFS)
+        await self.reload(force=True)
+
+    async def reload(self, force: bool = False) -> bool:
+        if not self.repo:
+            return False
+        fingerprint = await self.repo.fingerprint()
+        if not force and fingerprint == self._index.fingerprint:
+            return False
+        rows = await self.repo.list_all()
+        self._index = build_index(rows, self.settings.payment_currency, fingerprint)
+        logger.info("Tariff catalog loaded: tariffs=%s fingerprint=%s", len(rows), fingerprint)
+        return True
+
+    async def set_price(self, code: str, price: float) -> bool:
+        if not self.repo or not await self.repo.set_price(code, price):
+            return False
+        await self.reload(force=True)
+        return True
+
+    async def set_active(self, code: str, is_active: bool) -> bool:
+        if not self.repo or not await self.repo.set_active(code, is_active):
+            return False
+        await self.reload(force=True)
+        return True
+
+
+async def tariff_reload_loop(catalog: TariffCatalog, interval_seconds: int = 30) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await catalog.reload()
+        except Exception:
+            logger.exception("Failed to reload tariff catalog")
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.types import TelegramObject, Update, User
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class ExecutorStats:
+    pending: int
+    running: int
+    processed: int
+    avg_wait_ms: float
+    max_wait_ms: float
+
+
+class UpdateExecutor:
+    def __init__(self, workers: int = 32, queue_limit: int = 1000):
+        self.workers = max(workers, 1)
+        self.queue_limit = max(queue_limit, self.workers)
+        self._capacity = asyncio.Semaphore(self.queue_limit)
+        self._lanes: dict[Hashable, deque[tuple[float, Job]]] = {}
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._admitted = 0
+        self._running = 0
+        self._processed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def submit(self, key: Hashable, job: Job) -> None:
+        await self._capacity.acquire()
+        self._admitted += 1
+        self._idle.clear()
+        lane = self._lanes.get(key)
+        if lane is None:
+            self._lanes[key] = deque([(time.monotonic(), job)])
+            self._ready.put_nowait(key)
+        else:
+            lane.append((time.monotonic(), job))
+
+    def stats(self, reset: bool = False) -> ExecutorStats:
+        stats = ExecutorStats(
+            pending=self._admitted - self._running,
+            running=self._running,
+            processed=self._processed,
+            avg_wait_ms=self._wait_total / self._processed * 1000 if self._processed else 0.0,
+            max_wait_ms=self._wait_max * 1000,
+        )
+        if reset:
+            self._processed = 0
+            self._wait_total = 0.0
+            self._wait_max = 0.0
+        return stats
+
+    async def drain(self, timeout: float) -> int:
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+        return self._admitted
+
+    async def run(self, metrics_interval_seconds: float = 60) -> None:
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            while True:
+                await asyncio.sleep(metrics_interval_seconds)
+                stats = self.stats(reset=True)
+                logger.info(
+                    "Update executor: pending=%s running=%s processed=%s avg_wait=%.1fms max_wait=%.1fms",
+                    stats.pending,
+                    stats.running,
+                    stats.processed,
+                    stats.avg_wait_ms,
+                    stats.max_wait_ms,
+                )
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            enqueued_at, job = lane.popleft()
+            wait = time.monotonic() - enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._running += 1
+            try:
+                await job()
+            except Exception:
+                logger.exception("Update handling failed: key=%s", key)
+            finally:
+                self._running -= 1
+                self._admitted -= 1
+                self._processed += 1
+                self._capacity.release()
+                if not self._admitted:
+                    self._idle.set()
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+
+
+class UpdateExecutorMiddleware(BaseMiddleware):
+    def __init__(self, executor: UpdateExecutor):
+        super().__init__()
+        self.executor = executor
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user:
+            key: Hashable = ("user", user.id)
+        elif isinstance(event, Update):
+            key = ("update", event.update_id)
+        else:
+            key = ("event", id(event))
+
+        async def job() -> Any:
+            state: FSMContext | None = data.get("state")
+            if state is not None:
+                data["raw_state"] = await state.get_state()
+            return await handler(event, data)
+
+        await self.executor.submit(key, job)
+        return None
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+import logging
+from typing import Any
+
+from app.config import Settings
+from app.keyboards.common import renew_keyboard
+from app.models.usage import TrafficAccount, TrafficCounter
+from app.repositories.usage_repository import UsageRepository
+from app.repositories.user_repository import UserRepository
+from app.services.outbox import PRIORITY_NOTICE, Outbox
+from app.services.panels import PanelRegistry
+from app.services.reachability import ReachabilityTracker
+
+logger = logging.getLogger(__name__)
+
+HOUR_BUCKET_FORMAT = "%Y-%m-%dT%H"
+
+
+class UsageCollector:
+    def __init__(
+        self,
+        settings: Settings,
+        usage_repo: UsageRepository,
+        user_repo: UserRepository,
+        panels: PanelRegistry,
+    ):
+        self.settings = settings
+        self.usage_repo = usage_repo
+        self.user_repo = user_repo
+        self.panels = panels
+
+    async def collect(self) -> list[tuple[int, int]]:
+        now = datetime.utcnow()
+        accounts = await self.usage_repo.list_tracked_accounts(now.isoformat())
+        by_panel: dict[str, dict[str, TrafficAccount]] = {}
+        for account in accounts:
+            panel_id = self.panels.resolve_id(account.panel_id)
+            by_panel.setdefault(panel_id, {})[account.marzban_username] = account
+        panel_ids = list(by_panel)
+        results = await asyncio.gather(
+            *(self.panels.get(panel_id).iter_users() for panel_id in panel_ids),
+            return_exceptions=True,
+        )
+        counters = await self.usage_repo.list_counters()
+        updated: list[TrafficCounter] = []
+        deltas: list[tuple[int, int]] = []
+        warnings: list[tuple[int, int]] = []
+        expiry_updates: list[tuple[int, datetime]] = []
+        for panel_id, result in zip(panel_ids, results):
+            if isinstance(result, Exception):
+                logger.warning("Usage collection failed: panel=%s error=%s", panel_id, result)
+                continue
+            accounts_by_username = by_panel[panel_id]
+            for panel_user in result:
+                account = accounts_by_username.get(str(panel_user.get("username") or ""))
+                if not account:
+                    continue
+                counter, delta, warn_level = self._advance(
+                    account,
+                    counters.get(account.telegram_id),
+                    panel_user,
+                    now,
+                )
+                updated.append(counter)
+                deltas.append((account.telegram_id, delta))
+                if warn_level:
+                    warnings.append((account.telegram_id, warn_level))
+                expire = panel_user.get("expire")
+                if isinstance(expire, (int, float)) and expire > 0:
+                    panel_expires_at = datetime.utcfromtimestamp(expire)
+                    local_expires_at = account.subscription_expires_at
+                    if not local_expires_at or abs((panel_expires_at - local_expires_at).total_seconds()) >= 1:
+                        expiry_updates.append((account.telegram_id, panel_expires_at))
+        await self.usage_repo.add_hourly_usage(now.strftime(HOUR_BUCKET_FORMAT), deltas)
+        await self.usage_repo.save_counters(updated)
+        await self.user_repo.update_expiries(expiry_updates)
+        cutoff = now - timedelta(days=self.settings.usage_hourly_retention_days)
+        await self.usage_repo.downsample_hourly(cutoff.strftime("%Y-%m-%d"))
+        logger.info(
+            "Usage collected: accounts=%s updated=%s warnings=%s",
+            len(accounts),
+            len(updated),
+            len(warnings),
+        )
+        return warnings
+
+    def _advance(
+        self,
+        account: TrafficAccount,
+        previous: TrafficCounter | None,
+        panel_user: dict[str, Any],
+        now: datetime,
+    ) -> tuple[TrafficCounter, int, int]:
+        used_raw = panel_user.get("used_traffic")
+        used_bytes = int(used_raw) if isinstance(used_raw, (int, float)) else 0
+        limit_raw = panel_user.get("data_limit")
+        data_limit_bytes = int(limit_raw) if isinstance(limit_raw, (int, float)) and limit_raw > 0 else None
+        previous_used = previous.used_bytes if previous else used_bytes
+        warned_percent = previous.warned_percent if previous else 0
+        if used_bytes < previous_used:
+            delta = used_bytes
+            warned_percent = 0
+        else:
+            delta = used_bytes - previous_used
+        limit_bytes = (
+            int(account.traffic_limit_gb * 1024**3)
+            if account.traffic_limit_gb
+            else data_limit_bytes
+        )
+        warn_level = 0
+        if limit_bytes:
+            percent = used_bytes * 100 / limit_bytes
+            crossed = [level for level in self.settings.traffic_warning_thresholds if percent >= level]
+            if crossed and max(crossed) > warned_percent:
+                warn_level = max(crossed)
+                warned_percent = warn_level
+        counter = TrafficCounter(
+            telegram_id=account.telegram_id,
+            used_bytes=used_bytes,
+            data_limit_bytes=data_limit_bytes,
+            panel_status=str(panel_user.get("status") or "") or None,
+            warned_percent=warned_percent,
+            updated_at=now,
+        )
+        return counter, delta, warn_level
+
+
+async def usage_collector_loop(
+    outbox: Outbox,
+    collector: UsageCollector,
+    interval_seconds: int = 600,
+    reachability: ReachabilityTracker | None = None,
+) -> None:
+    while True:
+        try:
+            warnings = await collector.collect()
+            period = datetime.utcnow().strftime(HOUR_BUCKET_FORMAT)
+            for telegram_id, level in warnings:
+                if reachability and not reachability.is_reachable(telegram_id):
+                    continue
+                try:
+                    await _send_usage_warning(outbox, telegram_id, level, period)
+                except Exception:
+                    logger.exception("Failed to queue usage warning: telegram_id=%s", telegram_id)
+        except Exception:
+            logger.exception("Failed to collect traffic usage")
+        await asyncio.sleep(interval_seconds)
+
+
+async def _send_usage_warning(outbox: Outbox, telegram_id: int, level: int, period: str) -> None:
+    if level >= 100:
+        text = "🚫 Лимит трафика исчерпан.\nОн обновится с началом нового периода."
+    else:
+        text = f"📶 Использовано {level}% трафика.\nПродлить подписку заранее?"
+    await outbox.send(
+        telegram_id,
+        text,
+        PRIORITY_NOTICE,
+        reply_markup=renew_keyboard(),
+        key=f"usage:{telegram_id}:{level}:{period}",
+    )
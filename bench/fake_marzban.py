@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import random
+import time
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+from aiohttp import web
+
+GB = 1024**3
+
+
+@dataclass(frozen=True)
+class LatencyProfile:
+    kind: str = "fixed"
+    mean_ms: float = 0.0
+    spread_ms: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(self.mean_ms - self.spread_ms, self.mean_ms + self.spread_ms)
+        elif self.kind == "lognormal":
+            sigma = self.spread_ms / self.mean_ms if self.mean_ms else 0.0
+            value = rng.lognormvariate(0.0, sigma) * self.mean_ms
+        else:
+            value = self.mean_ms
+        return max(value, 0.0) / 1000
+
+
+@dataclass(frozen=True)
+class FaultProfile:
+    name: str
+    latency: LatencyProfile = field(default_factory=LatencyProfile)
+    error_rates: dict[int, float] = field(default_factory=dict)
+    drop_rate: float = 0.0
+    retry_after_seconds: int | None = None
+
+
+FAULT_PROFILES: dict[str, FaultProfile] = {
+    "healthy": FaultProfile("healthy", LatencyProfile("uniform", 20, 10)),
+    "slow": FaultProfile("slow", LatencyProfile("lognormal", 250, 200)),
+    "auth_churn": FaultProfile("auth_churn", LatencyProfile("uniform", 20, 10), {401: 0.05}),
+    "conflicts": FaultProfile("conflicts", LatencyProfile("uniform", 20, 10), {409: 0.05, 422: 0.02}),
+    "server_errors": FaultProfile("server_errors", LatencyProfile("uniform", 30, 20), {500: 0.05}),
+    "gateway_errors": FaultProfile(
+        "gateway_errors",
+        LatencyProfile("uniform", 30, 20),
+        {502: 0.05, 503: 0.05, 504: 0.05},
+        retry_after_seconds=1,
+    ),
+    "missing_routes": FaultProfile("missing_routes", LatencyProfile("uniform", 20, 10), {404: 0.02}),
+    "drops": FaultProfile("drops", LatencyProfile("uniform", 30, 20), drop_rate=0.05),
+    "outage": FaultProfile(
+        "outage",
+        LatencyProfile("lognormal", 400, 400),
+        {500: 0.1, 502: 0.1, 503: 0.1, 504: 0.1},
+        drop_rate=0.1,
+    ),
+}
+
+
+class FakeMarzban:
+    def __init__(
+        self,
+        profile: FaultProfile | None = None,
+        username: str = "admin",
+        password: str = "secret",
+        seed: int | None = None,
+    ):
+        self.profile = profile or FAULT_PROFILES["healthy"]
+        self.username = username
+        self.password = password
+        self.users: dict[str, dict[str, Any]] = {}
+        self.tokens: set[str] = set()
+        self.nodes: list[dict[str, Any]] = [
+            {"id": 1, "name": "DE-1", "address": "10.0.0.1", "status": "connected"},
+            {"id": 2, "name": "DE-2", "address": "10.0.0.2", "status": "connected"},
+        ]
+        self.node_traffic: dict[str, int] = {"DE-1": 0, "DE-2": 0}
+        self.cpu_usage = 15.0
+        self.request_counts: dict[str, int] = {}
+        self.injected_counts: dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    def build(self) -> web.Application:
+        app = web.Application(middlewares=[self._fault_middleware])
+        app.add_routes(
+            [
+                web.post("/api/admin/token", self.handle_token),
+                web.post("/api/user", self.handle_create_user),
+                web.get("/api/user/{username}", self.handle_get_user),
+                web.put("/api/user/{username}", self.handle_modify_user),
+                web.delete("/api/user/{username}", self.handle_delete_user),
+                web.post("/api/user/{username}/renew", self.handle_renew_user),
+                web.get("/api/user/{username}/subscription", self.handle_subscription),
+                web.get("/api/users", self.handle_list_users),
+                web.get("/api/nodes", self.handle_nodes),
+                web.get("/api/nodes/usage", self.handle_nodes_usage),
+                web.get("/api/system", self.handle_system),
+            ]
+        )
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.build())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _count(self, counter: dict[str, int], key: str) -> None:
+        counter[key] = counter.get(key, 0) + 1
+
+    @web.middleware
+    async def _fault_middleware(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self._count(self.request_counts, f"{request.method} {route}")
+        await asyncio.sleep(self.profile.latency.sample(self._rng))
+        if self.profile.drop_rate and self._rng.random() < self.profile.drop_rate:
+            self._count(self.injected_counts, "drop")
+            if request.transport:
+                request.transport.abort()
+            raise asyncio.CancelledError()
+        roll = self._rng.random()
+        for status, rate in self.profile.error_rates.items():
+            if roll < rate:
+                self._count(self.injected_counts, str(status))
+                headers = {}
+                if status in {429, 503} and self.profile.retry_after_seconds is not None:
+                    headers["Retry-After"] = str(self.profile.retry_after_seconds)
+                return web.json_response({"detail": "injected fault"}, status=status, headers=headers)
+            roll -= rate
+        if request.path != "/api/admin/token" and not self._authorized(request):
+            return web.json_response({"detail": "Not authenticated"}, status=401)
+        return await handler(request)
+
+    def _authorized(self, request: web.Request) -> bool:
+        header = request.headers.get("Authorization", "")
+        return header.startswith("Bearer ") and header[7:] in self.tokens
+
+    def _user_payload(self, user: dict[str, Any]) -> dict[str, Any]:
+        return {
+            **user,
+            "subscription_url": f"{self.base_url}/sub/{user['username']}",
+            "links": [f"vless://{user['uuid']}@fake.local:443"],
+        }
+
+    async def handle_token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        if form.get("username") != self.username or form.get("password") != self.password:
+            return web.json_response({"detail": "Incorrect username or password"}, status=401)
+        token = uuid4().hex
+        self.tokens.add(token)
+        return web.json_response({"access_token": token, "token_type": "bearer"})
+
+    async def handle_create_user(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        username = str(payload.get("username") or "")
+        if not username:
+            return web.json_response({"detail": "username required"}, status=422)
+        if username in self.users:
+            return web.json_response({"detail": "User already exists"}, status=409)
+        user = {
+            "username": username,
+            "uuid": str(uuid4()),
+            "status": "active",
+            "expire": payload.get("expire"),
+            "data_limit": payload.get("data_limit"),
+            "data_limit_reset_strategy": payload.get("data_limit_reset", "no_reset"),
+            "used_traffic": 0,
+            "proxies": payload.get("proxies") or {},
+            "inbounds": payload.get("inbounds") or {},
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        self.users[username] = user
+        return web.json_response(self._user_payload(user))
+
+    async def handle_get_user(self, request: web.Request) -> web.Response:
+        user = self.users.get(request.match_info["username"])
+        if not user:
+            return web.json_response({"detail": "User not found"}, status=404)
+        return web.json_response(self._user_payload(user))
+
+    async def handle_modify_user(self, request: web.Request) -> web.Response:
+        user = self.users.get(request.match_info["username"])
+        if not user:
+            return web.json_response({"detail": "User not found"}, status=404)
+        payload = await request.json()
+        if "expire" in payload:
+            user["expire"] = payload["expire"]
+        if "data_limit" in payload:
+            user["data_limit"] = payload["data_limit"]
+        if "data_limit_reset" in payload:
+            user["data_limit_reset_strategy"] = payload["data_limit_reset"]
+        if "inbounds" in payload:
+            user["inbounds"] = payload["inbounds"]
+        if "status" in payload:
+            user["status"] = payload["status"]
+        return web.json_response(self._user_payload(user))
+
+    async def handle_delete_user(self, request: web.Request) -> web.Response:
+        if self.users.pop(request.match_info["username"], None) is None:
+            return web.json_response({"detail": "User not found"}, status=404)
+        return web.json_response({"detail": "User successfully deleted"})
+
+    async def handle_renew_user(self, request: web.Request) -> web.Response:
+        user = self.users.get(request.match_info["username"])
+        if not user:
+            return web.json_response({"detail": "User not found"}, status=404)
+        payload = await request.json()
+        add_days = int(payload.get("add_days") or 0)
+        base = max(int(user.get("expire") or 0), int(time.time()))
+        user["expire"] = int(base + timedelta(days=add_days).total_seconds())
+        return web.json_response(self._user_payload(user))
+
+    async def handle_subscription(self, request: web.Request) -> web.Response:
+        user = self.users.get(request.match_info["username"])
+        if not user:
+            return web.json_response({"detail": "User not found"}, status=404)
+        return web.json_response({"subscription_url": f"{self.base_url}/sub/{user['username']}"})
+
+    async def handle_list_users(self, request: web.Request) -> web.Response:
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", 100))
+        status = request.query.get("status")
+        users = [user for user in self.users.values() if not status or user["status"] == status]
+        page = users[offset : offset + limit]
+        return web.json_response({"users": [self._user_payload(user) for user in page], "total": len(users)})
+
+    async def handle_nodes(self, request: web.Request) -> web.Response:
+        return web.json_response(self.nodes)
+
+    async def handle_nodes_usage(self, request: web.Request) -> web.Response:
+        usages = [
+            {
+                "node_id": node["id"],
+                "node_name": node["name"],
+                "uplink": self.node_traffic.get(node["name"], 0) // 10,
+                "downlink": self.node_traffic.get(node["name"], 0),
+            }
+            for node in self.nodes
+        ]
+        return web.json_response({"usages": usages})
+
+    async def handle_system(self, request: web.Request) -> web.Response:
+        active = sum(1 for user in self.users.values() if user["status"] == "active")
+        return web.json_response(
+            {
+                "cpu_cores": 4,
+                "cpu_usage": self.cpu_usage,
+                "total_user": len(self.users),
+                "users_active": active,
+            }
+        )
+
+
+async def _serve(profile_name: str, port: int) -> None:
+    fake = FakeMarzban(FAULT_PROFILES[profile_name])
+    base_url = await fake.start(port=port)
+    print(f"Fake Marzban ({profile_name}) listening on {base_url}, credentials admin:secret")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fault-injecting Marzban stand-in")
+    parser.add_argument("--profile", default="healthy", choices=sorted(FAULT_PROFILES))
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.profile, args.port))
+    except KeyboardInterrupt:
+        pass
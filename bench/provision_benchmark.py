@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass
+import logging
+import os
+import tempfile
+import time
+
+from app.config import Settings
+from app.db import Database
+from app.repositories.payment_repository import PaymentRepository
+from app.repositories.user_repository import UserRepository
+from app.services.panels import PanelRegistry
+from app.services.retry_policy import RetryPolicy
+from app.services.subscription import SubscriptionService
+from bench.fake_marzban import FAULT_PROFILES, FakeMarzban, FaultProfile
+
+
+@dataclass
+class BenchmarkResult:
+    profile: str
+    total: int
+    succeeded: int
+    failed: int
+    elapsed: float
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+    panel_requests: int
+
+    @property
+    def throughput(self) -> float:
+        return self.succeeded / self.elapsed if self.elapsed else 0.0
+
+    def row(self) -> str:
+        return (
+            f"{self.profile:<15} {self.succeeded:>5}/{self.total:<5} {self.throughput:>8.1f}/s "
+            f"{self.p50_ms:>8.1f} {self.p99_ms:>8.1f} {self.max_ms:>8.1f} {self.panel_requests:>8}"
+        )
+
+
+def _percentile(samples: list[float], percentile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(percentile / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _bench_settings(base_url: str) -> Settings:
+    return Settings(
+        _env_file=None,
+        telegram_token="bench",
+        marzban_base_url=base_url,
+        marzban_api_key="admin:secret",
+        payment_provider_key="bench",
+        payment_public_key="bench",
+        payment_webhook_secret="bench",
+    )
+
+
+async def run_profile(
+    profile: FaultProfile,
+    users: int,
+    concurrency: int,
+    renewals: bool,
+) -> BenchmarkResult:
+    fake = FakeMarzban(profile, seed=42)
+    base_url = await fake.start()
+    settings = _bench_settings(base_url)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(os.path.join(tmp_dir, "bench.db"))
+        await db.connect()
+        panels = PanelRegistry(
+            settings.panel_settings(),
+            retry_policy=RetryPolicy(
+                max_attempts=settings.marzban_max_attempts,
+                base_delay=settings.marzban_backoff_base_seconds,
+                max_delay=settings.marzban_backoff_max_seconds,
+                timeout=settings.marzban_timeout_seconds,
+            ),
+            pool_size=settings.marzban_pool_size,
+        )
+        service = SubscriptionService(
+            settings,
+            UserRepository(db),
+            PaymentRepository(db),
+            panels,
+        )
+        tariff = service.get_tariff("m1")
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: list[float] = []
+        failed = 0
+
+        async def provision(telegram_id: int) -> None:
+            nonlocal failed
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await service.provision_user(telegram_id, tariff)
+                except Exception:
+                    failed += 1
+                    return
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        if renewals:
+            fake.profile = FAULT_PROFILES["healthy"]
+            await asyncio.gather(*(provision(1_000_000 + idx) for idx in range(users)))
+            latencies.clear()
+            failed = 0
+            fake.profile = profile
+            fake.request_counts.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(provision(1_000_000 + idx) for idx in range(users)))
+        elapsed = time.perf_counter() - started
+        await panels.close()
+        await db.close()
+    await fake.stop()
+    return BenchmarkResult(
+        profile=profile.name,
+        total=users,
+        succeeded=len(latencies),
+        failed=failed,
+        elapsed=elapsed,
+        p50_ms=_percentile(latencies, 50),
+        p99_ms=_percentile(latencies, 99),
+        max_ms=max(latencies, default=0.0),
+        panel_requests=sum(fake.request_counts.values()),
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark provision_user against a fake Marzban")
+    parser.add_argument("--profiles", nargs="*", default=sorted(FAULT_PROFILES), choices=sorted(FAULT_PROFILES))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--renewals", action="store_true", help="provision existing users instead of new ones")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    print(f"{'profile':<15} {'ok/total':>11} {'throughput':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'requests':>8}")
+    for name in args.profiles:
+        result = await run_profile(FAULT_PROFILES[name], args.users, args.concurrency, args.renewals)
+        print(result.row())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,78 +1,210 @@
 from __future__ import annotations
 
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 
 import logging
 import asyncio
-from contextlib import suppress
+from contextlib import contextmanager, suppress
+from datetime import timedelta
+import signal
+import time
+from typing import Iterator
 
 from aiogram import Bot, Dispatcher
 
 from app.config import Settings
 from app.db import Database
 from app.handlers import admin, help, install, purchase, renew, start, status, trial
+from app.repositories.broadcast_repository import BroadcastRepository
+from app.repositories.bulk_repository import BulkRepository
+from app.repositories.fsm_repository import FSMRepository
+from app.repositories.job_repository import JobRepository
+from app.repositories.lease_repository import LeaseRepository
+from app.repositories.meta_repository import MetaRepository
+from app.repositories.outbox_repository import OutboxRepository
 from app.repositories.payment_repository import PaymentRepository
 from app.repositories.referral_repository import ReferralRepository
+from app.repositories.tariff_repository import TariffRepository
+from app.repositories.update_repository import UpdateRepository
+from app.repositories.usage_repository import UsageRepository
 from app.repositories.user_repository import UserRepository
-from app.services.context import DependencyMiddleware
-from app.services.marzban import MarzbanService
+from app.services.broadcast import BroadcastEngine, broadcast_resume_loop
+from app.services.alerts import AlertAggregator, alert_digest_loop
+from app.services.bot_identity import BotIdentity
+from app.services.bulk import BulkOperationEngine, bulk_resume_loop
+from app.server import WebhookApp
+from app.services.context import (
+    CallbackAnswerMiddleware,
+    CallbackAnswerTracker,
+    DeadlineMiddleware,
+    DependencyMiddleware,
+    ReachabilityMiddleware,
+    ThrottlingMiddleware,
+    UpdateDedupMiddleware,
+)
+from app.services.fsm_storage import SQLiteStorage, fsm_flush_loop
+from app.services.node_monitor import NodeMonitor, node_monitor_loop
+from app.services.outbox import Outbox
+from app.services.panels import PanelRegistry
 from app.services.payments import PaymentService
-from app.services.payment_retry import payment_retry_loop
+from app.services.jobs import JobQueue
+from app.services.leader import LeaderElector
+from app.services.payment_jobs import PaymentJobs, payment_event_sweep_loop
+from app.services.reachability import ReachabilityTracker
 from app.services.referral import ReferralService
-from app.services.reminders import reminder_loop
+from app.services.referral_bonus import ReferralBonusApplier, referral_bonus_loop
+from app.services.reminders import ReminderScheduler
+from app.services.retry_policy import RetryPolicy
 from app.services.subscription import SubscriptionService
+from app.services.tariffs import TariffCatalog, tariff_reload_loop
+from app.services.update_executor import UpdateExecutor, UpdateExecutorMiddleware
+from app.services.usage import UsageCollector, usage_collector_loop
 
 logging.basicConfig(level=logging.INFO)
 
 
+@contextmanager
+def _timed(phase: str) -> Iterator[None]:
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        logging.info("%s took %.2fs", phase, time.monotonic() - started)
+
+
 async def main() -> None:
     settings = Settings()
     db = Database(settings.database_path)
-    await db.connect()
+    with _timed("Startup: database"):
+        await db.connect()
 
     user_repo = UserRepository(db)
     payment_repo = PaymentRepository(db)
     referral_repo = ReferralRepository(db)
+    usage_repo = UsageRepository(db)
+    job_repo = JobRepository(db)
+    tariff_catalog = TariffCatalog(settings, TariffRepository(db))
 
     bot = Bot(
         token=settings.telegram_token,
         default=DefaultBotProperties(parse_mode="HTML"),
     )
+    bot_identity = BotIdentity(bot, MetaRepository(db))
+    reachability = ReachabilityTracker(user_repo)
+    with _timed("Startup: caches"):
+        _, _, (bot_username, identity_cached) = await asyncio.gather(
+            tariff_catalog.load(),
+            reachability.load(),
+            bot_identity.load(),
+        )
 
-    async def notify_admins(message: str) -> None:
-        for admin_id in settings.telegram_admin_ids:
-            await bot.send_message(admin_id, message)
+    outbox = Outbox(bot, settings, OutboxRepository(db), reachability=reachability)
+    alerts = AlertAggregator(
+        outbox,
+        window=timedelta(seconds=settings.alert_dedup_window_seconds),
+        digest_interval_seconds=settings.alert_digest_interval_seconds,
+    )
+    leader = LeaderElector(
+        LeaseRepository(db),
+        lease_seconds=settings.leader_lease_seconds,
+        heartbeat_seconds=settings.leader_heartbeat_seconds,
+    )
 
-    marzban = MarzbanService(
-        settings.marzban_base_url,
-        settings.marzban_api_key,
-        notify_admin=notify_admins,
+    async def notify_admins_from_leader(text: str, key: str | None = None) -> None:
+        if leader.is_leader:
+            await alerts.notify(text, key)
+
+    panels = PanelRegistry(
+        settings.panel_settings(),
+        notify_admin=alerts.notify,
+        retry_policy=RetryPolicy(
+            max_attempts=settings.marzban_max_attempts,
+            base_delay=settings.marzban_backoff_base_seconds,
+            max_delay=settings.marzban_backoff_max_seconds,
+            timeout=settings.marzban_timeout_seconds,
+        ),
+        pool_size=settings.marzban_pool_size,
     )
-    payment_service = PaymentService(settings, payment_repo)
+    payment_service = PaymentService(settings, payment_repo, tariff_catalog=tariff_catalog)
     referral_service = ReferralService(settings, referral_repo, user_repo)
-    subscription_service = SubscriptionService(settings, user_repo, payment_repo, marzban)
-    dp = Dispatcher(storage=MemoryStorage())
+    node_monitor = NodeMonitor(settings, panels, notify_admin=notify_admins_from_leader)
+    subscription_service = SubscriptionService(
+        settings,
+        user_repo,
+        payment_repo,
+        panels,
+        node_monitor=node_monitor,
+        usage_repo=usage_repo,
+        referral_repo=referral_repo,
+        tariff_catalog=tariff_catalog,
+    )
+    referral_bonus_applier = ReferralBonusApplier(referral_repo, subscription_service)
+    usage_collector = UsageCollector(settings, usage_repo, user_repo, panels)
+    job_queue = JobQueue(
+        job_repo,
+        workers=settings.job_workers,
+        visibility_timeout=timedelta(seconds=settings.job_visibility_timeout_seconds),
+    )
+    payment_jobs = PaymentJobs(
+        outbox,
+        settings,
+        payment_repo,
+        subscription_service,
+        job_queue,
+        alerts=alerts,
+    )
+    bulk_engine = BulkOperationEngine(
+        bot,
+        settings,
+        BulkRepository(db),
+        user_repo,
+        subscription_service,
+        panels,
+    )
+    broadcast_engine = BroadcastEngine(
+        bot,
+        settings,
+        BroadcastRepository(db),
+        user_repo,
+        reachability=reachability,
+    )
+    fsm_storage = SQLiteStorage(
+        FSMRepository(db),
+        cache_seconds=settings.fsm_cache_seconds,
+        state_ttl=timedelta(seconds=settings.fsm_state_ttl_seconds),
+        write_through=settings.telegram_mode == "webhook",
+    )
+    dp = Dispatcher(storage=fsm_storage)
 
-    bot_info = await bot.get_me()
-    dp.message.middleware(DependencyMiddleware(
+    update_executor = UpdateExecutor(settings.update_workers, settings.update_queue_limit)
+    callback_answers = CallbackAnswerTracker()
+    bot.session.middleware(callback_answers)
+    early_answers = CallbackAnswerMiddleware(callback_answers, settings.callback_answer_budget_seconds)
+    dp.update.outer_middleware(UpdateDedupMiddleware(UpdateRepository(db)))
+    dp.update.outer_middleware(early_answers)
+    dp.update.outer_middleware(UpdateExecutorMiddleware(update_executor))
+    dp.update.outer_middleware(DeadlineMiddleware(settings.update_deadline_seconds))
+    dp.update.outer_middleware(ReachabilityMiddleware(reachability))
+    dp.callback_query.outer_middleware(early_answers)
+    throttling = ThrottlingMiddleware(settings)
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+    dependencies = DependencyMiddleware(
         payment_service=payment_service,
         subscription_service=subscription_service,
         referral_service=referral_service,
         user_repo=user_repo,
         payment_repo=payment_repo,
+        payment_jobs=payment_jobs,
+        tariff_catalog=tariff_catalog,
+        bulk_engine=bulk_engine,
+        broadcast_engine=broadcast_engine,
+        outbox=outbox,
         settings=settings,
-        bot_username=bot_info.username,
-    ))
-    dp.callback_query.middleware(DependencyMiddleware(
-        payment_service=payment_service,
-        subscription_service=subscription_service,
-        referral_service=referral_service,
-        user_repo=user_repo,
-        payment_repo=payment_repo,
-        settings=settings,
-        bot_username=bot_info.username,
-    ))
+        bot_username=bot_username,
+    )
+    dp.message.middleware(dependencies)
+    dp.callback_query.middleware(dependencies)
 
     dp.include_router(start.router)
     dp.include_router(purchase.router)
@@ -83,20 +215,135 @@ async def main() -> None:
     dp.include_router(help.router)
     dp.include_router(admin.router)
 
-    reminder_task = asyncio.create_task(reminder_loop(bot, user_repo))
-    retry_task = asyncio.create_task(
-        payment_retry_loop(bot, settings, payment_repo, subscription_service)
+    reminder_scheduler = ReminderScheduler(
+        bot,
+        user_repo,
+        concurrency=settings.reminder_concurrency,
+        reachability=reachability,
+        reload_interval=timedelta(seconds=settings.reminder_reload_interval_seconds),
+    )
+    user_repo.add_expiry_listener(reminder_scheduler.schedule)
+
+    async def refresh_identity() -> None:
+        try:
+            dependencies.deps["bot_username"] = await bot_identity.refresh()
+        except Exception:
+            logging.exception("Failed to refresh bot identity")
+
+    async def register_webhook() -> None:
+        if settings.telegram_mode == "webhook":
+            if not settings.telegram_webhook_url:
+                raise RuntimeError("TELEGRAM_WEBHOOK_URL is required in webhook mode")
+            await bot.set_webhook(
+                f"{settings.telegram_webhook_url.rstrip('/')}{settings.telegram_webhook_path}",
+                secret_token=settings.telegram_webhook_secret_token(),
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        else:
+            await bot.delete_webhook()
+
+    leader.singleton(lambda: bulk_resume_loop(bulk_engine, settings.leader_lease_seconds))
+    leader.singleton(lambda: broadcast_resume_loop(broadcast_engine, settings.leader_lease_seconds))
+    leader.singleton(reminder_scheduler.run)
+    leader.singleton(
+        lambda: payment_event_sweep_loop(payment_jobs, settings.payment_event_sweep_interval_seconds)
+    )
+    leader.singleton(
+        lambda: usage_collector_loop(
+            outbox,
+            usage_collector,
+            settings.usage_collect_interval_seconds,
+            reachability=reachability,
+        )
+    )
+    leader.singleton(
+        lambda: referral_bonus_loop(referral_bonus_applier, settings.referral_bonus_apply_interval_seconds)
     )
+
+    with _timed("Startup: recovery"):
+        await asyncio.gather(
+            payment_jobs.enqueue_recoverable(),
+            register_webhook(),
+        )
+    executor_task = asyncio.create_task(update_executor.run(settings.update_metrics_interval_seconds))
+    job_task = asyncio.create_task(job_queue.run())
+    outbox_task = asyncio.create_task(outbox.run())
+    background_tasks = [
+        asyncio.create_task(alert_digest_loop(alerts)),
+        asyncio.create_task(node_monitor_loop(node_monitor, settings.node_monitor_interval_seconds)),
+        asyncio.create_task(fsm_flush_loop(fsm_storage, settings.fsm_flush_interval_seconds)),
+        asyncio.create_task(leader.run()),
+        asyncio.create_task(tariff_reload_loop(tariff_catalog, settings.tariff_reload_interval_seconds)),
+    ]
+    if identity_cached:
+        background_tasks.append(asyncio.create_task(refresh_identity()))
+    webhook_app: WebhookApp | None = None
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if settings.telegram_mode == "webhook":
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                with suppress(NotImplementedError):
+                    loop.add_signal_handler(signum, stop.set)
+            webhook_app = WebhookApp(
+                payment_service,
+                payment_jobs,
+                settings.webhook_path,
+                dispatcher=dp,
+                bot=bot,
+                telegram_path=settings.telegram_webhook_path,
+                secret_token=settings.telegram_webhook_secret_token(),
+            )
+            await webhook_app.serve(settings.webhook_host, settings.webhook_port, stop)
+        else:
+            await dp.start_polling(
+                bot,
+                handle_as_tasks=False,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
     finally:
-        reminder_task.cancel()
-        retry_task.cancel()
-        with suppress(asyncio.CancelledError):
-            await reminder_task
-        with suppress(asyncio.CancelledError):
-            await retry_task
-        await marzban.close()
+        deadline = time.monotonic() + settings.shutdown_timeout_seconds
+
+        def remaining() -> float:
+            return max(deadline - time.monotonic(), 0.0)
+
+        with _timed("Shutdown: drain updates"):
+            left = await update_executor.drain(remaining())
+            if left:
+                logging.warning("Shutdown deadline hit with %s updates in flight", left)
+            executor_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await executor_task
+        if webhook_app:
+            with _timed("Shutdown: drain payment webhooks"):
+                left = await webhook_app.drain(remaining())
+                if left:
+                    logging.warning("Shutdown deadline hit with %s payment events in flight", left)
+        with _timed("Shutdown: drain jobs"):
+            left = await job_queue.drain(remaining())
+            if left:
+                logging.warning("Shutdown deadline hit with %s jobs in flight, releasing leases", left)
+            job_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await job_task
+        with _timed("Shutdown: background loops"):
+            for task in background_tasks:
+                task.cancel()
+            for task in background_tasks:
+                with suppress(asyncio.CancelledError):
+                    await task
+            await bulk_engine.shutdown()
+            await broadcast_engine.shutdown()
+        with _timed("Shutdown: drain outbox"):
+            await outbox.drain(remaining())
+            outbox_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await outbox_task
+        with _timed("Shutdown: close connections"):
+            await fsm_storage.flush()
+            await panels.close()
+            await bot.session.close()
+            await db.close()
 
 
 if __name__ == "__main__":